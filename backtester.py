@@ -1,111 +1,560 @@
-from datamodel import TradingState, Listing, OrderDepth, Trade, Observation, Order
+from datamodel import TradingState, Listing, OrderDepth, Trade, Observation, Order, ConversionObservation
 from collections import deque
-from typing import Dict, Deque
-import pandas as pd
-import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from heapq import heappush, heappop
+import copy
+import glob
+import os
+import pickle
+import re
+import sys
+from time import perf_counter_ns
+from replay import MarketReplay, SyntheticBook, SOUTH_SPREAD
+from profiling import Profiler, LatencyBudget
+from recorder import Recorder
+from logger import logger
+import statecodec
 from round_3.pairs import Trader
 
 STARFRUIT = "STARFRUIT"
 AMETHYSTS = "AMETHYSTS"
+ORCHIDS = "ORCHIDS"
 SEASHELLS = "SEASHELLS"
 CHOCOLATE = "CHOCOLATE"
 STRAWBERRIES = "STRAWBERRIES"
 ROSES = "ROSES"
 GIFT_BASKET = "GIFT_BASKET"
 
+DAY_LENGTH = 1000000
+# Products are discovered from the market data; trading a new product only
+# needs its position limit here or in MatchingEngine(position_limits=...)
+POSITION_LIMITS = {
+    AMETHYSTS: 20,
+    STARFRUIT: 20,
+    ORCHIDS: 100,
+    CHOCOLATE: 250,
+    STRAWBERRIES: 350,
+    ROSES: 60,
+    GIFT_BASKET: 60
+}
+# Cost per unit of a long converted-product position per tick
+STORAGE_FEE = 0.1
+# Longest traderData string the exchange accepts
+TRADER_DATA_LIMIT = 50000
+# Engine attributes left out of snapshots: the market data is read only and
+# shared, the profiler, recorder, latency budget and recycled orders belong
+# to the running process (see MatchingEngine.detach)
+SNAPSHOT_EXCLUDED = ("market", "profiler", "recorder", "latency", "order_pool")
+
 class DetailedOrder:
+    __slots__ = ("order", "trader_id", "order_id", "prev", "next")
+
     def __init__(self, order: Order, trader_id: str, order_id: int):
         self.order = order
         self.trader_id = trader_id
         self.order_id = order_id
+        self.prev: Optional[DetailedOrder] = None
+        self.next: Optional[DetailedOrder] = None
+
+    def __getstate__(self):
+        # Links are rebuilt by the Level, pickling them would recurse down the queue
+        return self.order, self.trader_id, self.order_id
+
+    def __setstate__(self, state):
+        self.order, self.trader_id, self.order_id = state
+        self.prev = self.next = None
+
+class Level:
+    # Orders resting at one price in time priority, linked through
+    # DetailedOrder.prev/next so any order can be unlinked in O(1)
+    __slots__ = ("head", "tail")
+
+    def __init__(self):
+        self.head: Optional[DetailedOrder] = None
+        self.tail: Optional[DetailedOrder] = None
+
+    def __bool__(self) -> bool:
+        return self.head is not None
+
+    def __iter__(self):
+        order = self.head
+        while order is not None:
+            next_order = order.next
+            yield order
+            order = next_order
+
+    def append(self, order: DetailedOrder):
+        order.prev = self.tail
+        order.next = None
+        if self.tail is None:
+            self.head = order
+        else:
+            self.tail.next = order
+        self.tail = order
+
+    def popleft(self) -> DetailedOrder:
+        order = self.head
+        self.head = order.next
+        if self.head is None:
+            self.tail = None
+        else:
+            self.head.prev = None
+        order.next = None
+        return order
+
+    def remove(self, order: DetailedOrder):
+        if order.prev is None:
+            self.head = order.next
+        else:
+            order.prev.next = order.next
+        if order.next is None:
+            self.tail = order.prev
+        else:
+            order.next.prev = order.prev
+        order.prev = order.next = None
+
+    def __getstate__(self):
+        return list(self)
+
+    def __setstate__(self, orders: List[DetailedOrder]):
+        self.head = self.tail = None
+        for order in orders:
+            self.append(order)
 
 class OrderBook:
     def __init__(self):
-        self.bids: Dict[int, Deque[DetailedOrder]] = {}
-        self.asks: Dict[int, Deque[DetailedOrder]] = {}
+        self.bids: Dict[int, Level] = {}
+        self.asks: Dict[int, Level] = {}
+        # Resting orders by order_id, for cancel and amend
+        self.orders: Dict[int, DetailedOrder] = {}
+        # Heaps of level prices (bids negated). Levels deleted from bids/asks
+        # are left in the heaps and skipped lazily when they reach the top.
+        self.bid_prices: List[int] = []
+        self.ask_prices: List[int] = []
+
+    def best_bid(self) -> Optional[int]:
+        heap = self.bid_prices
+        while heap and -heap[0] not in self.bids:
+            heappop(heap)
+        return -heap[0] if heap else None
+
+    def best_ask(self) -> Optional[int]:
+        heap = self.ask_prices
+        while heap and heap[0] not in self.asks:
+            heappop(heap)
+        return heap[0] if heap else None
+
+    def add_bid(self, price: int, order: DetailedOrder):
+        level = self.bids.get(price)
+        if level is None:
+            level = self.bids[price] = Level()
+            heappush(self.bid_prices, -price)
+        level.append(order)
+        self.orders[order.order_id] = order
+
+    def add_ask(self, price: int, order: DetailedOrder):
+        level = self.asks.get(price)
+        if level is None:
+            level = self.asks[price] = Level()
+            heappush(self.ask_prices, price)
+        level.append(order)
+        self.orders[order.order_id] = order
+
+    def cancel(self, order_id: int) -> Optional[DetailedOrder]:
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        levels = self.bids if order.order.quantity > 0 else self.asks
+        price = order.order.price
+        level = levels[price]
+        level.remove(order)
+        if not level:
+            del levels[price]
+        return order
+
+    def amend(self, order_id: int, quantity: int) -> Optional[DetailedOrder]:
+        # Shrinking an order keeps its place in the queue, growing it sends it
+        # to the back like a new order
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        if quantity == 0:
+            return self.cancel(order_id)
+        if quantity * order.order.quantity < 0:
+            raise ValueError(f"Amending order {order_id} cannot change its side")
+        if abs(quantity) > abs(order.order.quantity):
+            level = (self.bids if quantity > 0 else self.asks)[order.order.price]
+            level.remove(order)
+            level.append(order)
+        order.order.quantity = quantity
+        return order
+
+    def prune(self):
+        # Matching leaves emptied levels behind until the next clear
+        for levels in (self.bids, self.asks):
+            for price in [price for price, level in levels.items() if not level]:
+                del levels[price]
+
+    def clear(self, pool: List[DetailedOrder]):
+        for levels in (self.bids, self.asks):
+            for level in levels.values():
+                pool.extend(level)
+            levels.clear()
+        self.orders.clear()
+        self.bid_prices.clear()
+        self.ask_prices.clear()
 
 class MatchingEngine:
-    def __init__(self, trader, data, bot_trades, iterations):
-
-        self.state = TradingState(
-            "", 0, 
-            {STARFRUIT: Listing(STARFRUIT, STARFRUIT, SEASHELLS),
-             AMETHYSTS: Listing(AMETHYSTS, AMETHYSTS, SEASHELLS),
-             CHOCOLATE: Listing(CHOCOLATE, CHOCOLATE, SEASHELLS),
-             STRAWBERRIES: Listing(STRAWBERRIES, STRAWBERRIES, SEASHELLS),
-             ROSES: Listing(ROSES, ROSES, SEASHELLS),
-             GIFT_BASKET: Listing(GIFT_BASKET, GIFT_BASKET, SEASHELLS)},
-            {STARFRUIT: OrderDepth(), AMETHYSTS: OrderDepth(), CHOCOLATE: OrderDepth(),
-             STRAWBERRIES: OrderDepth(), ROSES: OrderDepth(), GIFT_BASKET: OrderDepth()},
-            {STARFRUIT: [], AMETHYSTS: [], CHOCOLATE: [], STRAWBERRIES: [], ROSES: [], GIFT_BASKET: []},
-            {STARFRUIT: [], AMETHYSTS: [], CHOCOLATE: [], STRAWBERRIES: [], ROSES: [], GIFT_BASKET: []},
-            {STARFRUIT: 0, AMETHYSTS: 0, CHOCOLATE: 0, STRAWBERRIES: 0, ROSES: 0, GIFT_BASKET: 0}, 
-            Observation({}, {})
-        )
+    def __init__(self, trader, market: MarketReplay, iterations, reuse_books: bool = True,
+                 profiler: Optional[Profiler] = None, storage_fee: float = STORAGE_FEE,
+                 position_limits: Optional[Dict[str, int]] = None, stateless: bool = False,
+                 trader_data_limit: int = TRADER_DATA_LIMIT, recorder: Optional[Recorder] = None,
+                 latency: Optional[LatencyBudget] = None, persistent_books: bool = False):
+        self.state = TradingState("", 0, {}, {}, {}, {}, {}, Observation({}, {}))
         self.trader = trader
-        self.order_books = {STARFRUIT: OrderBook(), AMETHYSTS: OrderBook(), CHOCOLATE: OrderBook(),
-             STRAWBERRIES: OrderBook(), ROSES: OrderBook(), GIFT_BASKET: OrderBook()}
+        # stateless runs every tick on a fresh copy of the trader as it was
+        # passed in, so only what round-trips through traderData survives,
+        # as on the exchange
+        self.stateless = stateless
+        # Traders with an encode_state attribute skip encoding traderData
+        # unless the engine reads it back (the fresh copy in stateless mode,
+        # the previous traderData after a timeout) or profiles its size. A
+        # trader swapped in by set_trader gets its predecessor's state
+        # through save_state.
+        self.encode_state = stateless or latency is not None or profiler is not None
+        trader.encode_state = self.encode_state
+        self.trader_template = copy.deepcopy(trader) if stateless else None
+        self.trader_data_limit = trader_data_limit
         self.order_count = 0
-        self.position_limits = {
-            AMETHYSTS: 20,
-            STARFRUIT: 20,
-            CHOCOLATE: 250,
-            STRAWBERRIES: 350,
-            ROSES: 60,
-            GIFT_BASKET: 60
-        }
+        self.position_limits = dict(POSITION_LIMITS if position_limits is None else position_limits)
+        # Products get dense ids in the order they are first seen. Engine state
+        # is kept in lists indexed by id; the TradingState dicts keyed by
+        # symbol hold the same depth and trade objects for the trader.
+        self.products: List[str] = []
+        self.product_ids: Dict[str, int] = {}
+        self.order_books: List[OrderBook] = []
+        self.order_depths: List[OrderDepth] = []
+        self.limits: List[int] = []
+        self.pnl: List[float] = []
+        self.bot_orders: List[List[Order]] = []
+        # Product index in the current MarketReplay -> product id
+        self.market_ids: List[int] = []
         self.timestamp = 0
-        self.data = data
-        self.bot_trades = bot_trades
-        self.pnl = {STARFRUIT: 0, AMETHYSTS: 0, CHOCOLATE: 0, STRAWBERRIES: 0, ROSES: 0, GIFT_BASKET: 0}
+        self.timestamp_offset = 0
+        self.settle_at_end = True
         self.num_timestamps = iterations * 100
+        # With reuse_books the books, depths and trade lists are cleared in place
+        # every tick and resting orders are recycled through order_pool. Turn it
+        # off for traders that keep references to state objects across ticks.
+        self.reuse_books = reuse_books
+        self.order_pool: List[DetailedOrder] = []
+        # With persistent_books the trader's orders rest across ticks in time
+        # priority until filled. Each tick's orders for a product replace the
+        # resting ones: a resubmitted order keeps its place in the queue (a
+        # smaller one is amended in place), anything not resubmitted is
+        # cancelled. Bot orders still only live for the tick.
+        self.persistent_books = persistent_books
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.limits["traderData"] = trader_data_limit
+        self.storage_fee = storage_fee
+        self.recorder = recorder
+        self.latency = latency
+        self.load_market(market)
+        if recorder is not None:
+            recorder.start_day(market.name, self.products, iterations)
+
+    def add_product(self, product: str) -> int:
+        product_id = self.product_ids.get(product)
+        if product_id is not None:
+            return product_id
+        if product not in self.position_limits:
+            raise ValueError(f"No position limit configured for {product}")
+        product_id = self.product_ids[product] = len(self.products)
+        self.products.append(product)
+        self.order_books.append(OrderBook())
+        self.order_depths.append(OrderDepth())
+        self.limits.append(self.position_limits[product])
+        self.pnl.append(0)
+        self.bot_orders.append([])
+        state = self.state
+        state.listings[product] = Listing(product, product, SEASHELLS)
+        state.order_depths[product] = self.order_depths[product_id]
+        state.market_trades[product] = []
+        state.own_trades[product] = []
+        state.position[product] = 0
+        return product_id
+
+    def load_market(self, market: MarketReplay):
+        self.market = market
+        self.market_ids = [self.add_product(product) for product in market.products]
+        # Product whose quotes rest as bot orders for the tick, see rest_quotes
+        self.resting_quotes = None
+        self.synthetic_book = None
+        observations = market.observations
+        if observations is not None:
+            product_id = self.add_product(observations.product)
+            if observations.synthetic_book is not None:
+                self.resting_quotes = product_id
+                self.synthetic_book = observations.synthetic_book
+
+    def snapshot(self) -> bytes:
+        # Books, depths, positions, pnl, traderData, the trader and the replay
+        # cursor, pickled in one go so shared references survive the round trip
+        state = {name: value for name, value in self.__dict__.items() if name not in SNAPSHOT_EXCLUDED}
+        return pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def restore(cls, snapshot: bytes, market: MarketReplay, trader=None,
+                profiler: Optional[Profiler] = None) -> "MatchingEngine":
+        # market must be the replay the snapshot was taken on
+        engine = cls.__new__(cls)
+        engine.__dict__.update(pickle.loads(snapshot))
+        engine.detach(market)
+        engine.profiler = profiler
+        if profiler is not None:
+            profiler.limits["traderData"] = engine.trader_data_limit
+        if trader is not None:
+            engine.set_trader(trader)
+        return engine
+
+    def detach(self, market: MarketReplay):
+        # Resets the SNAPSHOT_EXCLUDED attributes, for a copy of an engine
+        # (restored or forked) that must not share them with the original
+        self.market = market
+        self.profiler = None
+        self.recorder = None
+        self.latency = None
+        self.order_pool = []
+
+    def set_trader(self, trader):
+        # The new trader starts from the current traderData, like an
+        # algorithm swapped in mid-day on the exchange
+        save_state = getattr(self.trader, "save_state", None)
+        if not self.encode_state and save_state is not None:
+            self.state.traderData = save_state()
+        self.trader = trader
+        self.encode_state = self.stateless or self.latency is not None or self.profiler is not None
+        trader.encode_state = self.encode_state
+        self.trader_template = copy.deepcopy(trader) if self.stateless else None
 
     def run_iteration(self):
-        self.get_bot_quotes()
-        self.run_algo()
-        self.get_bot_trades()
-        self.update_pnl()
+        self.state.timestamp = self.timestamp_offset + self.timestamp
+        profiler = self.profiler
+        if profiler is None:
+            self.get_bot_quotes()
+            self.run_algo()
+            self.get_bot_trades()
+            self.update_pnl()
+        else:
+            profiler.ticks += 1
+            start = perf_counter_ns()
+            self.get_bot_quotes()
+            quoted = perf_counter_ns()
+            self.run_algo()
+            traded = perf_counter_ns()
+            self.get_bot_trades()
+            matched = perf_counter_ns()
+            self.update_pnl()
+            end = perf_counter_ns()
+            profiler.record(("get_bot_quotes",), quoted - start)
+            profiler.record(("run_algo",), traded - quoted)
+            profiler.record(("get_bot_trades",), matched - traded)
+            profiler.record(("update_pnl",), end - matched)
 
         if self.timestamp == self.num_timestamps - 100:
+            if self.recorder is not None:
+                self.recorder.end_day()
+            if not self.settle_at_end:
+                return self.mark_to_market()
             self.settle_position()
-            return self.pnl
-        # Clear Order Books
-        self.order_books = {STARFRUIT: OrderBook(), AMETHYSTS: OrderBook(), CHOCOLATE: OrderBook(),
-             STRAWBERRIES: OrderBook(), ROSES: OrderBook(), GIFT_BASKET: OrderBook()}
-        self.state.order_depths = {STARFRUIT: OrderDepth(), AMETHYSTS: OrderDepth(), CHOCOLATE: OrderDepth(),
-             STRAWBERRIES: OrderDepth(), ROSES: OrderDepth(), GIFT_BASKET: OrderDepth()}
+            return self.product_pnl()
+        if profiler is None:
+            self.clear_books()
+        else:
+            start = perf_counter_ns()
+            self.clear_books()
+            profiler.record(("clear_books",), perf_counter_ns() - start)
         self.timestamp += 100
 
-    def match_orders(self, orders: Dict, algo: bool):
+    def load_day(self, market: MarketReplay, iterations, timestamp_offset: int):
+        # Positions, pnl and the trader carry over, only the market is replaced
+        self.clear_books()
+        if self.persistent_books:
+            # Resting orders do not survive the night
+            for book in self.order_books:
+                book.clear(self.order_pool if self.reuse_books else [])
+        self.clear_trades()
+        self.state.observations.conversionObservations.clear()
+        self.load_market(market)
+        self.num_timestamps = iterations * 100
+        self.timestamp = 0
+        self.timestamp_offset = timestamp_offset
+        if self.recorder is not None:
+            self.recorder.start_day(market.name, self.products, iterations)
+
+    def clear_books(self):
+        if self.persistent_books:
+            self.cancel_bot_orders()
+        elif self.reuse_books:
+            for book in self.order_books:
+                book.clear(self.order_pool)
+        else:
+            self.order_books = [OrderBook() for _ in self.products]
+        if not self.reuse_books:
+            self.order_depths = [OrderDepth() for _ in self.products]
+            self.state.order_depths = dict(zip(self.products, self.order_depths))
+            return
+        for order_depth in self.order_depths:
+            order_depth.buy_orders.clear()
+            order_depth.sell_orders.clear()
+
+    def cancel_bot_orders(self):
+        for product_id, book in enumerate(self.order_books):
+            for order in [order for order in book.orders.values() if order.trader_id != "SUBMISSION"]:
+                self.cancel_order(product_id, order.order_id)
+            book.prune()
+
+    def cancel_order(self, product_id: int, order_id: int) -> bool:
+        order = self.order_books[product_id].cancel(order_id)
+        if order is None:
+            return False
+        self.remove_depth(product_id, order.order.price, order.order.quantity)
+        if self.reuse_books:
+            self.order_pool.append(order)
+        return True
+
+    def amend_order(self, product_id: int, order_id: int, quantity: int) -> bool:
+        book = self.order_books[product_id]
+        order = book.orders.get(order_id)
+        if order is None:
+            return False
+        if quantity == 0:
+            return self.cancel_order(product_id, order_id)
+        self.remove_depth(product_id, order.order.price, order.order.quantity - quantity)
+        book.amend(order_id, quantity)
+        return True
+
+    def remove_depth(self, product_id: int, price: int, quantity: int):
+        # Takes a resting order's volume out of the depth the trader sees
+        order_depth = self.order_depths[product_id]
+        levels = order_depth.buy_orders if quantity > 0 else order_depth.sell_orders
+        if price not in levels:
+            return
+        volume = levels[price] - quantity
+        if volume:
+            levels[price] = volume
+        else:
+            del levels[price]
+
+    def add_resting_depth(self):
+        # Persistent books: resting orders show in the depth next to the bot quotes
+        for book, order_depth in zip(self.order_books, self.order_depths):
+            for order in book.orders.values():
+                levels = order_depth.buy_orders if order.order.quantity > 0 else order_depth.sell_orders
+                price = order.order.price
+                levels[price] = levels.get(price, 0) + order.order.quantity
+
+    def requote(self, product_id: int, orders: List[Order]) -> List[Order]:
+        # Persistent books: keeps the resting orders that orders asks for
+        # again, oldest first, amends or cancels the rest and returns what is
+        # left to submit. A kept order counts as sent again this tick, so a new
+        # order that crosses it trades with it as without persistent books.
+        book = self.order_books[product_id]
+        wanted: Dict[Tuple[int, bool], int] = {}
+        for order in orders:
+            key = (order.price, order.quantity > 0)
+            wanted[key] = wanted.get(key, 0) + order.quantity
+        for order in [order for order in book.orders.values() if order.trader_id == "SUBMISSION"]:
+            key = (order.order.price, order.order.quantity > 0)
+            keep = wanted.get(key, 0)
+            quantity = order.order.quantity
+            if abs(keep) >= abs(quantity):
+                wanted[key] = keep - quantity
+            elif keep:
+                self.amend_order(product_id, order.order_id, keep)
+                wanted[key] = 0
+            else:
+                self.cancel_order(product_id, order.order_id)
+        new_orders = []
+        for order in orders:
+            key = (order.price, order.quantity > 0)
+            left = wanted.get(key, 0)
+            if not left:
+                continue
+            quantity = left if abs(left) <= abs(order.quantity) else order.quantity
+            wanted[key] = left - quantity
+            new_orders.append(order if quantity == order.quantity else Order(order.symbol, order.price, quantity))
+        return new_orders
+
+    def clear_trades(self):
+        if not self.reuse_books:
+            self.state.market_trades = {product: [] for product in self.products}
+            self.state.own_trades = {product: [] for product in self.products}
+            return
+        for trades in self.state.market_trades.values():
+            trades.clear()
+        for trades in self.state.own_trades.values():
+            trades.clear()
+
+    def new_order(self, product: str, price: int, quantity: int, trader_id: str) -> DetailedOrder:
+        self.order_count += 1
+        if not self.order_pool:
+            return DetailedOrder(Order(product, price, quantity), trader_id, self.order_count)
+        detailed_order = self.order_pool.pop()
+        order = detailed_order.order
+        order.symbol = product
+        order.price = price
+        order.quantity = quantity
+        detailed_order.trader_id = trader_id
+        detailed_order.order_id = self.order_count
+        return detailed_order
+
+    def match_orders(self, orders: List[Tuple[int, List[Order]]], algo: bool):
         trader_id = "SUBMISSION" if algo else ""
-        for product in orders.keys():
-            bids = self.order_books[product].bids
-            asks = self.order_books[product].asks
-            simple_bids = self.state.order_depths[product].buy_orders
-            simple_asks = self.state.order_depths[product].sell_orders
+        profiler = self.profiler
+        if profiler is not None:
+            phase = "run_algo" if algo else "get_bot_trades"
+            call_start = perf_counter_ns()
+        for product_id, product_orders in orders:
+            if profiler is not None:
+                start = perf_counter_ns()
+                fills = levels_swept = resting_orders = 0
+            product = self.products[product_id]
+            book = self.order_books[product_id]
+            bids = book.bids
+            asks = book.asks
+            resting = book.orders
+            simple_bids = self.order_depths[product_id].buy_orders
+            simple_asks = self.order_depths[product_id].sell_orders
             market_trades = []
             algo_trades = []
-            cur_orders = deque(orders[product])
+            cur_orders = deque(product_orders)
             while cur_orders:
                 order: Order = cur_orders.popleft()
                 self.order_count += 1
                 price = order.price
                 quantity = order.quantity
                 remainder = quantity
-                while remainder > 0 and asks and price >= min(asks.keys()):
-                    best_ask = min(asks.keys())
-                    if not asks[best_ask]:
+                while remainder > 0:
+                    best_ask = book.best_ask()
+                    if best_ask is None or price < best_ask:
+                        break
+                    level = asks[best_ask]
+                    if not level:
                         del asks[best_ask]
                         continue
-                    next_ask_order = asks[best_ask].popleft()
-                    if not next_ask_order:
-                        break
+                    next_ask_order = level.head
                     next_ask_quantity = next_ask_order.order.quantity
                     seller = next_ask_order.trader_id
                     fill_q = min(-next_ask_quantity, remainder)
                     if remainder < -next_ask_quantity:
                         next_ask_order.order.quantity += fill_q
-                        asks[best_ask].appendleft(next_ask_order)
+                    else:
+                        level.popleft()
+                        del resting[next_ask_order.order_id]
+                        if self.reuse_books:
+                            self.order_pool.append(next_ask_order)
 
                     remainder = remainder - fill_q
                     buyer = trader_id
@@ -123,29 +572,37 @@ class MatchingEngine:
                     if simple_asks[best_ask] == 0:
                         del asks[best_ask]
                         del simple_asks[best_ask]
+                    if profiler is not None:
+                        fills += 1
+                        levels_swept += best_ask not in asks
 
                 if remainder > 0:
                     simple_bids[price] = simple_bids.get(price, 0) + remainder
-                    self.order_count += 1
-                    new_order = DetailedOrder(Order(product, price, remainder), trader_id, self.order_count)
-                    if price in bids:
-                        bids[price].appendleft(new_order)
-                    else:
-                        bids[price] = deque([new_order])
+                    new_order = self.new_order(product, price, remainder, trader_id)
+                    book.add_bid(price, new_order)
                     remainder = 0
+                    if profiler is not None:
+                        resting_orders += 1
 
-                while remainder < 0 and bids and price <= max(bids.keys()):
-                    best_bid = max(bids.keys())
-                    if not bids[best_bid]:
+                while remainder < 0:
+                    best_bid = book.best_bid()
+                    if best_bid is None or price > best_bid:
+                        break
+                    level = bids[best_bid]
+                    if not level:
                         del bids[best_bid]
                         continue
-                    next_bid_order = bids[best_bid].popleft()
+                    next_bid_order = level.head
                     next_bid_quantity = next_bid_order.order.quantity
                     buyer = next_bid_order.trader_id
                     fill_q = min(next_bid_quantity, -remainder)
                     if -remainder < next_bid_quantity:
                         next_bid_order.order.quantity -= fill_q
-                        bids[best_bid].appendleft(next_bid_order)
+                    else:
+                        level.popleft()
+                        del resting[next_bid_order.order_id]
+                        if self.reuse_books:
+                            self.order_pool.append(next_bid_order)
 
                     remainder = remainder + fill_q
                     buyer = next_bid_order.trader_id
@@ -163,141 +620,326 @@ class MatchingEngine:
                     if simple_bids[best_bid] == 0:
                         del bids[best_bid]
                         del simple_bids[best_bid]
+                    if profiler is not None:
+                        fills += 1
+                        levels_swept += best_bid not in bids
 
                 if remainder < 0:
                     simple_asks[price] = simple_asks.get(price, 0) + remainder
-                    self.order_count += 1
-                    new_order = DetailedOrder(Order(product, price, remainder), trader_id, self.order_count)
-                    if price in asks:
-                        asks[price].appendleft(new_order)
-                    else:
-                        asks[price] = deque([new_order])
+                    new_order = self.new_order(product, price, remainder, trader_id)
+                    book.add_ask(price, new_order)
                     remainder = 0
+                    if profiler is not None:
+                        resting_orders += 1
             
             if algo:
-                self.state.own_trades[product] = algo_trades
+                self.state.own_trades[product][:] = algo_trades
             else:
-                self.state.market_trades[product] = market_trades
+                self.state.market_trades[product][:] = market_trades
                 self.state.own_trades[product] += algo_trades
 
+            if profiler is not None:
+                profiler.record((phase, "match_orders", product), perf_counter_ns() - start)
+                profiler.count("fills", product, fills)
+                profiler.count("levels_swept", product, levels_swept)
+                profiler.count("resting_orders", product, resting_orders)
+        if profiler is not None:
+            profiler.record((phase, "match_orders"), perf_counter_ns() - call_start)
+
     def run_algo(self):
-        for product in self.state.order_depths.keys():
-            bids = self.state.order_depths[product].buy_orders
-            asks = self.state.order_depths[product].sell_orders
-            self.state.order_depths[product].buy_orders = dict(sorted(bids.items(), key=lambda x: x[0], reverse=True))
-            self.state.order_depths[product].sell_orders = dict(sorted(asks.items(), key=lambda x: x[0]))
-
-        result, conversions, traderData = self.trader.run(self.state)
-        for product in result.keys():
+        for order_depth in self.order_depths:
+            sort_levels(order_depth.buy_orders, reverse=True)
+            sort_levels(order_depth.sell_orders, reverse=False)
+
+        logger.tick(self.state.timestamp)
+        if self.stateless:
+            self.trader = copy.deepcopy(self.trader_template)
+        if self.profiler is None and self.latency is None:
+            result, conversions, traderData = self.trader.run(self.state)
+        else:
+            # The codec times encode/decode into this engine's profiler only
+            # while its own trader runs, so engines sharing a process keep
+            # their timings apart
+            codec_profiler = statecodec.active_profiler
+            statecodec.active_profiler = self.profiler
+            start = perf_counter_ns()
+            try:
+                result, conversions, traderData = self.trader.run(self.state)
+            finally:
+                statecodec.active_profiler = codec_profiler
+            elapsed = perf_counter_ns() - start
+            if self.profiler is not None:
+                self.profiler.record(("run_algo", "Trader.run"), elapsed)
+            if self.latency is not None and self.latency.record(self.state.timestamp, elapsed):
+                # Timed out: the exchange keeps the previous traderData and sends nothing
+                result, conversions, traderData = {}, None, self.state.traderData
+        traderData = traderData or ""
+        if len(traderData) > self.trader_data_limit:
+            raise ValueError(f"traderData is {len(traderData)} characters, over the {self.trader_data_limit} limit")
+        if self.profiler is not None:
+            self.profiler.size("traderData", len(traderData))
+        self.state.traderData = traderData
+        self.convert(conversions)
+        product_ids = self.product_ids
+        position = self.state.position
+        orders = []
+        for product, product_orders in result.items():
+            product_id = product_ids.get(product)
+            if product_id is None:
+                # Not traded in this replay
+                continue
             total_buy_q = 0
             total_ask_q = 0
             valid_bids = []
             valid_asks = []
-            for order in result[product]:
+            for order in product_orders:
                 if order.quantity > 0:
                     total_buy_q += order.quantity
                     valid_bids.append(order)
                 elif order.quantity < 0:
                     total_ask_q += order.quantity
                     valid_asks.append(order)
-                
-            if total_buy_q + self.state.position.get(product, 0) > self.position_limits[product]:
+
+            limit = self.limits[product_id]
+            if total_buy_q + position[product] > limit:
                 valid_bids = []
-            if total_ask_q + self.state.position.get(product, 0) < -self.position_limits[product]:
+            if total_ask_q + position[product] < -limit:
                 valid_asks = []
 
-            result[product] = valid_bids + valid_asks
+            orders.append((product_id, valid_bids + valid_asks))
+        if self.persistent_books:
+            requoted = {product_id for product_id, _ in orders}
+            orders = [(product_id, self.requote(product_id, product_orders)) for product_id, product_orders in orders]
+            for product_id, book in enumerate(self.order_books):
+                if product_id not in requoted and book.orders:
+                    self.requote(product_id, [])
         # Clear Trade History
-        self.state.market_trades = {STARFRUIT: [], AMETHYSTS: [], CHOCOLATE: [], STRAWBERRIES: [], ROSES: [], GIFT_BASKET: []}
-        self.state.own_trades = {STARFRUIT: [], AMETHYSTS: [], CHOCOLATE: [], STRAWBERRIES: [], ROSES: [], GIFT_BASKET: []}
-        self.match_orders(result, algo=True)
+        self.clear_trades()
+        self.match_orders(orders, algo=True)
 
     def get_bot_quotes(self):
-        quotes = self.data[self.data["timestamp"] == self.timestamp]
-        for i in range(len(quotes)):
-            row = quotes.iloc[i]
-            product = row["product"]
-            bids = [(row["bid_price_1"], row["bid_volume_1"]), (row["bid_price_2"], row["bid_volume_2"]), (row["bid_price_3"], row["bid_volume_3"])]
-            asks = [(row["ask_price_1"], row["ask_volume_1"]), (row["ask_price_2"], row["ask_volume_2"]), (row["ask_price_3"], row["ask_volume_3"])]
-            buy_order_depth = {}
-            sell_order_depth = {}
-            for bid in bids:
-                price, quantity = bid
+        market_ids = self.market_ids
+        profiler = self.profiler
+        for product_id, bid_prices, bid_volumes, ask_prices, ask_volumes in self.market.quotes(self.timestamp):
+            if profiler is not None:
+                start = perf_counter_ns()
+            product_id = market_ids[product_id]
+            order_depth = self.order_depths[product_id]
+            buy_order_depth = order_depth.buy_orders
+            sell_order_depth = order_depth.sell_orders
+            buy_order_depth.clear()
+            sell_order_depth.clear()
+            for price, quantity in zip(bid_prices, bid_volumes):
                 if price > 0:
+                    # Bot quotes only populate the order depth, they never rest
+                    # in the order book (except on a synthetic book, see rest_quotes)
                     self.order_count += 1
-                    order = DetailedOrder(Order(product, price, quantity), "", self.order_count)
-                    self.order_books[product].bids.get(price, deque([])).append(order)
                     buy_order_depth[price] = buy_order_depth.get(price, 0) + quantity
-            for ask in asks:
-                price, quantity = ask
+            for price, quantity in zip(ask_prices, ask_volumes):
                 if price > 0:
                     self.order_count += 1
-                    order = DetailedOrder(Order(product, price, -quantity), "", self.order_count)
-                    self.order_books[product].asks.get(price, deque([])).append(order)
                     sell_order_depth[price] = sell_order_depth.get(price, 0) - quantity
-
-            self.state.order_depths[product].buy_orders = buy_order_depth
-            self.state.order_depths[product].sell_orders = sell_order_depth
+            if product_id == self.resting_quotes:
+                self.rest_quotes(product_id)
+            if profiler is not None:
+                profiler.record(("get_bot_quotes", self.products[product_id]), perf_counter_ns() - start)
+
+        if self.persistent_books:
+            self.add_resting_depth()
+
+        observations = self.market.observations
+        if observations is not None:
+            row = observations.row(self.timestamp)
+            if row is not None:
+                self.state.observations.conversionObservations[observations.product] = ConversionObservation(*row)
+
+    def rest_quotes(self, product_id: int):
+        # A synthetic local book has no bot trades to fill against, so its
+        # quotes rest as bot orders for the tick and the trader's orders fill
+        # against them up to the quoted volume. They are dropped with the
+        # other bot orders when the tick ends.
+        product = self.products[product_id]
+        book = self.order_books[product_id]
+        order_depth = self.order_depths[product_id]
+        for price, volume in order_depth.buy_orders.items():
+            book.add_bid(price, self.new_order(product, price, volume, ""))
+        for price, volume in order_depth.sell_orders.items():
+            book.add_ask(price, self.new_order(product, price, volume, ""))
+
+    def convert(self, conversions):
+        # Conversions close (part of) the position with the south market at
+        # the observed prices plus fees and tariffs; requests that would not
+        # reduce the position are ignored, like on the exchange. Long
+        # positions in the product pay storage every tick.
+        observations = self.market.observations
+        if observations is None:
+            return
+        product = observations.product
+        observation = self.state.observations.conversionObservations.get(product)
+        if observation is None:
+            return
+        position = self.state.position[product]
+        if conversions and conversions * position < 0 and abs(conversions) <= abs(position):
+            if conversions > 0:
+                price = observation.askPrice + observation.transportFees + observation.importTariff
+            else:
+                price = observation.bidPrice - observation.transportFees - observation.exportTariff
+            self.pnl[self.product_ids[product]] -= conversions * price
+            position += conversions
+            self.state.position[product] = position
+        if position > 0:
+            self.pnl[self.product_ids[product]] -= self.storage_fee * position
 
     def get_bot_trades(self):
-        bot_orders = {STARFRUIT: [], AMETHYSTS: [], CHOCOLATE: [], STRAWBERRIES: [], ROSES: [], GIFT_BASKET: []}
-        trades = self.bot_trades[self.bot_trades["timestamp"] == self.timestamp]
-        for i in range(len(trades)):
-            trade = trades.iloc[i]
-            product = trade["symbol"]
-            price = trade["price"]
-            quantity = trade["quantity"]
-
-            available_bids = self.order_books[product].bids.keys()
-            available_asks = self.order_books[product].asks.keys()
+        if self.reuse_books:
+            bot_orders = self.bot_orders
+            for product_orders in bot_orders:
+                product_orders.clear()
+        else:
+            bot_orders = [[] for _ in self.products]
+        market_ids = self.market_ids
+        for product_id, price, quantity in self.market.trades(self.timestamp):
+            product_id = market_ids[product_id]
+            product = self.products[product_id]
+            book = self.order_books[product_id]
 
             buy_order = Order(product, price, quantity)
             sell_order = Order(product, price, -quantity)
 
-            if price in available_bids:
-                bot_orders[product].append(sell_order)
-            elif price in available_asks:
-                bot_orders[product].append(buy_order)
+            if price in book.bids:
+                bot_orders[product_id].append(sell_order)
+            elif price in book.asks:
+                bot_orders[product_id].append(buy_order)
             else:
-                bot_orders[product].append(sell_order)
-                bot_orders[product].append(buy_order)
-                
-        self.match_orders(bot_orders, algo=False)
+                bot_orders[product_id].append(sell_order)
+                bot_orders[product_id].append(buy_order)
+
+        self.match_orders([(product_id, orders) for product_id, orders in enumerate(bot_orders) if orders], algo=False)
 
     def update_pnl(self):
         trades = self.state.own_trades
-        for product in trades.keys():
+        pnl = self.pnl
+        for product_id, product in enumerate(self.products):
             for trade in trades[product]:
-                self.pnl[product] += (trade.price * trade.quantity) if trade.seller else (trade.price * -trade.quantity)
+                pnl[product_id] += (trade.price * trade.quantity) if trade.seller else (trade.price * -trade.quantity)
+        if self.recorder is not None:
+            self.recorder.record(self)
 
-            best_bid = max(self.state.order_depths[product].buy_orders.keys()) if self.state.order_depths[product].buy_orders else 0
-            best_ask = min(self.state.order_depths[product].sell_orders.keys()) if self.state.order_depths[product].sell_orders else 0
-            position = self.state.position[product]
-            cur_profit = self.pnl[product] + (position * best_bid) if position >= 0 else self.pnl[product] + (position * best_ask)
-            # print(f"{product} Profit/Loss: {cur_profit}")
+    def position_value(self, product_id: int):
+        # Value of the current position if it were closed at the touch
+        order_depth = self.order_depths[product_id]
+        best_bid = max(order_depth.buy_orders.keys()) if order_depth.buy_orders else 0
+        best_ask = min(order_depth.sell_orders.keys()) if order_depth.sell_orders else 0
+        position = self.state.position[self.products[product_id]]
+        return position * best_bid if position >= 0 else position * best_ask
+
+    def product_pnl(self) -> Dict[str, float]:
+        return dict(zip(self.products, self.pnl))
+
+    def mark_to_market(self):
+        return {product: self.pnl[product_id] + self.position_value(product_id)
+                for product_id, product in enumerate(self.products)}
 
     def settle_position(self):
         total_pnl = 0
-        for product in self.pnl:
-            best_bid = max(self.state.order_depths[product].buy_orders.keys()) if self.state.order_depths[product].buy_orders else 0
-            best_ask = min(self.state.order_depths[product].sell_orders.keys()) if self.state.order_depths[product].sell_orders else 0
-            position = self.state.position[product]
-            self.pnl[product] += position * best_bid if position >= 0 else position * best_ask
-            total_pnl += self.pnl[product]
-            print(f"{product} Profit/Loss: {self.pnl[product]}")
+        for product_id, product in enumerate(self.products):
+            self.pnl[product_id] += self.position_value(product_id)
+            total_pnl += self.pnl[product_id]
+            print(f"{product} Profit/Loss: {self.pnl[product_id]}{self.simulated_note(product_id)}")
         print(f"Total Profit/Loss: {total_pnl}")
 
-        
+    def simulated_note(self, product_id: int) -> str:
+        # Marks PnL made against a synthetic local book rather than recorded quotes
+        if product_id != self.resting_quotes:
+            return ""
+        return f" (simulated on {self.synthetic_book})"
+
+
+def sort_levels(levels: Dict[int, int], reverse: bool):
+    items = sorted(levels.items(), reverse=reverse)
+    levels.clear()
+    levels.update(items)
 
-def backtest(iterations, trader, data, bot_trades):
-    data = pd.read_csv(data, delimiter=';')
-    bot_trades = pd.read_csv(bot_trades, delimiter=";")
-    engine = MatchingEngine(trader, data, bot_trades, iterations)
+
+def backtest(iterations, trader, data, bot_trades, log_file=None, observations_file=None,
+             synthetic_book: Optional[SyntheticBook] = None, south_spread: float = SOUTH_SPREAD, **engine_kwargs):
+    logger.use_log_file(log_file)
+    market = MarketReplay.from_csv(data, bot_trades, observations_file=observations_file, synthetic_book=synthetic_book,
+                                   south_spread=south_spread)
+    engine = MatchingEngine(trader, market, iterations, **engine_kwargs)
     for _ in range(iterations):
         profit = engine.run_iteration()
-        
+    if engine.latency is not None:
+        print(engine.latency.summary())
+    logger.flush(log_file)
     return profit
 
+
+def trades_file(prices_file: str) -> str:
+    directory, name = os.path.split(prices_file)
+    return os.path.join(directory, name.replace("prices_", "trades_", 1).replace(".csv", "_nn.csv"))
+
+
+def day_key(prices_file: str) -> Tuple[int, int]:
+    match = re.search(r"round_(-?\d+)_day_(-?\d+)", os.path.basename(prices_file))
+    return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+
+def day_files(patterns: Union[str, Sequence[str]]) -> List[Tuple[str, str]]:
+    # Expand prices file globs into (prices, trades) pairs in round/day order
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    prices_files = sorted({path for pattern in patterns for path in glob.glob(pattern)}, key=day_key)
+    return [(prices_file, trades_file(prices_file)) for prices_file in prices_files]
+
+
+def load_csv_day(day: Tuple[str, str]) -> MarketReplay:
+    return MarketReplay.from_csv(*day)
+
+
+def backtest_days(trader, days: Sequence, iterations=None, load=load_csv_day, log_file=None, **engine_kwargs):
+    # Replays the days back to back through one engine. Only the current
+    # day's market data is held in memory; load turns an entry of days into
+    # its MarketReplay when the day is reached. Each day starts DAY_LENGTH
+    # after the previous one, or later if that day ran longer (synthetic
+    # days can have millions of ticks), so timestamps never overlap.
+    logger.use_log_file(log_file)
+    engine = None
+    previous = {}
+    day_pnl = []
+    timestamp_offset = 0
+    for i, day in enumerate(days):
+        market = load(day)
+        name = market.name
+        day_iterations = iterations or len(market)
+        if engine is None:
+            engine = MatchingEngine(trader, market, day_iterations, **engine_kwargs)
+        else:
+            engine.load_day(market, day_iterations, timestamp_offset)
+        del market
+        engine.settle_at_end = i == len(days) - 1
+        for _ in range(day_iterations):
+            profit = engine.run_iteration()
+        engine.market = None
+        timestamp_offset += max(DAY_LENGTH, day_iterations * 100)
+
+        pnl = {product: value - previous.get(product, 0) for product, value in profit.items()}
+        previous = dict(profit)
+        day_pnl.append(pnl)
+        print(f"{name} Profit/Loss: {sum(pnl.values())} (cumulative {sum(previous.values())})")
+        if engine.resting_quotes is not None:
+            product = engine.products[engine.resting_quotes]
+            print(f"{name} {product} Profit/Loss: {pnl[product]}{engine.simulated_note(engine.resting_quotes)}")
+
+    if engine is not None and engine.latency is not None:
+        print(engine.latency.summary())
+    logger.flush(log_file)
+    return day_pnl
+
+
 if __name__ == "__main__":
     trader = Trader()
-    backtest(10000, trader, "round_3/round-3-island-data-bottle/prices_round_3_day_2.csv", "round_3/round-3-island-data-bottle/trades_round_3_day_2_nn.csv")
+    if len(sys.argv) > 1:
+        backtest_days(trader, day_files(sys.argv[1:]))
+    else:
+        backtest(10000, trader, "round_3/round-3-island-data-bottle/prices_round_3_day_2.csv", "round_3/round-3-island-data-bottle/trades_round_3_day_2_nn.csv")
@@ -0,0 +1,308 @@
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter_ns
+from typing import Dict, List, Optional
+import argparse
+import gc
+import glob
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import numpy as np
+from backtester import MatchingEngine, POSITION_LIMITS, day_files
+from datamodel import Order, TradingState
+from logger import logger, OFF
+from profiling import Profiler
+from replay import MarketReplay, SyntheticBook
+
+# Fixed scenarios over the bundled island data, for comparing the engine and
+# the traders before and after a change:
+#   - each round's trader on each of its days
+#   - a matching-heavy run where a ladder trader crosses its own orders
+#   - parsing the CSVs, uncached and from the .npy cache
+# Every scenario runs in a freshly spawned process, so peak RSS is its own
+# and no scenario warms another's caches. Throughput comes from the fastest
+# of the timed repeats and Trader.run percentiles from the median over the
+# repeats; per-phase times come from one extra run with a Profiler attached.
+#
+#   python benchmark.py --save bench.json
+#   python benchmark.py --baseline bench.json    # exits 1 on regressions
+#
+# Times only compare between runs on the same machine.
+
+ROUND_1 = "round_1/round-1-island-data-bottle/prices_round_1_day_*.csv"
+ROUND_2 = "round_2/round-2-island-data-bottle/prices_round_2_day_*.csv"
+ROUND_3 = "round_3/round-3-island-data-bottle/prices_round_3_day_*.csv"
+LADDER_LEVELS = 10
+REPEAT = 5
+# Regression thresholds, as fractions. On a shared 1-CPU VM, 4 back-to-back
+# runs of the suite at REPEAT 5 differed by up to 53% on a single scenario's
+# time (35% in ticks/s, 33% in Trader.run p50) but by at most 6.2% on the
+# geometric mean of any metric over all scenarios, so the suite-wide check
+# is the tight one.
+THRESHOLD = 0.1
+SCENARIO_THRESHOLD = 0.6
+# Metric -> True when larger is better
+METRICS = {
+    "ticks_per_sec": True,
+    "rows_per_sec": True,
+    "seconds": False,
+    "trader_p50_us": False,
+    "trader_p99_us": False,
+    "peak_rss_mb": False,
+}
+# Metrics every scenario has, compared as a geometric mean over the suite
+SUITE_METRICS = ["seconds", "trader_p50_us", "trader_p99_us", "peak_rss_mb"]
+
+
+class LadderTrader:
+    # Quotes LADDER_LEVELS buy and sell orders around the mid of every
+    # product, with the two ladders overlapping so each tick matches orders
+    # across several levels. Volumes use the full position limit on each
+    # side, so the limit check never drops them.
+    def __init__(self, levels: int = LADDER_LEVELS):
+        self.levels = levels
+
+    def run(self, state: TradingState):
+        result = {}
+        for product, order_depth in state.order_depths.items():
+            if not order_depth.buy_orders or not order_depth.sell_orders:
+                continue
+            mid = (max(order_depth.buy_orders) + min(order_depth.sell_orders)) // 2
+            position = state.position.get(product, 0)
+            limit = POSITION_LIMITS[product]
+            buy = (limit - position) // self.levels
+            sell = (limit + position) // self.levels
+            orders = []
+            for level in range(self.levels):
+                if buy > 0:
+                    orders.append(Order(product, mid + 2 - level, buy))
+                if sell > 0:
+                    orders.append(Order(product, mid - 2 + level, -sell))
+            result[product] = orders
+        return result, None, ""
+
+
+class TimedTrader:
+    # Times every Trader.run call without touching the engine
+    def __init__(self, trader, samples: List[int]):
+        self.trader = trader
+        self.samples = samples
+
+    @property
+    def encode_state(self):
+        return getattr(self.trader, "encode_state", True)
+
+    @encode_state.setter
+    def encode_state(self, value):
+        self.trader.encode_state = value
+
+    def run(self, state: TradingState):
+        start = perf_counter_ns()
+        result = self.trader.run(state)
+        self.samples.append(perf_counter_ns() - start)
+        return result
+
+
+def scenarios() -> List[Dict]:
+    result = []
+    for prices, trades in day_files(ROUND_1):
+        result.append({"name": "round1/" + day_name(prices), "kind": "backtest", "trader": "round_1.round1",
+                       "prices": [prices], "trades": [trades]})
+    for prices in sorted(glob.glob(ROUND_2)):
+        result.append({"name": "orchids/" + day_name(prices), "kind": "backtest", "trader": "round_2.orchids",
+                       "prices": [], "trades": [], "observations": prices,
+                       "synthetic_book": {"spread": 4, "volume": 10}})
+    for prices, trades in day_files(ROUND_3):
+        result.append({"name": "pairs/" + day_name(prices), "kind": "backtest", "trader": "round_3.pairs",
+                       "prices": [prices], "trades": [trades]})
+    prices, trades = day_files(ROUND_3)[-1]
+    result.append({"name": "matching/ladder", "kind": "backtest", "trader": "benchmark:LadderTrader",
+                   "prices": [prices], "trades": [trades]})
+    days = day_files(ROUND_1) + day_files(ROUND_3)
+    for cache in (False, True):
+        result.append({"name": "parse/" + ("cache" if cache else "csv"), "kind": "parse", "cache": cache,
+                       "days": days, "observations": sorted(glob.glob(ROUND_2))})
+    return result
+
+
+def day_name(prices_file: str) -> str:
+    return os.path.basename(prices_file)[len("prices_"):-len(".csv")]
+
+
+def make_trader(name: str):
+    # "module" for its Trader class, or "module:Class"
+    module, _, cls = name.partition(":")
+    return getattr(importlib.import_module(module), cls or "Trader")()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backtest(scenario: Dict, repeat: int) -> Dict:
+    market = MarketReplay.from_csv(scenario["prices"], scenario["trades"],
+                                   observations_file=scenario.get("observations"),
+                                   synthetic_book=SyntheticBook(**scenario["synthetic_book"])
+                                   if "synthetic_book" in scenario else None)
+    iterations = len(market)
+    times = []
+    p50s = []
+    p99s = []
+    for _ in range(repeat):
+        samples = []
+        engine = MatchingEngine(TimedTrader(make_trader(scenario["trader"]), samples), market, iterations)
+        gc.collect()
+        start = perf_counter_ns()
+        for _ in range(iterations):
+            engine.run_iteration()
+        times.append(perf_counter_ns() - start)
+        latencies = np.array(samples, dtype=np.float64) / 1e3
+        p50s.append(np.percentile(latencies, 50))
+        p99s.append(np.percentile(latencies, 99))
+    best = min(times)
+
+    profiler = Profiler()
+    engine = MatchingEngine(make_trader(scenario["trader"]), market, iterations, profiler=profiler)
+    for _ in range(iterations):
+        engine.run_iteration()
+    phases = {path[0]: round(histogram.total / 1e6, 2)
+              for path, histogram in sorted(profiler.timings.items()) if len(path) == 1}
+
+    return {
+        "ticks": iterations,
+        "seconds": best / 1e9,
+        "ticks_per_sec": iterations / (best / 1e9),
+        "trader_p50_us": float(np.median(p50s)),
+        "trader_p99_us": float(np.median(p99s)),
+        "phases_ms": phases,
+    }
+
+
+def run_parse(scenario: Dict, repeat: int) -> Dict:
+    best = None
+    rows = 0
+    if scenario["cache"]:
+        # Build any missing cache files outside the timed runs
+        for prices, trades in scenario["days"]:
+            MarketReplay.from_csv(prices, trades)
+        for observations in scenario["observations"]:
+            MarketReplay.from_csv([], [], observations_file=observations)
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter_ns()
+        rows = 0
+        for prices, trades in scenario["days"]:
+            market = MarketReplay.from_csv(prices, trades, cache=scenario["cache"])
+            rows += len(market.quote_products) + len(market.trade_products)
+        for observations in scenario["observations"]:
+            market = MarketReplay.from_csv([], [], cache=scenario["cache"], observations_file=observations)
+            rows += len(market.observations)
+        elapsed = perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"rows": rows, "seconds": best / 1e9, "rows_per_sec": rows / (best / 1e9),
+            "phases_ms": {"parse": round(best / 1e6, 2)}}
+
+
+def run_scenario(scenario: Dict, repeat: int) -> Dict:
+    sys.stdout = open(os.devnull, "w")
+    logger.configure(level=OFF)
+    if scenario["kind"] == "parse":
+        result = run_parse(scenario, repeat)
+    else:
+        result = run_backtest(scenario, repeat)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def environment() -> Dict:
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def run_all(selected: Optional[List[str]] = None, repeat: int = REPEAT) -> Dict:
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for scenario in scenarios():
+        if selected and not any(name in scenario["name"] for name in selected):
+            continue
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            results[scenario["name"]] = pool.submit(run_scenario, scenario, repeat).result()
+        print(format_row(scenario["name"], results[scenario["name"]]), flush=True)
+    return {"environment": environment(), "repeat": repeat, "scenarios": results}
+
+
+def format_row(name: str, result: Dict) -> str:
+    if "ticks_per_sec" in result:
+        line = (f"{name:<28} {result['ticks_per_sec']:>10.0f} ticks/s {result['seconds']:>8.3f}s"
+                f"  run p50 {result['trader_p50_us']:>7.1f}us  p99 {result['trader_p99_us']:>7.1f}us")
+    else:
+        line = f"{name:<28} {result['rows_per_sec']:>10.0f} rows/s  {result['seconds']:>8.3f}s"
+    line += f"  rss {result['peak_rss_mb']:>6.1f}MB  "
+    return line + ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in result["phases_ms"].items())
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = THRESHOLD,
+            scenario_threshold: float = SCENARIO_THRESHOLD) -> List[str]:
+    # One line per metric that got worse by more than scenario_threshold in
+    # a scenario, or by more than threshold over the suite
+    regressions = []
+    ratios = {metric: [] for metric in SUITE_METRICS}
+    for name, result in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in result or not base.get(metric):
+                continue
+            change = result[metric] / base[metric] - 1
+            if metric in ratios:
+                ratios[metric].append(result[metric] / base[metric])
+            worse = -change if higher_is_better else change
+            if worse > scenario_threshold:
+                regressions.append(f"{name} {metric}: {base[metric]:.4g} -> {result[metric]:.4g} ({change:+.1%})")
+    for metric, values in ratios.items():
+        if not values:
+            continue
+        change = float(np.exp(np.mean(np.log(values)))) - 1
+        if change > threshold:
+            regressions.append(f"suite {metric} geometric mean over {len(values)} scenarios: {change:+.1%}")
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Backtester throughput and Trader latency benchmarks")
+    parser.add_argument("scenarios", nargs="*", help="only run scenarios whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="relative change over the whole suite that counts as a regression (default %(default)s)")
+    parser.add_argument("--scenario-threshold", type=float, default=SCENARIO_THRESHOLD,
+                        help="relative change in one scenario that counts as a regression (default %(default)s)")
+    args = parser.parse_args(argv)
+
+    current = run_all(args.scenarios, args.repeat)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != current["environment"]:
+        print("warning: baseline was recorded in a different environment, times may not compare")
+    regressions = compare(current, baseline, args.threshold, args.scenario_threshold)
+    for line in regressions:
+        print("REGRESSION " + line)
+    if not regressions:
+        print(f"no regressions beyond {args.threshold:.0%} over the suite or {args.scenario_threshold:.0%} in a scenario")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+from typing import Callable, Dict, List, Optional, Sequence
+import os
+import pickle
+import sys
+from backtester import MatchingEngine
+from replay import MarketReplay
+from report import format_table
+from sweep import grid_points
+
+# What-if branching from the middle of a day. The engine replays the shared
+# prefix once; each branch then continues from that point with its own
+# Trader. The new trader picks up the prefix state from traderData, so only
+# the parameters differ between branches.
+#
+# Branches run in forked children where os.fork exists: the engine is shared
+# copy-on-write and nothing is serialized on the way in. Elsewhere (or with
+# fork=False) the engine is snapshotted once and every branch restores from
+# that checkpoint in turn.
+
+
+def run_until(engine: MatchingEngine, timestamp: int):
+    # Runs the ticks before timestamp (day time, without the day offset)
+    while engine.timestamp < timestamp:
+        engine.run_iteration()
+
+
+def run_to_end(engine: MatchingEngine) -> Dict[str, float]:
+    profit = None
+    while profit is None:
+        profit = engine.run_iteration()
+    return profit
+
+
+def _result(params: Dict, pnl: Dict[str, float]) -> Dict:
+    return {"params": params, "pnl": pnl, "total": sum(pnl.values())}
+
+
+def _run_checkpoints(engine: MatchingEngine, trader_factory: Callable, points: List[Dict]) -> List[Dict]:
+    checkpoint = engine.snapshot()
+    results = []
+    for params in points:
+        branch = MatchingEngine.restore(checkpoint, engine.market, trader_factory(**params))
+        results.append(_result(params, run_to_end(branch)))
+    return results
+
+
+def _run_child(engine: MatchingEngine, trader_factory: Callable, params: Dict, write_fd: int):
+    status = 0
+    try:
+        sys.stdout = open(os.devnull, "w")
+        engine.detach(engine.market)
+        engine.set_trader(trader_factory(**params))
+        result = _result(params, run_to_end(engine))
+    except BaseException as e:
+        status = 1
+        result = e
+    with os.fdopen(write_fd, "wb") as f:
+        pickle.dump(result, f)
+    os._exit(status)
+
+
+def _run_forked(engine: MatchingEngine, trader_factory: Callable, points: List[Dict], max_workers: int) -> List[Dict]:
+    results = []
+    for start in range(0, len(points), max_workers):
+        children = []
+        for params in points[start:start + max_workers]:
+            read_fd, write_fd = os.pipe()
+            sys.stdout.flush()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                _run_child(engine, trader_factory, params, write_fd)
+            os.close(write_fd)
+            children.append((pid, read_fd))
+        for pid, read_fd in children:
+            with os.fdopen(read_fd, "rb") as f:
+                data = f.read()
+            os.waitpid(pid, 0)
+            if not data:
+                raise RuntimeError(f"Branch process {pid} exited without a result")
+            result = pickle.loads(data)
+            if isinstance(result, BaseException):
+                raise result
+            results.append(result)
+    return results
+
+
+def branch(engine: MatchingEngine, trader_factory: Callable, points: Sequence[Dict],
+           fork: Optional[bool] = None, max_workers: Optional[int] = None) -> List[Dict]:
+    # Runs one branch per parameter dict from the engine's current tick to
+    # the end of its day. The engine itself is left where it was.
+    points = list(points)
+    if fork is None:
+        fork = hasattr(os, "fork")
+    if fork:
+        results = _run_forked(engine, trader_factory, points, max_workers or os.cpu_count())
+    else:
+        results = _run_checkpoints(engine, trader_factory, points)
+    results.sort(key=lambda result: result["total"], reverse=True)
+    return results
+
+
+def format_results(results: List[Dict], top: Optional[int] = None) -> str:
+    if not results:
+        return ""
+    names = list(results[0]["params"])
+    products = list(results[0]["pnl"])
+    header = ["rank"] + names + products + ["total"]
+    rows = [[str(rank)] + [str(result["params"][name]) for name in names]
+            + [str(result["pnl"][product]) for product in products] + [str(result["total"])]
+            for rank, result in enumerate(results[:top], 1)]
+    return format_table(header, rows)
+
+
+if __name__ == "__main__":
+    from round_3.pairs import Trader
+    market = MarketReplay.from_csv("round_3/round-3-island-data-bottle/prices_round_3_day_2.csv",
+                                   "round_3/round-3-island-data-bottle/trades_round_3_day_2_nn.csv")
+    engine = MatchingEngine(Trader(), market, len(market))
+    run_until(engine, 700000)
+    grid = {"upper_spread": range(355, 556, 50), "lower_spread": range(205, 406, 50)}
+    print(format_results(branch(engine, Trader, grid_points(grid)), top=10))
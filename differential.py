@@ -0,0 +1,376 @@
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import sys
+import numpy as np
+from backtester import MatchingEngine, day_files
+from datamodel import Order, TradingState
+from logger import logger, OFF
+from replay import (MarketReplay, ObservationReplay, SyntheticBook, OBSERVATIONS_DTYPE, PRICES_DTYPE,
+                    TRADES_DTYPE, priced_rows, read_records)
+
+# Differential testing of alternative engines against the reference
+# MatchingEngine. The reference and every candidate run in lockstep on the
+# same market with their own copy of the trader; after each tick their own
+# trades, positions and PnL must be identical. The first difference stops
+# the run and is shrunk to a minimal reproducer: the ticks after the
+# divergence are cut, other products are dropped if the divergence survives
+# without them, and the remaining ticks are delta debugged away while it
+# still reproduces. Reproducers are saved as records plus a JSON
+# description and replay with --replay.
+#
+# Cases cover every Trader in the repo on every bundled day it can trade,
+# plus random order streams from RandomTrader on random synthetic markets.
+#
+#   python differential.py                         # everything, every candidate
+#   python differential.py --candidates no_reuse --random 100 --out repro
+#   python differential.py --replay repro
+
+# Candidate engines are factories with MatchingEngine's signature
+CANDIDATES: Dict[str, Callable] = {
+    "no_reuse": partial(MatchingEngine, reuse_books=False),
+    "stateless": partial(MatchingEngine, stateless=True),
+}
+ROUND_1 = "round_1/round-1-island-data-bottle/prices_round_1_day_*.csv"
+ROUND_2 = "round_2/round-2-island-data-bottle/prices_round_2_day_*.csv"
+ROUND_3 = "round_3/round-3-island-data-bottle/prices_round_3_day_*.csv"
+ROUND_1_TRADERS = ("round_1.round1", "round_1.round1_arima", "round_1.round1_dynamic")
+ALL_PRODUCT_TRADERS = ("round_2.round2", "round_3.round3")
+# Key of a reference failure in lockstep's result
+REFERENCE = "reference"
+# The engines are compared with each other, so any local book shape will do
+ORCHIDS_BOOK = SyntheticBook(spread=4, volume=10)
+RANDOM_PRODUCTS = ("CHOCOLATE", "STRAWBERRIES", "ROSES")
+RANDOM_TICKS = 300
+MAX_TESTS = 200
+
+
+class RandomTrader:
+    # Random orders around the quoted prices. The orders of a tick only
+    # depend on the seed and the timestamp, so dropping other ticks while
+    # minimizing does not change them.
+    def __init__(self, seed: int = 0, max_orders: int = 6):
+        self.seed = seed
+        self.max_orders = max_orders
+
+    def run(self, state: TradingState):
+        rnd = random.Random(self.seed * 1000003 + state.timestamp)
+        result = {}
+        for product, order_depth in sorted(state.order_depths.items()):
+            prices = list(order_depth.buy_orders) + list(order_depth.sell_orders)
+            if not prices:
+                continue
+            low, high = min(prices) - 2, max(prices) + 2
+            result[product] = [Order(product, rnd.randint(low, high), rnd.choice((-1, 1)) * rnd.randint(1, 10))
+                               for _ in range(rnd.randint(0, self.max_orders))]
+        return result, None, ""
+
+
+class Case:
+    # A market as records, so that it can be cut down and saved
+    def __init__(self, name: str, trader: str, prices: np.ndarray, trades: np.ndarray,
+                 observations: Optional[np.ndarray] = None, trader_args: Sequence = (),
+                 synthetic_book: Optional[SyntheticBook] = None):
+        self.name = name
+        self.trader = trader
+        self.trader_args = list(trader_args)
+        self.prices = prices
+        self.trades = trades
+        self.observations = observations
+        self.synthetic_book = synthetic_book
+
+    @classmethod
+    def from_csv(cls, name: str, trader: str, prices_files: Sequence[str], trades_files: Sequence[str],
+                 observations_file: Optional[str] = None, synthetic_book: Optional[SyntheticBook] = None) -> "Case":
+        prices = [read_records(path, PRICES_DTYPE) for path in prices_files]
+        trades = [read_records(path, TRADES_DTYPE) for path in trades_files]
+        observations = None
+        if observations_file is not None:
+            observations = np.array(read_records(observations_file, OBSERVATIONS_DTYPE))
+            if prices:
+                observations = observations[priced_rows(observations, prices)]
+            if synthetic_book is not None:
+                prices.append(ObservationReplay.from_records(observations).quote_records(synthetic_book))
+        prices = np.concatenate(prices) if prices else np.zeros(0, PRICES_DTYPE)
+        trades = np.concatenate(trades) if trades else np.zeros(0, TRADES_DTYPE)
+        return cls(name, trader, prices, trades, observations, synthetic_book=synthetic_book)
+
+    def timestamps(self) -> np.ndarray:
+        columns = [self.prices["timestamp"], self.trades["timestamp"]]
+        if self.observations is not None:
+            columns.append(self.observations["timestamp"])
+        return np.unique(np.concatenate(columns).astype(np.int64))
+
+    def products(self) -> List[str]:
+        return sorted({symbol.decode() for symbol in np.concatenate([self.prices["product"], self.trades["symbol"]])})
+
+    def market(self) -> MarketReplay:
+        observations = None
+        if self.observations is not None:
+            observations = ObservationReplay.from_records(self.observations, synthetic_book=self.synthetic_book)
+        return MarketReplay.from_records(self.prices, self.trades, self.name, observations)
+
+    def make_trader(self):
+        module, _, cls = self.trader.partition(":")
+        return getattr(importlib.import_module(module), cls or "Trader")(*self.trader_args)
+
+    def subset(self, ticks: np.ndarray, products: Optional[Sequence[str]] = None) -> "Case":
+        # Keeps the given timestamps, renumbered 0, 100, 200, ... in order
+        def keep(records: np.ndarray, product_field: Optional[str]) -> np.ndarray:
+            mask = np.isin(records["timestamp"], ticks)
+            if products is not None and product_field is not None:
+                mask &= np.isin(records[product_field], [product.encode() for product in products])
+            records = records[mask].copy()
+            records["timestamp"] = np.searchsorted(ticks, records["timestamp"]) * 100
+            return records
+
+        observations = None if self.observations is None else keep(self.observations, None)
+        return Case(self.name, self.trader, keep(self.prices, "product"), keep(self.trades, "symbol"),
+                    observations, self.trader_args, self.synthetic_book)
+
+    def save(self, directory: str, candidate: str, divergence: Dict):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "prices.npy"), self.prices)
+        np.save(os.path.join(directory, "trades.npy"), self.trades)
+        if self.observations is not None:
+            np.save(os.path.join(directory, "observations.npy"), self.observations)
+        with open(os.path.join(directory, "case.json"), "w") as f:
+            json.dump({"name": self.name, "trader": self.trader, "trader_args": self.trader_args,
+                       "synthetic_book": None if self.synthetic_book is None else vars(self.synthetic_book),
+                       "candidate": candidate, "divergence": divergence},
+                      f, indent=2, default=str)
+
+    @classmethod
+    def load(cls, directory: str) -> Tuple["Case", Dict]:
+        with open(os.path.join(directory, "case.json")) as f:
+            description = json.load(f)
+        observations_path = os.path.join(directory, "observations.npy")
+        observations = np.load(observations_path) if os.path.exists(observations_path) else None
+        case = cls(description["name"], description["trader"], np.load(os.path.join(directory, "prices.npy")),
+                   np.load(os.path.join(directory, "trades.npy")), observations, description["trader_args"],
+                   SyntheticBook(**description["synthetic_book"]) if description.get("synthetic_book") else None)
+        return case, description
+
+
+def random_case(seed: int, ticks: int = RANDOM_TICKS, products: Sequence[str] = RANDOM_PRODUCTS) -> Case:
+    # Random-walk quotes one to three levels deep and a few bot trades per
+    # tick near the touch, for RandomTrader
+    rng = np.random.default_rng(seed)
+    prices = np.zeros(ticks * len(products), PRICES_DTYPE)
+    trades = []
+    row = 0
+    mids = {product: 100 + 50 * i for i, product in enumerate(products)}
+    for tick in range(ticks):
+        for product in products:
+            mids[product] += int(rng.integers(-2, 3))
+            mid = mids[product]
+            record = prices[row]
+            record["timestamp"] = tick * 100
+            record["product"] = product
+            for side, sign in (("bid", -1), ("ask", 1)):
+                for level in range(1, int(rng.integers(1, 4)) + 1):
+                    record[f"{side}_price_{level}"] = mid + sign * (level + int(rng.integers(0, 2)))
+                    record[f"{side}_volume_{level}"] = int(rng.integers(1, 20))
+            record["mid_price"] = mid
+            row += 1
+            for _ in range(int(rng.integers(0, 4))):
+                trades.append((tick * 100, b"", b"", product.encode(), b"SEASHELLS",
+                               float(mid + int(rng.integers(-4, 5))), int(rng.integers(1, 10))))
+    return Case(f"random/{seed}", "differential:RandomTrader", prices, np.array(trades, TRADES_DTYPE),
+                trader_args=[seed])
+
+
+def bundled_cases() -> List[Case]:
+    cases = []
+    round_1 = day_files(ROUND_1)
+    round_3 = day_files(ROUND_3)
+    round_2 = [observations for observations, _ in day_files(ROUND_2)]
+    for prices, trades in round_1:
+        for trader in ROUND_1_TRADERS:
+            cases.append(Case.from_csv(f"{trader}/{os.path.basename(prices)}", trader, [prices], [trades]))
+    for observations in round_2:
+        cases.append(Case.from_csv(f"round_2.orchids/{os.path.basename(observations)}", "round_2.orchids",
+                                   [], [], observations, synthetic_book=ORCHIDS_BOOK))
+    for prices, trades in round_3:
+        cases.append(Case.from_csv(f"round_3.pairs/{os.path.basename(prices)}", "round_3.pairs", [prices], [trades]))
+    # The round 2 and 3 traders trade every product, so their days combine
+    # a round 1 day, a round 3 day and round 2 observations
+    for (prices_1, trades_1), (prices_3, trades_3), observations in zip(round_1, round_3, round_2):
+        name = "+".join(os.path.basename(path)[len("prices_"):-len(".csv")] for path in (prices_1, prices_3, observations))
+        for trader in ALL_PRODUCT_TRADERS:
+            cases.append(Case.from_csv(f"{trader}/{name}", trader, [prices_1, prices_3], [trades_1, trades_3],
+                                       observations, synthetic_book=ORCHIDS_BOOK))
+    return cases
+
+
+def tick_record(engine) -> Dict:
+    state = engine.state
+    return {
+        "own_trades": {product: [(trade.price, trade.quantity, trade.buyer, trade.seller, trade.timestamp)
+                                 for trade in trades] for product, trades in state.own_trades.items() if trades},
+        "position": {product: position for product, position in state.position.items() if position},
+        "pnl": engine.product_pnl(),
+    }
+
+
+def step(engine) -> Tuple[Optional[Dict], Optional[str]]:
+    # Returns the settled PnL on the last tick, and the error if the tick raised
+    try:
+        return engine.run_iteration(), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def first_difference(reference: Dict, candidate: Dict) -> Optional[Tuple[str, str]]:
+    for field in ("own_trades", "position", "pnl"):
+        products = sorted(set(reference[field]) | set(candidate[field]))
+        for product in products:
+            if reference[field].get(product) != candidate[field].get(product):
+                return field, product
+    return None
+
+
+def lockstep(case: Case, candidates: Dict[str, Callable]) -> Dict[str, Dict]:
+    # Runs the reference and every candidate tick by tick. Returns the first
+    # divergence per candidate; candidates that never diverge are left out.
+    # An error in the reference is a failure of the case under REFERENCE,
+    # whatever the candidates did.
+    market = case.market()
+    iterations = len(case.timestamps())
+    reference = MatchingEngine(case.make_trader(), market, iterations)
+    engines = {name: factory(case.make_trader(), market, iterations) for name, factory in candidates.items()}
+    divergences = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tick in range(iterations):
+            settled, error = step(reference)
+            expected = tick_record(reference)
+            for name, engine in list(engines.items()):
+                candidate_settled, candidate_error = step(engine)
+                divergence = None
+                if error != candidate_error:
+                    divergence = {"field": "error", "product": None, "expected": error, "actual": candidate_error}
+                elif error is None:
+                    actual = tick_record(engine)
+                    difference = first_difference(expected, actual)
+                    if difference is not None:
+                        field, product = difference
+                        divergence = {"field": field, "product": product, "expected": expected[field].get(product),
+                                      "actual": actual[field].get(product)}
+                    elif settled != candidate_settled:
+                        divergence = {"field": "settled", "product": None, "expected": settled,
+                                      "actual": candidate_settled}
+                if divergence is not None:
+                    divergence.update(case=case.name, candidate=name, tick=tick, timestamp=engine.state.timestamp)
+                    divergences[name] = divergence
+                    del engines[name]
+            if error is not None:
+                divergences[REFERENCE] = {"field": "error", "product": None, "expected": None, "actual": error,
+                                          "case": case.name, "candidate": REFERENCE, "tick": tick,
+                                          "timestamp": reference.state.timestamp}
+                break
+            if not engines:
+                break
+    return divergences
+
+
+def ddmin(items: List[int], reproduces: Callable[[List[int]], bool], max_tests: int = MAX_TESTS) -> List[int]:
+    # Zeller's delta debugging over complements: the result still reproduces
+    # and dropping any one chunk of it does not, up to max_tests runs
+    n = 2
+    tests = 0
+    while len(items) >= 2 and tests < max_tests:
+        chunk = -(-len(items) // n)
+        reduced = False
+        for start in range(0, len(items), chunk):
+            complement = items[:start] + items[start + chunk:]
+            tests += 1
+            if complement and reproduces(complement):
+                items = complement
+                n = max(n - 1, 2)
+                reduced = True
+                break
+            if tests >= max_tests:
+                break
+        if not reduced:
+            if n >= len(items):
+                break
+            n = min(len(items), 2 * n)
+    return items
+
+
+def minimize(case: Case, candidate: str, divergence: Dict, max_tests: int = MAX_TESTS) -> Tuple[Case, Dict]:
+    factory = {candidate: CANDIDATES[candidate]}
+    ticks = case.timestamps()[:divergence["tick"] + 1]
+    products = None
+    if divergence["product"] is not None:
+        subset = case.subset(ticks, [divergence["product"]])
+        found = lockstep(subset, factory)
+        if candidate in found:
+            products = [divergence["product"]]
+            divergence = found[candidate]
+            ticks = ticks[:divergence["tick"] + 1]
+
+    def reproduces(kept: List[int]) -> bool:
+        return candidate in lockstep(case.subset(np.array(kept, np.int64), products), factory)
+
+    kept = ddmin(ticks.tolist(), reproduces, max_tests)
+    minimal = case.subset(np.array(kept, np.int64), products)
+    return minimal, lockstep(minimal, factory).get(candidate, divergence)
+
+
+def run(cases: Sequence[Case], candidates: Dict[str, Callable], out: Optional[str] = None) -> int:
+    failures = 0
+    for case in cases:
+        divergences = lockstep(case, candidates)
+        if not divergences:
+            print(f"{case.name}: ok")
+            continue
+        for name, divergence in divergences.items():
+            failures += 1
+            if name == REFERENCE:
+                print(f"{case.name}: reference raises at tick {divergence['tick']}: {divergence['actual']}")
+                continue
+            print(f"{case.name}: {name} diverges at tick {divergence['tick']} ({divergence['field']} "
+                  f"{divergence['product']}): reference {divergence['expected']} != {divergence['actual']}")
+            minimal, minimal_divergence = minimize(case, name, divergence)
+            print(f"  minimal reproducer: {len(minimal.timestamps())} ticks, {len(minimal.prices)} quotes, "
+                  f"{len(minimal.trades)} bot trades, products {', '.join(minimal.products())}")
+            if out is not None:
+                directory = os.path.join(out, f"{case.name.replace('/', '_')}-{name}")
+                minimal.save(directory, name, minimal_divergence)
+                print(f"  saved to {directory}")
+    return failures
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Lockstep comparison of candidate engines with MatchingEngine")
+    parser.add_argument("--candidates", nargs="*", default=list(CANDIDATES), choices=list(CANDIDATES))
+    parser.add_argument("--random", type=int, default=20, help="number of random cases")
+    parser.add_argument("--no-bundled", action="store_true", help="skip the bundled days")
+    parser.add_argument("--out", help="directory for minimal reproducers")
+    parser.add_argument("--replay", help="rerun a saved reproducer")
+    args = parser.parse_args(argv)
+    logger.configure(level=OFF)
+
+    if args.replay:
+        case, description = Case.load(args.replay)
+        divergence = lockstep(case, {description["candidate"]: CANDIDATES[description["candidate"]]})
+        print(json.dumps(divergence, indent=2, default=str) if divergence else f"{case.name}: ok")
+        return 1 if divergence else 0
+
+    candidates = {name: CANDIDATES[name] for name in args.candidates}
+    cases = [] if args.no_bundled else bundled_cases()
+    cases += [random_case(seed) for seed in range(args.random)]
+    failures = run(cases, candidates, args.out)
+    print(f"{len(cases)} cases, {failures} divergences")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
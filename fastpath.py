@@ -0,0 +1,217 @@
+from collections import deque
+from typing import Dict, List, Sequence, Tuple
+import contextlib
+import io
+import numpy as np
+from replay import MarketReplay
+from round_3.pairs import (CHOCOLATE, STRAWBERRIES, ROSES, GIFT_BASKET, COMBO, position_limits,
+                           MAX_CHOCOLATE, MAX_STRAWBERRIES, MAX_ROSES, MAX_BASKET)
+
+# Vectorized backtest for the round 3 basket pairs strategy. It only applies
+# to strategies that read the level 1 quotes and position and take at the
+# touch: signals for the whole day are computed with NumPy, and only ticks
+# where the strategy actually sends orders are simulated.
+#
+# MatchingEngine never fills a submitted order against the bot quotes. An
+# order rests for the tick and fills only against the bot trades that cross
+# it. match_resting replays exactly that for a single resting order, so
+# results agree with the engine tick for tick.
+
+PAIRS_PRODUCTS = (CHOCOLATE, STRAWBERRIES, ROSES, GIFT_BASKET)
+BASKET_WEIGHTS = {CHOCOLATE: 4, STRAWBERRIES: 6, ROSES: 1}
+
+
+def match_resting(price: int, quantity: int, trades: Sequence[Tuple[float, int]]):
+    # Returns the quantity of the resting order filled (signed like the
+    # order) and the book left behind. Mirrors MatchingEngine.get_bot_trades
+    # followed by match_orders for one product with one algo order resting.
+    bids: Dict[float, deque] = {}
+    asks: Dict[float, deque] = {}
+    if quantity > 0:
+        bids[price] = deque([[quantity, True]])
+    else:
+        asks[price] = deque([[quantity, True]])
+
+    orders = []
+    for trade_price, trade_quantity in trades:
+        if trade_price in bids:
+            orders.append((trade_price, -trade_quantity))
+        elif trade_price in asks:
+            orders.append((trade_price, trade_quantity))
+        else:
+            orders.append((trade_price, -trade_quantity))
+            orders.append((trade_price, trade_quantity))
+
+    filled = 0
+    for order_price, remainder in orders:
+        while remainder > 0 and asks:
+            best_ask = min(asks)
+            if order_price < best_ask:
+                break
+            level = asks[best_ask]
+            resting = level.popleft()
+            fill_q = min(-resting[0], remainder)
+            if remainder < -resting[0]:
+                resting[0] += fill_q
+                level.appendleft(resting)
+            elif not level:
+                del asks[best_ask]
+            remainder -= fill_q
+            if resting[1]:
+                filled -= fill_q
+        if remainder > 0:
+            if order_price in bids:
+                bids[order_price].append([remainder, False])
+            else:
+                bids[order_price] = deque([[remainder, False]])
+            remainder = 0
+
+        while remainder < 0 and bids:
+            best_bid = max(bids)
+            if order_price > best_bid:
+                break
+            level = bids[best_bid]
+            resting = level.popleft()
+            fill_q = min(resting[0], -remainder)
+            if -remainder < resting[0]:
+                resting[0] -= fill_q
+                level.appendleft(resting)
+            elif not level:
+                del bids[best_bid]
+            remainder += fill_q
+            if resting[1]:
+                filled += fill_q
+        if remainder < 0:
+            if order_price in asks:
+                asks[order_price].append([remainder, False])
+            else:
+                asks[order_price] = deque([[remainder, False]])
+
+    return filled, bids, asks
+
+
+class PairsFastPath:
+    def __init__(self, market: MarketReplay, iterations=None):
+        self.market = market
+        self.iterations = iterations or len(market)
+        n_ticks = len(market)
+        product_ids = [market.products.index(product) for product in PAIRS_PRODUCTS]
+
+        # Level 1 quotes per tick and product, 0 where a side is missing
+        rows = np.repeat(np.arange(n_ticks), np.diff(market.quote_offsets))
+        bid_prices = market.bid_prices.max(axis=1)
+        ask_prices = np.where(market.ask_prices > 0, market.ask_prices, np.iinfo(np.int64).max).min(axis=1)
+        ask_prices[ask_prices == np.iinfo(np.int64).max] = 0
+        self.best_bid = np.zeros((n_ticks, len(market.products)), dtype=np.int64)
+        self.best_ask = np.zeros((n_ticks, len(market.products)), dtype=np.int64)
+        self.best_bid[rows, market.quote_products] = bid_prices
+        self.best_ask[rows, market.quote_products] = ask_prices
+        self.best_bid = self.best_bid[:, product_ids]
+        self.best_ask = self.best_ask[:, product_ids]
+        self.bid_rows = self.best_bid.tolist()
+        self.ask_rows = self.best_ask.tolist()
+
+        mids = self.best_bid + (self.best_ask - self.best_bid) / 2
+        weights = np.array([BASKET_WEIGHTS[CHOCOLATE], BASKET_WEIGHTS[STRAWBERRIES], BASKET_WEIGHTS[ROSES]])
+        self.spread = mids[:, 3] - mids[:, :3] @ weights
+
+        # Bot trades per (tick, product), in file order
+        trade_rows = np.repeat(np.arange(n_ticks), np.diff(market.trade_offsets))
+        columns = {product_id: column for column, product_id in enumerate(product_ids)}
+        self.trades: Dict[Tuple[int, int], List[Tuple[float, int]]] = {}
+        for tick, product_id, price, quantity in zip(trade_rows.tolist(), market.trade_products.tolist(),
+                                                     market.trade_prices.tolist(), market.trade_quantities.tolist()):
+            if product_id in columns:
+                self.trades.setdefault((tick, columns[product_id]), []).append((price, quantity))
+
+    def run(self, upper_spread=455, lower_spread=305, max_chocolate=MAX_CHOCOLATE,
+            max_strawberries=MAX_STRAWBERRIES, max_roses=MAX_ROSES, max_basket=MAX_BASKET) -> Dict[str, float]:
+        n_ticks = self.iterations
+        spread = self.spread[:n_ticks]
+        signal = np.where(spread >= upper_spread, 1, np.where(spread <= lower_spread, -1, 0))
+        targets = (max_chocolate, max_strawberries, max_roses, -max_basket)
+        limits = [position_limits[product] for product in PAIRS_PRODUCTS]
+        best_bid = self.bid_rows
+        best_ask = self.ask_rows
+        trades = self.trades
+        last = n_ticks - 1
+
+        position = [0, 0, 0, 0]
+        cash = [0, 0, 0, 0]
+        settle_books = {}
+        ticks = np.flatnonzero(signal)
+        for tick, direction in zip(ticks.tolist(), signal[ticks].tolist()):
+            items_position = 4 * position[0] + 6 * position[1] + position[2]
+            orders = []
+            if items_position != direction * position_limits[COMBO]:
+                for column in range(3):
+                    if direction > 0:
+                        orders.append((column, best_ask[tick][column], targets[column] - position[column]))
+                    else:
+                        orders.append((column, best_bid[tick][column], -targets[column] - position[column]))
+            if position[3] != direction * targets[3]:
+                if direction > 0:
+                    orders.append((3, best_bid[tick][3], targets[3] - position[3]))
+                else:
+                    orders.append((3, best_ask[tick][3], -targets[3] - position[3]))
+
+            for column, price, quantity in orders:
+                # Same position limit check as MatchingEngine.run_algo
+                if quantity == 0 or abs(position[column] + quantity) > limits[column]:
+                    continue
+                bot_trades = trades.get((tick, column))
+                if not bot_trades and tick != last:
+                    continue
+                filled, bids, asks = match_resting(price, quantity, bot_trades or ())
+                position[column] += filled
+                cash[column] -= price * filled
+                if tick == last:
+                    settle_books[column] = (bids, asks)
+
+        pnl = {}
+        for column, product in enumerate(PAIRS_PRODUCTS):
+            bid = best_bid[last][column]
+            ask = best_ask[last][column]
+            if column in settle_books:
+                bids, asks = settle_books[column]
+                bid = max([bid] + [price for price, level in bids.items() if level])
+                ask = min([ask] + [price for price, level in asks.items() if level])
+            pnl[product] = cash[column] + (position[column] * bid if position[column] >= 0 else position[column] * ask)
+        return pnl
+
+    def grid(self, upper_spreads: Sequence, lower_spreads: Sequence, **params) -> List[Tuple]:
+        results = [(upper, lower, sum(self.run(upper, lower, **params).values()))
+                   for upper in upper_spreads for lower in lower_spreads]
+        results.sort(key=lambda result: result[2], reverse=True)
+        return results
+
+
+def validate(prices_file: str, trades_file: str, iterations=None, **params) -> bool:
+    from backtester import MatchingEngine
+    from round_3.pairs import Trader
+    market = MarketReplay.from_csv(prices_file, trades_file)
+    iterations = iterations or len(market)
+    fast = PairsFastPath(market, iterations).run(**params)
+
+    engine = MatchingEngine(Trader(**params), market, iterations)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(iterations):
+            engine.run_iteration()
+    engine_pnl = engine.product_pnl()
+    matches = True
+    for product in PAIRS_PRODUCTS:
+        if fast[product] != engine_pnl[product]:
+            print(f"{product}: fast path {fast[product]} != engine {engine_pnl[product]}")
+            matches = False
+    return matches
+
+
+if __name__ == "__main__":
+    import time
+    from backtester import day_files
+    for prices_file, trades_file in day_files("round_3/round-3-island-data-bottle/prices_round_3_day_*.csv"):
+        print(prices_file, "matches engine:", validate(prices_file, trades_file))
+        fast_path = PairsFastPath(MarketReplay.from_csv(prices_file, trades_file))
+        start = time.perf_counter()
+        pnl = fast_path.run()
+        print(f"{sum(pnl.values())} in {(time.perf_counter() - start) * 1000:.1f}ms")
@@ -0,0 +1,97 @@
+from typing import Any, List, Optional, TextIO, Tuple
+import json
+import sys
+
+# Buffered, level-gated logging for Trader modules. Records are kept in
+# memory per timestamp and written in one go by flush(), in the "Sandbox
+# logs" layout of the Prosperity log files the visualizer reads. Messages
+# are only formatted when their level is enabled and the tick is sampled.
+# Unless a level is configured, INFO records are only kept when the run
+# writes a log file (see use_log_file); otherwise the level is WARNING, so
+# plain backtests neither format nor print the per-tick records.
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+DEFAULT_LEVEL = WARNING
+
+
+class Logger:
+    def __init__(self, level: Optional[int] = None, sample_every: int = 1):
+        self.explicit = level is not None
+        self.level = DEFAULT_LEVEL if level is None else level
+        self.sample_every = sample_every
+        self.timestamp = 0
+        self.ticks = 0
+        self.sampled = True
+        self.lines: List[str] = []
+        self.records: List[Tuple[int, str]] = []
+
+    def configure(self, level: Optional[int] = None, sample_every: Optional[int] = None):
+        if level is not None:
+            self.level = level
+            self.explicit = True
+        if sample_every is not None:
+            self.sample_every = sample_every
+
+    def use_log_file(self, path: Optional[str]):
+        # Called by the backtest drivers before a run
+        if not self.explicit:
+            self.level = INFO if path is not None else DEFAULT_LEVEL
+
+    def tick(self, timestamp: int):
+        # Called by the engine before each Trader.run
+        self.end_tick()
+        self.timestamp = timestamp
+        self.sampled = self.ticks % self.sample_every == 0
+        self.ticks += 1
+
+    def log(self, level: int, message: Any, *args):
+        if level < self.level or not self.sampled:
+            return
+        self.lines.append(message % args if args else str(message))
+
+    def debug(self, message: Any, *args):
+        self.log(DEBUG, message, *args)
+
+    def info(self, message: Any, *args):
+        self.log(INFO, message, *args)
+
+    def warning(self, message: Any, *args):
+        self.log(WARNING, message, *args)
+
+    def error(self, message: Any, *args):
+        self.log(ERROR, message, *args)
+
+    def end_tick(self):
+        if self.lines:
+            self.records.append((self.timestamp, "\n".join(self.lines)))
+            self.lines = []
+
+    def clear(self):
+        self.lines = []
+        self.records = []
+        self.ticks = 0
+        self.sampled = True
+
+    def write(self, f: TextIO):
+        f.write("Sandbox logs:\n")
+        for timestamp, text in self.records:
+            f.write(json.dumps({"sandboxLog": "", "lambdaLog": text, "timestamp": timestamp}, indent=2))
+            f.write("\n")
+
+    def flush(self, path: Optional[str] = None):
+        # Writes every buffered record to path (stdout if None) and clears the buffer
+        self.end_tick()
+        if self.records:
+            if path is None:
+                self.write(sys.stdout)
+            else:
+                with open(path, "w") as f:
+                    self.write(f)
+        self.clear()
+
+
+logger = Logger()
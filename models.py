@@ -0,0 +1,124 @@
+from typing import List, Optional, Sequence
+import numpy as np
+from rolling import LagVector
+
+# Online estimators for Trader strategies.
+
+
+class RecursiveAR:
+    # AR(order) without intercept, fitted by recursive least squares: each
+    # new value is regressed on the order values before it. An update costs
+    # O(order^2) whatever the history length. forgetting < 1 discounts old
+    # rows exponentially; window keeps only the last window rows, dropping
+    # the oldest with a rank one downdate.
+    #
+    # Until the rows determine the coefficients (fewer rows than lags, or a
+    # singular design) the fit falls back to np.linalg.lstsq on the rows seen
+    # so far, which is the minimum norm solution a batch fit would give. The
+    # recursion then starts from the exact batch solution, so predictions
+    # agree with refitting on the whole history up to rounding.
+    def __init__(self, order: int, forgetting: float = 1.0, window: Optional[int] = None,
+                 history: Sequence[float] = ()):
+        if window is not None and window < order:
+            raise ValueError("window must be at least the AR order")
+        self.order = order
+        self.forgetting = forgetting
+        self.window = window
+        self.lags = LagVector(order)
+        self.coef: List[float] = [0.0] * order
+        self.P: Optional[List[List[float]]] = None
+        # Rows kept for the warm-up fit and for downdates once the window is full
+        self.rows = LagVector(window) if window is not None else []
+        for value in history:
+            self.update(value)
+
+    def update(self, value: float):
+        if self.lags.full:
+            x = list(self.lags)
+            if self.P is None:
+                self.rows.append((x, value))
+                self.warm_up()
+            else:
+                if self.forgetting != 1.0:
+                    scale = 1 / self.forgetting
+                    for row in self.P:
+                        for j in range(self.order):
+                            row[j] *= scale
+                self.rank_one(x, value, 1.0)
+                if self.window is not None:
+                    dropped = self.rows.append((x, value))
+                    if dropped is not None:
+                        # The dropped row has been discounted once per update since it was added
+                        self.rank_one(dropped[0], dropped[1], -self.forgetting ** self.window)
+        self.lags.append(value)
+
+    def rank_one(self, x: List[float], y: float, weight: float):
+        # Adds weight * (x, y) to the normal equations, updating P = A^-1 and coef
+        P = self.P
+        n = self.order
+        Px = [sum(P[i][j] * x[j] for j in range(n)) for i in range(n)]
+        denominator = 1 / weight + sum(x[i] * Px[i] for i in range(n))
+        # Only the upper triangle is computed and mirrored, which keeps P
+        # exactly symmetric; without it rounding makes the recursion diverge
+        # once old rows are discounted
+        for i in range(n):
+            k = Px[i] / denominator
+            for j in range(i, n):
+                P[i][j] -= k * Px[j]
+                P[j][i] = P[i][j]
+        error = y - sum(self.coef[i] * x[i] for i in range(n))
+        for i in range(n):
+            self.coef[i] += error * sum(P[i][j] * x[j] for j in range(n)) * weight
+
+    def warm_up(self):
+        rows = list(self.rows)
+        weights = np.sqrt(self.forgetting ** np.arange(len(rows) - 1, -1, -1, dtype=np.float64))
+        X = np.array([x for x, _ in rows], dtype=np.float64) * weights[:, None]
+        Y = np.array([y for _, y in rows], dtype=np.float64) * weights
+        self.coef = np.linalg.lstsq(X, Y, rcond=None)[0].tolist()
+        if len(rows) >= self.order:
+            A = X.T @ X
+            if np.linalg.cond(A) < 1e12:
+                self.P = np.linalg.inv(A).tolist()
+                if self.window is None:
+                    # Only the warm-up fit needs the rows of an unbounded window
+                    self.rows = []
+
+    def predict(self) -> float:
+        # One step ahead from the latest order values
+        return self.lags.dot(self.coef)
+
+    def to_state(self) -> list:
+        return [self.order, self.forgetting, self.window, list(self.coef),
+                None if self.P is None else [list(row) for row in self.P],
+                self.lags.to_state(), [[x, y] for x, y in self.rows]]
+
+    @classmethod
+    def from_state(cls, state: Sequence) -> "RecursiveAR":
+        model = cls(state[0], state[1], state[2])
+        model.coef, model.P = list(state[3]), state[4]
+        model.lags = LagVector.from_state(state[5])
+        for x, y in state[6]:
+            model.rows.append((x, y))
+        return model
+
+
+class LinearModel:
+    # intercept + coef . x, with a scalar path for Trader.run and a batched
+    # path that scores whole columns of features at once
+    __slots__ = ("coef", "intercept", "coef_array")
+
+    def __init__(self, coef: Sequence[float], intercept: float = 0.0):
+        self.coef = tuple(float(c) for c in coef)
+        self.intercept = float(intercept)
+        self.coef_array = np.array(self.coef, dtype=np.float64)
+
+    def predict(self, *x: float) -> float:
+        total = 0.0
+        for c, value in zip(self.coef, x):
+            total += c * value
+        return self.intercept + total
+
+    def predict_batch(self, *columns) -> np.ndarray:
+        # One array per feature, e.g. a day of last prices, sunlight and humidity
+        return self.intercept + np.column_stack(columns).astype(np.float64) @ self.coef_array
@@ -0,0 +1,234 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import argparse
+import os
+import sys
+import numpy as np
+from backtester import backtest_days, day_files
+from datamodel import TradingState
+from recorder import Recorder
+from replay import MarketReplay, share_market, attach_market
+from report import format_table
+
+# Monte Carlo over the bot trades. A historical day is one sample of the bot
+# flow; here every path redraws it per product from the day's empirical
+# distributions:
+#   - arrivals: Poisson count around the day's trade count (times
+#     arrival_scale), at ticks drawn uniformly from the product's quoted ticks
+#   - prices: the mid at the drawn tick plus a trade's offset from the mid,
+#     bootstrapped, plus optional uniform jitter of up to price_jitter
+#   - sizes: bootstrapped quantities, times size_scale
+# Quotes stay historical. Each day is parsed once and placed in shared
+# memory as in sweep.py; a path only allocates its own trade arrays, so
+# memory does not grow with the path count. Path i draws from
+# default_rng((seed, i)), so results do not depend on the worker count.
+#
+#   python montecarlo.py round_3.pairs "round_3/round-3-island-data-bottle/prices_round_3_day_*.csv" --paths 200
+
+PATHS = 100
+SEED = 0
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+_flows: List["BotFlow"] = []
+_shared = []
+
+
+class BotFlow:
+    # Per-product bot trade distributions of one day, fitted from its replay
+    def __init__(self, market: MarketReplay):
+        self.market = market
+        ticks = len(market.timestamps)
+        quote_ticks = np.repeat(np.arange(ticks), np.diff(market.quote_offsets))
+        trade_ticks = np.repeat(np.arange(ticks), np.diff(market.trade_offsets))
+        bids = market.bid_prices[:, 0]
+        asks = market.ask_prices[:, 0]
+        quoted = (bids > 0) & (asks > 0)
+        self.products: List[Tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+        for product_id in range(len(market.products)):
+            rows = quoted & (market.quote_products == product_id)
+            product_ticks = quote_ticks[rows]
+            if not len(product_ticks):
+                continue
+            mids = (bids[rows] + asks[rows]) / 2
+            trades = market.trade_products == product_id
+            # Offset from the latest mid at or before each trade
+            at = (np.searchsorted(product_ticks, trade_ticks[trades], side="right") - 1).clip(0)
+            offsets = market.trade_prices[trades] - mids[at]
+            self.products.append((product_id, product_ticks, mids, offsets, market.trade_quantities[trades]))
+
+    def sample(self, rng: np.random.Generator, arrival_scale: float = 1.0, price_jitter: int = 0,
+               size_scale: float = 1.0) -> MarketReplay:
+        market = self.market
+        ticks = []
+        products = []
+        prices = []
+        quantities = []
+        for product_id, product_ticks, mids, offsets, product_quantities in self.products:
+            n = rng.poisson(len(offsets) * arrival_scale) if len(offsets) else 0
+            at = rng.integers(len(product_ticks), size=n)
+            price = mids[at] + offsets[rng.integers(len(offsets), size=n)]
+            if price_jitter:
+                price += rng.integers(-price_jitter, price_jitter + 1, size=n)
+            quantity = product_quantities[rng.integers(len(product_quantities), size=n)]
+            ticks.append(product_ticks[at])
+            products.append(np.full(n, product_id, np.int32))
+            prices.append(np.rint(price))
+            quantities.append(np.maximum(np.rint(quantity * size_scale), 1).astype(np.int64))
+        ticks = np.concatenate(ticks) if ticks else np.zeros(0, np.int64)
+        order = np.argsort(ticks, kind="stable")
+        return MarketReplay(
+            market.products, market.timestamps, market.quote_offsets, market.quote_products,
+            market.bid_prices, market.bid_volumes, market.ask_prices, market.ask_volumes,
+            np.searchsorted(ticks[order], np.arange(len(market.timestamps) + 1)).astype(np.int64),
+            np.concatenate(products or [np.zeros(0, np.int32)])[order],
+            np.concatenate(prices or [np.zeros(0)])[order],
+            np.concatenate(quantities or [np.zeros(0, np.int64)])[order],
+            market.name, market.observations,
+        )
+
+
+class OrderCounter:
+    # Adds up the order volume a trader submits, for fill rates
+    def __init__(self, trader):
+        self.trader = trader
+        self.submitted = 0
+
+    @property
+    def encode_state(self):
+        return getattr(self.trader, "encode_state", True)
+
+    @encode_state.setter
+    def encode_state(self, value):
+        self.trader.encode_state = value
+
+    def run(self, state: TradingState):
+        result = self.trader.run(state)
+        self.submitted += sum(abs(order.quantity) for orders in result[0].values() for order in orders)
+        return result
+
+
+def run_path(trader_factory: Callable, flows: Sequence[BotFlow], rng: Optional[np.random.Generator],
+             iterations=None, resample: Optional[Dict] = None, **engine_kwargs) -> Dict:
+    # Without rng the days are replayed as recorded
+    trader = OrderCounter(trader_factory())
+    recorder = Recorder()
+    load = (lambda flow: flow.market) if rng is None else (lambda flow: flow.sample(rng, **(resample or {})))
+    day_pnl = backtest_days(trader, flows, iterations, load=load, recorder=recorder, **engine_kwargs)
+    equity = np.concatenate([day["pnl"].sum(axis=1) for day in recorder.days])
+    filled = int(sum(day["fill_volume"].sum() for day in recorder.days))
+    days = [sum(pnl.values()) for pnl in day_pnl]
+    return {
+        "days": days,
+        "total": sum(days),
+        "max_drawdown": float((np.maximum.accumulate(equity) - equity).max()) if len(equity) else 0.0,
+        "fills": len(recorder.fills()["quantity"]),
+        "submitted": trader.submitted,
+        "filled": filled,
+        "fill_rate": filled / trader.submitted if trader.submitted else 0.0,
+    }
+
+
+def _init_worker(specs: List[dict]):
+    sys.stdout = open(os.devnull, "w")
+    for spec in specs:
+        market, shm = attach_market(spec)
+        _flows.append(BotFlow(market))
+        _shared.append(shm)
+
+
+def _run_path(task) -> Dict:
+    trader_factory, seed, path, iterations, resample, engine_kwargs = task
+    result = run_path(trader_factory, _flows, np.random.default_rng((seed, path)), iterations, resample,
+                      **engine_kwargs)
+    result["path"] = path
+    return result
+
+
+def monte_carlo(trader_factory: Callable, days: Sequence[Tuple[str, str]], paths: int = PATHS, seed: int = SEED,
+                iterations=None, max_workers: Optional[int] = None, resample: Optional[Dict] = None,
+                **engine_kwargs) -> Dict:
+    # trader_factory must be picklable, e.g. a Trader class. resample holds
+    # the BotFlow.sample keyword arguments.
+    max_workers = max_workers or os.cpu_count()
+    markets = [MarketReplay.from_csv(*day) for day in days]
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            historical = run_path(trader_factory, [BotFlow(market) for market in markets], None, iterations,
+                                  **engine_kwargs)
+        finally:
+            sys.stdout = stdout
+    shared = [share_market(market) for market in markets]
+    del markets
+    try:
+        tasks = [(trader_factory, seed, path, iterations, resample, engine_kwargs) for path in range(paths)]
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=([spec for _, spec in shared],)) as pool:
+            results = list(pool.map(_run_path, tasks, chunksize=chunksize))
+    finally:
+        for shm, _ in shared:
+            shm.close()
+            shm.unlink()
+    return {"historical": historical, "paths": results, "summary": summarize(results)}
+
+
+def summarize(results: List[Dict], quantiles: Sequence[float] = QUANTILES) -> Dict:
+    totals = np.array([result["total"] for result in results], dtype=np.float64)
+    drawdowns = np.array([result["max_drawdown"] for result in results], dtype=np.float64)
+    fill_rates = np.array([result["fill_rate"] for result in results], dtype=np.float64)
+    return {
+        "paths": len(results),
+        "mean": float(totals.mean()),
+        "std": float(totals.std()),
+        "loss_probability": float((totals < 0).mean()),
+        "pnl_quantiles": dict(zip(quantiles, np.quantile(totals, quantiles).tolist())),
+        "drawdown_quantiles": dict(zip(quantiles, np.quantile(drawdowns, quantiles).tolist())),
+        "fill_rate_quantiles": dict(zip(quantiles, np.quantile(fill_rates, quantiles).tolist())),
+        "mean_fills": float(np.mean([result["fills"] for result in results])),
+    }
+
+
+def format_results(results: Dict) -> str:
+    historical = results["historical"]
+    summary = results["summary"]
+    quantiles = list(summary["pnl_quantiles"])
+    header = ["", "historical"] + [f"q{quantile:g}" for quantile in quantiles]
+    rows = [
+        ["pnl", f"{historical['total']:g}"] + [f"{value:.0f}" for value in summary["pnl_quantiles"].values()],
+        ["max drawdown", f"{historical['max_drawdown']:g}"]
+        + [f"{value:.0f}" for value in summary["drawdown_quantiles"].values()],
+        ["fill rate", f"{historical['fill_rate']:.3f}"]
+        + [f"{value:.3f}" for value in summary["fill_rate_quantiles"].values()],
+    ]
+    lines = [format_table(header, rows)]
+    lines.append(f"{summary['paths']} paths: mean {summary['mean']:.0f}, std {summary['std']:.0f}, "
+                 f"P(loss) {summary['loss_probability']:.1%}, {summary['mean_fills']:.0f} fills per path "
+                 f"({historical['fills']} historical)")
+    return "\n".join(lines)
+
+
+def main(argv: List[str]) -> int:
+    from benchmark import make_trader
+    from logger import logger, OFF
+    parser = argparse.ArgumentParser(description="Monte Carlo PnL distribution over resampled bot trades")
+    parser.add_argument("trader", help='"module" for its Trader class, or "module:Class"')
+    parser.add_argument("prices", nargs="+", help="prices files, globs allowed")
+    parser.add_argument("--paths", type=int, default=PATHS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--arrival-scale", type=float, default=1.0)
+    parser.add_argument("--price-jitter", type=int, default=0)
+    parser.add_argument("--size-scale", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    logger.configure(level=OFF)
+    resample = {"arrival_scale": args.arrival_scale, "price_jitter": args.price_jitter, "size_scale": args.size_scale}
+    results = monte_carlo(partial(make_trader, args.trader), day_files(args.prices), args.paths, args.seed,
+                          max_workers=args.workers, resample=resample)
+    print(format_results(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
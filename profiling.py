@@ -0,0 +1,218 @@
+from heapq import heappush, heapreplace
+from typing import Dict, List, Tuple
+import json
+import sys
+
+# Wall time per engine phase and per product, plus matching counters.
+# Pass a Profiler to MatchingEngine(profiler=...) to collect; an engine
+# without one does not time anything.
+
+HISTOGRAM_BUCKETS = 40
+# The exchange stops a Trader.run call after 900ms
+TIME_BUDGET_NS = 900_000_000
+WORST_TICKS = 10
+TIMEOUT_ACTIONS = ("discard", "keep", "raise")
+
+
+class Histogram:
+    # Power of two buckets over nanoseconds: bucket i counts samples in [2^(i-1), 2^i)
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, ns: int):
+        if self.count == 0 or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        self.count += 1
+        self.total += ns
+        self.buckets[min(ns.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def quantile(self, q: float) -> int:
+        # Upper edge of the bucket holding the q-th sample
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(1 << i, self.max)
+        return self.max
+
+    def to_dict(self, unit: str = "ns") -> Dict:
+        return {
+            "count": self.count,
+            f"total_{unit}": self.total,
+            f"mean_{unit}": self.total / self.count if self.count else 0,
+            f"min_{unit}": self.min,
+            f"max_{unit}": self.max,
+            f"p50_{unit}": self.quantile(0.5),
+            f"p99_{unit}": self.quantile(0.99),
+            "buckets": {f"<{1 << i}": n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class Profiler:
+    def __init__(self):
+        self.ticks = 0
+        # Inclusive time per call path, e.g. ("run_algo", "match_orders", "ROSES")
+        self.timings: Dict[Tuple[str, ...], Histogram] = {}
+        # Counter name -> product -> count
+        self.counters: Dict[str, Dict[str, int]] = {}
+        # Per-tick payload sizes in bytes, e.g. "traderData", and their limits
+        self.sizes: Dict[str, Histogram] = {}
+        self.limits: Dict[str, int] = {}
+
+    def record(self, path: Tuple[str, ...], ns: int):
+        histogram = self.timings.get(path)
+        if histogram is None:
+            histogram = self.timings[path] = Histogram()
+        histogram.add(ns)
+
+    def count(self, name: str, product: str, n: int = 1):
+        counter = self.counters.setdefault(name, {})
+        counter[product] = counter.get(product, 0) + n
+
+    def size(self, name: str, n: int):
+        histogram = self.sizes.get(name)
+        if histogram is None:
+            histogram = self.sizes[name] = Histogram()
+        histogram.add(n)
+
+    def self_times(self) -> Dict[Tuple[str, ...], int]:
+        # Inclusive time minus the time of the nearest recorded descendants
+        totals = {path: histogram.total for path, histogram in self.timings.items()}
+        self_times = dict(totals)
+        for path, total in totals.items():
+            parent = path[:-1]
+            while parent and parent not in self_times:
+                parent = parent[:-1]
+            if parent:
+                self_times[parent] -= total
+        return self_times
+
+    def to_json(self) -> Dict:
+        return {
+            "ticks": self.ticks,
+            "timings": {";".join(path): histogram.to_dict() for path, histogram in sorted(self.timings.items())},
+            "counters": self.counters,
+            "sizes": {name: dict(histogram.to_dict("bytes"), limit=self.limits.get(name))
+                      for name, histogram in sorted(self.sizes.items())},
+        }
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def collapsed_stacks(self, root: str = "backtest") -> List[str]:
+        # One "frame;frame;frame value" line per path, as read by flamegraph.pl
+        # and speedscope. Values are self time in microseconds.
+        return [f"{root};{';'.join(path)} {max(ns, 0) // 1000}"
+                for path, ns in sorted(self.self_times().items())]
+
+    def write_stacks(self, path: str, root: str = "backtest"):
+        with open(path, "w") as f:
+            f.write("\n".join(self.collapsed_stacks(root)) + "\n")
+
+    def summary(self) -> str:
+        lines = []
+        for path, histogram in sorted(self.timings.items()):
+            stats = histogram.to_dict()
+            lines.append(f"{' > '.join(path):<45} {stats['count']:>8} calls {stats['total_ns'] / 1e6:>10.1f}ms"
+                         f"  p50 {stats['p50_ns'] / 1e3:>8.1f}us  p99 {stats['p99_ns'] / 1e3:>8.1f}us")
+        for name, histogram in sorted(self.sizes.items()):
+            line = (f"{name + ' bytes':<45} {histogram.count:>8} ticks  mean {histogram.total / histogram.count:>8.1f}"
+                    f"  p99 {histogram.quantile(0.99):>8}  max {histogram.max:>8}")
+            if name in self.limits:
+                line += f"  ({100 * histogram.max / self.limits[name]:.1f}% of {self.limits[name]} limit)"
+            lines.append(line)
+        for name, counter in sorted(self.counters.items()):
+            lines.append(f"{name:<45} " + ", ".join(f"{product} {n}" for product, n in sorted(counter.items())))
+        return "\n".join(lines)
+
+
+class TraderTimeout(Exception):
+    pass
+
+
+class LatencyBudget:
+    # Times every Trader.run call against the exchange's time budget. Pass
+    # one to MatchingEngine(latency=...). A call over budget_ns is a timeout,
+    # handled as on_timeout says:
+    #   discard  drop the tick's orders, conversions and traderData, as the
+    #            exchange does (state a trader keeps outside traderData has
+    #            still advanced; stateless mode rules that out)
+    #   keep     count it but use the result
+    #   raise    stop the run with TraderTimeout
+    # scale multiplies measured times, to allow for a slower exchange machine.
+    def __init__(self, budget_ns: int = TIME_BUDGET_NS, on_timeout: str = "discard", scale: float = 1.0,
+                 worst: int = WORST_TICKS):
+        if on_timeout not in TIMEOUT_ACTIONS:
+            raise ValueError(f"on_timeout must be one of {', '.join(TIMEOUT_ACTIONS)}")
+        self.budget_ns = budget_ns
+        self.on_timeout = on_timeout
+        self.scale = scale
+        self.worst = worst
+        self.histogram = Histogram()
+        # Min-heap of the slowest (ns, timestamp) calls
+        self.worst_calls: List[Tuple[int, int]] = []
+        self.timeouts: List[int] = []
+
+    def record(self, timestamp: int, ns: int) -> bool:
+        # Returns True when the tick's result must be discarded
+        if self.scale != 1.0:
+            ns = int(ns * self.scale)
+        self.histogram.add(ns)
+        if len(self.worst_calls) < self.worst:
+            heappush(self.worst_calls, (ns, timestamp))
+        elif ns > self.worst_calls[0][0]:
+            heapreplace(self.worst_calls, (ns, timestamp))
+        if ns <= self.budget_ns:
+            return False
+        self.timeouts.append(timestamp)
+        if self.on_timeout == "raise":
+            raise TraderTimeout(f"Trader.run took {ns / 1e6:.1f}ms at timestamp {timestamp}, "
+                                f"over the {self.budget_ns / 1e6:g}ms budget")
+        return self.on_timeout == "discard"
+
+    def worst_ticks(self) -> List[Tuple[int, int]]:
+        # (timestamp, ns), slowest first
+        return [(timestamp, ns) for ns, timestamp in sorted(self.worst_calls, reverse=True)]
+
+    def to_json(self) -> Dict:
+        return {
+            "budget_ns": self.budget_ns,
+            "on_timeout": self.on_timeout,
+            "scale": self.scale,
+            "latency": self.histogram.to_dict(),
+            "timeouts": self.timeouts,
+            "worst_ticks": [{"timestamp": timestamp, "ns": ns} for timestamp, ns in self.worst_ticks()],
+        }
+
+    def summary(self) -> str:
+        stats = self.histogram.to_dict()
+        lines = [f"Trader.run {stats['count']} calls  p50 {stats['p50_ns'] / 1e3:.1f}us  "
+                 f"p99 {stats['p99_ns'] / 1e3:.1f}us  max {stats['max_ns'] / 1e3:.1f}us",
+                 f"{len(self.timeouts)} over the {self.budget_ns / 1e6:g}ms budget ({self.on_timeout})"]
+        lines += [f"  {timestamp:>10} {ns / 1e3:>10.1f}us" for timestamp, ns in self.worst_ticks()]
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    from backtester import backtest
+    from round_3.pairs import Trader
+    prefix = sys.argv[1] if len(sys.argv) > 1 else "profile"
+    profiler = Profiler()
+    with contextlib.redirect_stdout(io.StringIO()):
+        backtest(10000, Trader(), "round_3/round-3-island-data-bottle/prices_round_3_day_2.csv",
+                 "round_3/round-3-island-data-bottle/trades_round_3_day_2_nn.csv", profiler=profiler)
+    profiler.write_json(prefix + ".json")
+    profiler.write_stacks(prefix + ".folded")
+    print(profiler.summary())
@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional
+import json
+import os
+import numpy as np
+
+# Per-tick series and the fill log of a run. Pass a Recorder to
+# MatchingEngine(recorder=...); an engine without one records nothing.
+#
+# Each day gets arrays of ticks x products, allocated once when the day is
+# loaded: mark-to-market PnL (cumulative over days), position and filled
+# volume. Own fills go into a fixed-size buffer that is appended to one raw
+# file per column whenever it fills up. With a directory, finished days are
+# saved as series_<i>.npz and dropped, so a multi-day run holds at most one
+# day of series and one fill buffer; without one everything stays in memory.
+
+FILL_BUFFER = 4096
+FILLS_DTYPE = np.dtype([
+    ("timestamp", np.int64), ("product", np.int16), ("price", np.float64), ("quantity", np.int32),
+])
+
+
+class Recorder:
+    def __init__(self, directory: Optional[str] = None, buffer_size: int = FILL_BUFFER):
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for name in FILLS_DTYPE.names:
+                open(fills_file(directory, name), "wb").close()
+        self.products: List[str] = []
+        self.day = -1
+        self.name = ""
+        self.timestamps = np.zeros(0, np.int64)
+        self.pnl = np.zeros((0, 0), np.float64)
+        self.position = np.zeros((0, 0), np.int32)
+        self.fill_volume = np.zeros((0, 0), np.int32)
+        # Finished days, only kept without a directory
+        self.days: List[Dict[str, np.ndarray]] = []
+        self.fill_buffer = np.zeros(buffer_size, FILLS_DTYPE)
+        self.fill_count = 0
+        self.fill_chunks: List[np.ndarray] = []
+
+    def start_day(self, name: str, products: List[str], ticks: int):
+        self.day += 1
+        self.name = name
+        self.products = list(products)
+        self.timestamps = np.zeros(ticks, np.int64)
+        self.pnl = np.zeros((ticks, len(products)), np.float64)
+        self.position = np.zeros((ticks, len(products)), np.int32)
+        self.fill_volume = np.zeros((ticks, len(products)), np.int32)
+
+    def record(self, engine):
+        # Called by the engine after update_pnl
+        tick = engine.timestamp // 100
+        timestamp = engine.state.timestamp
+        self.timestamps[tick] = timestamp
+        pnl_row = self.pnl[tick]
+        position_row = self.position[tick]
+        volume_row = self.fill_volume[tick]
+        position = engine.state.position
+        own_trades = engine.state.own_trades
+        buffer = self.fill_buffer
+        for product_id, product in enumerate(engine.products):
+            pnl_row[product_id] = engine.pnl[product_id] + engine.position_value(product_id)
+            position_row[product_id] = position[product]
+            volume = 0
+            for trade in own_trades[product]:
+                volume += trade.quantity
+                if self.fill_count == len(buffer):
+                    self.flush_fills()
+                # The engine's sign convention: a truthy seller means the fill was a sale
+                buffer[self.fill_count] = (timestamp, product_id, trade.price,
+                                           -trade.quantity if trade.seller else trade.quantity)
+                self.fill_count += 1
+            volume_row[product_id] = volume
+
+    def flush_fills(self):
+        fills = self.fill_buffer[:self.fill_count]
+        if self.directory is None:
+            self.fill_chunks.append(fills.copy())
+        else:
+            for name in FILLS_DTYPE.names:
+                with open(fills_file(self.directory, name), "ab") as f:
+                    np.ascontiguousarray(fills[name]).tofile(f)
+        self.fill_count = 0
+
+    def end_day(self):
+        # Called by the engine on the day's last tick
+        series = {"timestamps": self.timestamps, "pnl": self.pnl, "position": self.position,
+                  "fill_volume": self.fill_volume, "products": self.products}
+        self.flush_fills()
+        if self.directory is None:
+            self.days.append(series)
+            return
+        np.savez(os.path.join(self.directory, f"series_{self.day}.npz"), **dict(series, products=np.array(self.products)))
+        with open(os.path.join(self.directory, "fills.json"), "w") as f:
+            json.dump({"products": self.products, "dtype": [[name, FILLS_DTYPE[name].str] for name in FILLS_DTYPE.names]}, f)
+
+    def fills(self) -> Dict[str, np.ndarray]:
+        # Fills recorded so far, oldest first, by column
+        if self.directory is not None:
+            self.flush_fills()
+            return load_fills(self.directory)
+        fills = np.concatenate(self.fill_chunks + [self.fill_buffer[:self.fill_count]])
+        return {name: fills[name] for name in FILLS_DTYPE.names}
+
+
+def fills_file(directory: str, column: str) -> str:
+    return os.path.join(directory, f"fills.{column}.bin")
+
+
+def load_fills(directory: str, mmap: bool = False) -> Dict[str, np.ndarray]:
+    # Column name -> array; with mmap the files are mapped instead of read
+    columns = {}
+    for name in FILLS_DTYPE.names:
+        path = fills_file(directory, name)
+        dtype = FILLS_DTYPE[name]
+        if mmap and os.path.getsize(path):
+            columns[name] = np.memmap(path, dtype, mode="r")
+        else:
+            columns[name] = np.fromfile(path, dtype)
+    return columns
+
+
+def load_series(directory: str) -> List[Dict[str, np.ndarray]]:
+    days = []
+    day = 0
+    while os.path.exists(os.path.join(directory, f"series_{day}.npz")):
+        with np.load(os.path.join(directory, f"series_{day}.npz")) as data:
+            series = {name: data[name] for name in data.files}
+        series["products"] = series["products"].tolist()
+        days.append(series)
+        day += 1
+    return days
@@ -0,0 +1,320 @@
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+QUOTE_DEPTH = 3
+CACHE_DIR = ".cache"
+SYMBOL_DTYPE = "S16"
+PRICES_DTYPE = np.dtype(
+    [("day", np.int32), ("timestamp", np.int32), ("product", SYMBOL_DTYPE)]
+    + [(f"{side}_{kind}_{level}", np.int32)
+       for side in ("bid", "ask") for level in range(1, QUOTE_DEPTH + 1) for kind in ("price", "volume")]
+    + [("mid_price", np.float64), ("profit_and_loss", np.float64)]
+)
+TRADES_DTYPE = np.dtype([
+    ("timestamp", np.int32), ("buyer", SYMBOL_DTYPE), ("seller", SYMBOL_DTYPE), ("symbol", SYMBOL_DTYPE),
+    ("currency", SYMBOL_DTYPE), ("price", np.float64), ("quantity", np.int32),
+])
+OBSERVATIONS_DTYPE = np.dtype([
+    ("timestamp", np.int32), ("orchids", np.float64), ("transport_fees", np.float64),
+    ("export_tariff", np.float64), ("import_tariff", np.float64), ("sunlight", np.float64),
+    ("humidity", np.float64), ("day", np.int32),
+])
+# The round 2 observation files only carry one south price per tick and no
+# local quotes or trades. The south bid and ask are both that price unless a
+# south_spread is given. A local book can only be made up: see SyntheticBook.
+OBSERVATION_PRODUCT = "ORCHIDS"
+SOUTH_SPREAD = 0.0
+ARRAY_FIELDS = ("timestamps", "quote_offsets", "quote_products", "bid_prices", "bid_volumes",
+                "ask_prices", "ask_volumes", "trade_offsets", "trade_products", "trade_prices",
+                "trade_quantities")
+
+
+class SyntheticBook:
+    # Shape of a made-up local book for an observed product without recorded
+    # quotes: one level each side, spread wide around the south mid price and
+    # volume deep. The engine fills the trader's orders against it (see
+    # MatchingEngine.rest_quotes), so the product's PnL is simulated and
+    # depends on these values; nothing in the data pins them down.
+    def __init__(self, spread: int, volume: int):
+        self.spread = spread
+        self.volume = volume
+
+    def __repr__(self) -> str:
+        return f"SyntheticBook(spread={self.spread}, volume={self.volume})"
+
+
+class MarketReplay:
+    # Prices and bot trades grouped by timestamp once at load time. Rows for a
+    # timestamp are contiguous, so a tick is a pair of slices into each array.
+    def __init__(self, products: List[str], timestamps: np.ndarray,
+                 quote_offsets: np.ndarray, quote_products: np.ndarray,
+                 bid_prices: np.ndarray, bid_volumes: np.ndarray,
+                 ask_prices: np.ndarray, ask_volumes: np.ndarray,
+                 trade_offsets: np.ndarray, trade_products: np.ndarray,
+                 trade_prices: np.ndarray, trade_quantities: np.ndarray, name: str = "",
+                 observations: Optional["ObservationReplay"] = None):
+        self.name = name
+        self.observations = observations
+        self.products = products
+        self.timestamps = timestamps
+        self.quote_offsets = quote_offsets
+        self.quote_products = quote_products
+        self.bid_prices = bid_prices
+        self.bid_volumes = bid_volumes
+        self.ask_prices = ask_prices
+        self.ask_volumes = ask_volumes
+        self.trade_offsets = trade_offsets
+        self.trade_products = trade_products
+        self.trade_prices = trade_prices
+        self.trade_quantities = trade_quantities
+        self.index: Dict[int, int] = {timestamp: i for i, timestamp in enumerate(timestamps.tolist())}
+
+    @classmethod
+    def from_csv(cls, prices_file: Union[str, Sequence[str]], trades_file: Union[str, Sequence[str]],
+                 cache: bool = True, observations_file: Optional[str] = None,
+                 synthetic_book: Optional[SyntheticBook] = None,
+                 south_spread: float = SOUTH_SPREAD) -> "MarketReplay":
+        # Several prices/trades files can be merged into one replay, e.g. to
+        # run products from different rounds side by side. observations_file
+        # adds the conversion observations; with synthetic_book the observed
+        # product also gets a local book if none of the prices files has one.
+        prices_files = [prices_file] if isinstance(prices_file, str) else list(prices_file)
+        trades_files = [trades_file] if isinstance(trades_file, str) else list(trades_file)
+        prices = [read_records(path, PRICES_DTYPE, cache) for path in prices_files]
+        trades = [read_records(path, TRADES_DTYPE, cache) for path in trades_files]
+        observations = None
+        if observations_file is not None:
+            records = read_records(observations_file, OBSERVATIONS_DTYPE, cache)
+            if prices:
+                records = records[priced_rows(records, prices)]
+            observations = ObservationReplay.from_records(records, south_spread=south_spread)
+            if synthetic_book is not None and not any((records["product"] == observations.product.encode()).any()
+                                                      for records in prices):
+                prices.append(observations.quote_records(synthetic_book))
+                observations.synthetic_book = synthetic_book
+        prices = np.concatenate(prices) if prices else np.zeros(0, PRICES_DTYPE)
+        trades = np.concatenate(trades) if trades else np.zeros(0, TRADES_DTYPE)
+        name = os.path.basename((prices_files or [observations_file])[0])
+        return cls.from_records(prices, trades, name, observations)
+
+    @classmethod
+    def from_frames(cls, prices: pd.DataFrame, trades: pd.DataFrame, name: str = "") -> "MarketReplay":
+        return cls.from_records(frame_records(prices, PRICES_DTYPE), frame_records(trades, TRADES_DTYPE), name)
+
+    @classmethod
+    def from_records(cls, prices: np.ndarray, trades: np.ndarray, name: str = "",
+                     observations: Optional["ObservationReplay"] = None) -> "MarketReplay":
+        prices = prices[np.argsort(prices["timestamp"], kind="stable")]
+        trades = trades[np.argsort(trades["timestamp"], kind="stable")]
+        symbols, codes = np.unique(np.concatenate([prices["product"], trades["symbol"]]), return_inverse=True)
+        products = [symbol.decode() for symbol in symbols.tolist()]
+
+        def levels(side: str, kind: str) -> np.ndarray:
+            return np.stack([prices[f"{side}_{kind}_{level}"] for level in range(1, QUOTE_DEPTH + 1)], axis=1).astype(np.int64)
+
+        quote_timestamps = prices["timestamp"].astype(np.int64)
+        trade_timestamps = trades["timestamp"].astype(np.int64)
+        timestamps = np.union1d(quote_timestamps, trade_timestamps)
+
+        return cls(
+            products, timestamps,
+            _offsets(quote_timestamps, timestamps),
+            codes[:len(prices)].astype(np.int32),
+            levels("bid", "price"), levels("bid", "volume"),
+            levels("ask", "price"), levels("ask", "volume"),
+            _offsets(trade_timestamps, timestamps),
+            codes[len(prices):].astype(np.int32),
+            trades["price"].astype(np.float64),
+            trades["quantity"].astype(np.int64),
+            name,
+            observations,
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def quote_range(self, timestamp: int) -> Tuple[int, int]:
+        i = self.index.get(timestamp)
+        if i is None:
+            return 0, 0
+        return self.quote_offsets[i], self.quote_offsets[i + 1]
+
+    def trade_range(self, timestamp: int) -> Tuple[int, int]:
+        i = self.index.get(timestamp)
+        if i is None:
+            return 0, 0
+        return self.trade_offsets[i], self.trade_offsets[i + 1]
+
+    def quotes(self, timestamp: int):
+        lo, hi = self.quote_range(timestamp)
+        return zip(self.quote_products[lo:hi].tolist(),
+                   self.bid_prices[lo:hi].tolist(), self.bid_volumes[lo:hi].tolist(),
+                   self.ask_prices[lo:hi].tolist(), self.ask_volumes[lo:hi].tolist())
+
+    def trades(self, timestamp: int):
+        lo, hi = self.trade_range(timestamp)
+        return zip(self.trade_products[lo:hi].tolist(),
+                   self.trade_prices[lo:hi].tolist(), self.trade_quantities[lo:hi].tolist())
+
+
+class ObservationReplay:
+    # Conversion observations for one product. rows holds the arguments of
+    # ConversionObservation per tick as plain floats, so a tick is one lookup.
+    def __init__(self, product: str, timestamps: np.ndarray, values: np.ndarray,
+                 synthetic_book: Optional[SyntheticBook] = None):
+        # values columns: bid, ask, transport fees, export tariff, import tariff, sunlight, humidity.
+        # synthetic_book is set when the product's local quotes are
+        # quote_records made up from these prices.
+        self.product = product
+        self.synthetic_book = synthetic_book
+        self.timestamps = timestamps
+        self.values = values
+        self.rows = [tuple(row) for row in values.tolist()]
+        self.index: Dict[int, int] = {timestamp: i for i, timestamp in enumerate(timestamps.tolist())}
+
+    @classmethod
+    def from_csv(cls, observations_file: str, cache: bool = True) -> "ObservationReplay":
+        return cls.from_records(read_records(observations_file, OBSERVATIONS_DTYPE, cache))
+
+    @classmethod
+    def from_records(cls, records: np.ndarray, product: str = OBSERVATION_PRODUCT,
+                     south_spread: float = SOUTH_SPREAD,
+                     synthetic_book: Optional[SyntheticBook] = None) -> "ObservationReplay":
+        records = records[np.argsort(records["timestamp"], kind="stable")]
+        price = records["orchids"]
+        values = np.stack([price - south_spread / 2, price + south_spread / 2, records["transport_fees"],
+                           records["export_tariff"], records["import_tariff"], records["sunlight"],
+                           records["humidity"]], axis=1).astype(np.float64)
+        return cls(product, records["timestamp"].astype(np.int64), values, synthetic_book)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def row(self, timestamp: int) -> Optional[Tuple[float, ...]]:
+        i = self.index.get(timestamp)
+        return None if i is None else self.rows[i]
+
+    def quote_records(self, book: SyntheticBook) -> np.ndarray:
+        # The synthetic local book in PRICES_DTYPE layout
+        spread = book.spread
+        volume = book.volume
+        mid = (self.values[:, 0] + self.values[:, 1]) / 2
+        records = np.zeros(len(self), dtype=PRICES_DTYPE)
+        records["timestamp"] = self.timestamps
+        records["product"] = self.product
+        records["bid_price_1"] = np.floor(mid - spread / 2)
+        records["ask_price_1"] = np.ceil(mid + spread / 2)
+        records["bid_volume_1"] = volume
+        records["ask_volume_1"] = volume
+        records["mid_price"] = mid
+        return records
+
+
+def priced_rows(observations: np.ndarray, prices: Sequence[np.ndarray]) -> np.ndarray:
+    # The observation files run one tick past the prices files. A tick with
+    # only observations would quote nothing but the observed product, so
+    # the day is kept to the ticks the prices files have.
+    return np.isin(observations["timestamp"], np.concatenate([records["timestamp"] for records in prices]))
+
+
+def _offsets(row_timestamps: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+    # row_timestamps is sorted, so the rows for timestamps[i] are offsets[i]:offsets[i + 1]
+    return np.searchsorted(row_timestamps, np.append(timestamps, np.iinfo(np.int64).max)).astype(np.int64)
+
+
+def share_market(market: MarketReplay) -> Tuple[SharedMemory, dict]:
+    # Copies the replay arrays into one shared memory block. The returned spec
+    # is picklable and lets other processes map the arrays without a copy.
+    arrays = {field: getattr(market, field) for field in ARRAY_FIELDS}
+    observations = market.observations
+    if observations is not None:
+        arrays["observation_timestamps"] = observations.timestamps
+        arrays["observation_values"] = observations.values
+    layout = []
+    size = 0
+    for field, array in arrays.items():
+        layout.append((field, array.dtype.str, array.shape, size))
+        size += -(-array.nbytes // 8) * 8
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for field, dtype, shape, offset in layout:
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = arrays[field]
+    spec = {"shm": shm.name, "layout": layout, "products": market.products, "name": market.name,
+            "observations": observations.product if observations is not None else None,
+            "synthetic_book": observations.synthetic_book if observations is not None else None}
+    return shm, spec
+
+
+def attach_market(spec: dict) -> Tuple[MarketReplay, SharedMemory]:
+    # The caller must keep the SharedMemory alive for as long as the replay is used
+    shm = SharedMemory(name=spec["shm"])
+    arrays = {field: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+              for field, dtype, shape, offset in spec["layout"]}
+    observations = None
+    if spec["observations"] is not None:
+        observations = ObservationReplay(spec["observations"], arrays.pop("observation_timestamps"),
+                                         arrays.pop("observation_values"), spec["synthetic_book"])
+    return MarketReplay(spec["products"], name=spec["name"], observations=observations, **arrays), shm
+
+
+def frame_records(frame: pd.DataFrame, dtype: np.dtype) -> np.ndarray:
+    # Missing levels and participants become 0 / empty strings
+    records = np.zeros(len(frame), dtype=dtype)
+    for field in dtype.names:
+        column = frame[field]
+        if dtype[field].kind == "S":
+            records[field] = column.fillna("").astype(str).to_numpy(dtype=dtype[field])
+        else:
+            records[field] = column.fillna(0).to_numpy(dtype=dtype[field])
+    return records
+
+
+def read_csv_records(csv_file: str, dtype: np.dtype) -> np.ndarray:
+    return frame_records(pd.read_csv(csv_file, delimiter=";").rename(columns=str.lower), dtype)
+
+
+def read_records(csv_file: str, dtype: np.dtype, cache: bool = True) -> np.ndarray:
+    return load_cached(csv_file, dtype) if cache else read_csv_records(csv_file, dtype)
+
+
+def cache_file(csv_file: str) -> str:
+    directory, name = os.path.split(csv_file)
+    return os.path.join(directory, CACHE_DIR, os.path.splitext(name)[0] + ".npy")
+
+
+def convert(csv_file: str, dtype: np.dtype) -> str:
+    path = cache_file(csv_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, read_csv_records(csv_file, dtype))
+    os.replace(tmp, path)
+    return path
+
+
+def load_cached(csv_file: str, dtype: np.dtype) -> np.ndarray:
+    # Memory-maps the binary copy of csv_file, rebuilding it if the CSV is newer
+    path = cache_file(csv_file)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_file):
+        convert(csv_file, dtype)
+    records = np.load(path, mmap_mode="r")
+    if records.dtype != dtype:
+        convert(csv_file, dtype)
+        records = np.load(path, mmap_mode="r")
+    return records
+
+
+if __name__ == "__main__":
+    for csv_file in sys.argv[1:]:
+        with open(csv_file) as f:
+            header = f.readline()
+        if os.path.basename(csv_file).startswith("trades_"):
+            dtype = TRADES_DTYPE
+        elif header.startswith("timestamp;"):
+            dtype = OBSERVATIONS_DTYPE
+        else:
+            dtype = PRICES_DTYPE
+        print(convert(csv_file, dtype))
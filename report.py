@@ -0,0 +1,10 @@
+from typing import List
+
+# Plain-text result tables shared by the sweep, branch, tournament and Monte
+# Carlo drivers
+
+
+def format_table(header: List[str], rows: List[List[str]]) -> str:
+    # Right-aligned columns, two spaces apart
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header] + rows)
@@ -0,0 +1,231 @@
+from typing import List, Optional, Sequence
+import math
+
+# Incremental rolling statistics for Trader strategies. Every update is O(1)
+# and works in place on a fixed-size ring buffer, so nothing is allocated per
+# tick. to_state() returns a short list of plain numbers that can go straight
+# into traderData; from_state() rebuilds the object, running sums included,
+# so a restored statistic continues bit for bit.
+
+
+class LagVector:
+    # The last n values, indexed oldest first like a deque of maxlen n
+    __slots__ = ("values", "start", "count")
+
+    def __init__(self, n: int, initial: Sequence[float] = ()):
+        self.values: List[float] = [0] * n
+        self.start = 0
+        self.count = 0
+        for value in initial:
+            self.append(value)
+
+    def append(self, value: float):
+        # Returns the value that dropped out of the window, or None
+        n = len(self.values)
+        if self.count < n:
+            self.values[(self.start + self.count) % n] = value
+            self.count += 1
+            return None
+        dropped = self.values[self.start]
+        self.values[self.start] = value
+        self.start = (self.start + 1) % n
+        return dropped
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> float:
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("lag index out of range")
+        return self.values[(self.start + i) % len(self.values)]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.values[(self.start + i) % len(self.values)]
+
+    @property
+    def full(self) -> bool:
+        return self.count == len(self.values)
+
+    @property
+    def last(self) -> float:
+        return self.values[(self.start + self.count - 1) % len(self.values)]
+
+    def dot(self, coef: Sequence[float], intercept: float = 0.0) -> float:
+        # intercept + coef[0] * oldest + ..., accumulated left to right
+        values = self.values
+        n = len(values)
+        start = self.start
+        total = intercept
+        for i in range(len(coef)):
+            total += coef[i] * values[(start + i) % n]
+        return total
+
+    def to_state(self) -> list:
+        return [len(self.values)] + list(self)
+
+    @classmethod
+    def from_state(cls, state: Sequence) -> "LagVector":
+        return cls(state[0], state[1:])
+
+
+class RollingMean:
+    __slots__ = ("window", "total")
+
+    def __init__(self, n: int, initial: Sequence[float] = ()):
+        self.window = LagVector(n)
+        self.total = 0
+        for value in initial:
+            self.update(value)
+
+    def update(self, value: float) -> float:
+        dropped = self.window.append(value)
+        self.total += value if dropped is None else value - dropped
+        return self.total / self.window.count
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.total / self.window.count if self.window.count else None
+
+    @property
+    def full(self) -> bool:
+        return self.window.full
+
+    def __len__(self) -> int:
+        return len(self.window)
+
+    def to_state(self) -> list:
+        return [self.total] + self.window.to_state()
+
+    @classmethod
+    def from_state(cls, state: Sequence) -> "RollingMean":
+        rolling = cls.__new__(cls)
+        rolling.total = state[0]
+        rolling.window = LagVector.from_state(state[1:])
+        return rolling
+
+
+class RollingVar:
+    # Welford's mean and sum of squared deviations over a sliding window.
+    # Sliding updates leave rounding residue in m2, so a window that has
+    # gone flat resets to its exact mean and zero variance, as tracked by
+    # the length of the current run of equal values.
+    __slots__ = ("window", "mean", "m2", "ddof", "same")
+
+    def __init__(self, n: int, initial: Sequence[float] = (), ddof: int = 0):
+        self.window = LagVector(n)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ddof = ddof
+        self.same = 0
+        for value in initial:
+            self.update(value)
+
+    def update(self, value: float) -> float:
+        self.same = self.same + 1 if self.window.count and value == self.window.last else 1
+        dropped = self.window.append(value)
+        count = self.window.count
+        if dropped is None:
+            delta = value - self.mean
+            self.mean += delta / count
+            self.m2 += delta * (value - self.mean)
+        else:
+            mean = self.mean + (value - dropped) / count
+            self.m2 += (value - dropped) * (value - mean + dropped - self.mean)
+            self.mean = mean
+            if self.m2 < 0:
+                self.m2 = 0.0
+        if self.same >= count:
+            self.mean = value
+            self.m2 = 0.0
+        return self.value
+
+    @property
+    def value(self) -> float:
+        count = self.window.count - self.ddof
+        return self.m2 / count if count > 0 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.value)
+
+    @property
+    def full(self) -> bool:
+        return self.window.full
+
+    def __len__(self) -> int:
+        return len(self.window)
+
+    def to_state(self) -> list:
+        return [self.ddof, self.mean, self.m2, self.same] + self.window.to_state()
+
+    @classmethod
+    def from_state(cls, state: Sequence) -> "RollingVar":
+        rolling = cls.__new__(cls)
+        rolling.ddof, rolling.mean, rolling.m2, rolling.same = state[:4]
+        rolling.window = LagVector.from_state(state[4:])
+        return rolling
+
+
+class EWMA:
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, alpha: Optional[float] = None, span: Optional[float] = None, value: Optional[float] = None):
+        if alpha is None:
+            if span is None:
+                raise ValueError("EWMA needs alpha or span")
+            alpha = 2 / (span + 1)
+        self.alpha = alpha
+        self.value = value
+
+    def update(self, value: float) -> float:
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+    def to_state(self) -> list:
+        return [self.alpha, self.value]
+
+    @classmethod
+    def from_state(cls, state: Sequence) -> "EWMA":
+        return cls(alpha=state[0], value=state[1])
+
+
+class ZScore:
+    # Distance of the latest value from the window mean in standard deviations
+    __slots__ = ("var",)
+
+    def __init__(self, n: int, initial: Sequence[float] = (), ddof: int = 0):
+        self.var = RollingVar(n, initial, ddof)
+
+    def update(self, value: float) -> float:
+        self.var.update(value)
+        return self.value
+
+    @property
+    def value(self) -> float:
+        var = self.var
+        if not var.window.count:
+            return 0.0
+        std = var.std
+        return (var.window.last - var.mean) / std if std > 0 else 0.0
+
+    @property
+    def full(self) -> bool:
+        return self.var.full
+
+    def __len__(self) -> int:
+        return len(self.var)
+
+    def to_state(self) -> list:
+        return self.var.to_state()
+
+    @classmethod
+    def from_state(cls, state: Sequence) -> "ZScore":
+        zscore = cls.__new__(cls)
+        zscore.var = RollingVar.from_state(state)
+        return zscore
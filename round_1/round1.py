@@ -1,6 +1,7 @@
 from datamodel import OrderDepth, UserId, TradingState, Order
-from collections import deque
-import numpy as np
+from logger import logger
+import statecodec
+from rolling import LagVector, RollingMean
 
 AMETHYSTS = "AMETHYSTS"
 STARFRUIT = "STARFRUIT"
@@ -12,13 +13,18 @@ position_limits = {
 }
 
 class Trader:
+    encode_state = True # See MatchingEngine.encode_state
+
     def __init__(self):
         self.star_last_price = 5051
-        self.star_returns = deque([-1.5, 2.5, -4.0, 1.5])
-        self.star_price_window = deque([5051, 5053, 5049, 5051])
+        self.star_returns = LagVector(4, [-1.5, 2.5, -4.0, 1.5])
+        self.star_price_window = RollingMean(4, [5051, 5053, 5049, 5051])
         self.star_last_prediction = 1.5
+        self.trader_data = None
 
     def run(self, state: TradingState):
+        if state.traderData and state.traderData is not self.trader_data:
+            self.load_state(state.traderData)
         ameth_position = state.position.get(AMETHYSTS, 0)
         ameth_max_buy_vol = position_limits[AMETHYSTS] - ameth_position
         ameth_max_sell_vol = -position_limits[AMETHYSTS] - ameth_position
@@ -53,33 +59,25 @@ class Trader:
         star_spread = best_star_ask - best_star_bid
         star_mid = round((best_star_bid + best_star_ask) / 2)
 
-        self.star_price_window.append(star_mid)
-        if len(self.star_price_window) > 4:
-            self.star_price_window.popleft()
-
-        
-        star_ma = np.mean(list(self.star_price_window))
+        star_ma = self.star_price_window.update(star_mid)
         
         ret = star_mid - self.star_last_price
         self.star_returns.append(ret)
 
-        last_error = self.star_returns[-1] - self.star_last_prediction
-        print(f"Pred Error: {last_error}")
+        last_error = self.star_returns.last - self.star_last_prediction
+        logger.debug("Pred Error: %s", last_error)
 
-        if len(self.star_returns) > 4:
-            self.star_returns.popleft()
-
-        next_return = self.predict_next_price() if len(self.star_returns) == 4 else ret
+        next_return = self.predict_next_price() if self.star_returns.full else ret
         self.star_last_prediction = next_return
-        print(f"Predicted Return: {next_return}")
+        logger.debug("Predicted Return: %s", next_return)
 
         next_price = round(star_mid + next_return)
-        print(f"Last Price: {self.star_last_price}")
-        print(f"Cur Price: {star_mid}")
-        print(f"Next Price: {next_price}")
+        logger.debug("Last Price: %s", self.star_last_price)
+        logger.debug("Cur Price: %s", star_mid)
+        logger.debug("Next Price: %s", next_price)
         self.star_last_price = star_mid
 
-        print(state.position)
+        logger.info(state.position)
 
         star_orders = []
         if best_star_bid > next_price:
@@ -98,20 +96,28 @@ class Trader:
         result = {AMETHYSTS: ameth_orders,
                   STARFRUIT: star_orders}
         
-        print(result)
+        logger.info(result)
 
         conversions = None
-        traderData = ""
+        traderData = self.trader_data = self.save_state() if self.encode_state else ""
 
         return result, conversions, traderData
     
     
     def predict_next_price(self):
         coef = [-0.140516, -0.281547, -0.452744, -0.684702]
-        next_return = 0.004405
-
-        for i in range(len(coef)):
-            next_return += coef[i] * self.star_returns[i]
-
-        return next_return
-    
\ No newline at end of file
+        return self.star_returns.dot(coef, 0.004405)
+
+    def save_state(self) -> str:
+        return statecodec.encode([
+            self.star_last_price,
+            self.star_last_prediction,
+            self.star_returns.to_state(),
+            self.star_price_window.to_state(),
+        ])
+
+    def load_state(self, trader_data: str):
+        self.star_last_price, self.star_last_prediction, returns, price_window = statecodec.decode(trader_data)
+        self.star_returns = LagVector.from_state(returns)
+        self.star_price_window = RollingMean.from_state(price_window)
+        self.trader_data = trader_data
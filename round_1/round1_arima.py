@@ -1,9 +1,10 @@
 from datamodel import OrderDepth, UserId, TradingState, Order
+from logger import logger
+import statecodec
 from typing import List
 import pandas as pd
-import numpy as np
 import math
-from collections import deque
+from rolling import LagVector, RollingMean
 
 
 AMETHYSTS = "AMETHYSTS"
@@ -16,14 +17,19 @@ position_limits = {
 }
 
 class Trader:
+    encode_state = True # See MatchingEngine.encode_state
+
     def __init__(self):
         self.star_last_price = 5051
-        self.star_returns = deque([-1.5, 2.5, -4.0, 1.5])
-        self.star_price_window = deque([5051, 5053, 5049, 5051])
-        self.star_errors_window = deque([0])
-        self.star_preds_window = deque([1.5])
+        self.star_returns = LagVector(4, [-1.5, 2.5, -4.0, 1.5])
+        self.star_price_window = RollingMean(4, [5051, 5053, 5049, 5051])
+        self.star_errors_window = LagVector(1, [0])
+        self.star_preds_window = LagVector(4, [1.5])
+        self.trader_data = None
 
     def run(self, state: TradingState):
+        if state.traderData and state.traderData is not self.trader_data:
+            self.load_state(state.traderData)
         ameth_position = state.position.get(AMETHYSTS, 0)
         ameth_max_buy_vol = position_limits[AMETHYSTS] - ameth_position
         ameth_max_sell_vol = -position_limits[AMETHYSTS] - ameth_position
@@ -58,37 +64,24 @@ class Trader:
         star_spread = best_star_ask - best_star_bid
         star_mid = round((best_star_bid + best_star_ask) / 2)
 
-        self.star_price_window.append(star_mid)
-        if len(self.star_price_window) > 4:
-            self.star_price_window.popleft()
-
-        
-        star_ma = sum(list(self.star_price_window)) / len(self.star_price_window)
+        star_ma = self.star_price_window.update(star_mid)
         
         ret = star_mid - self.star_last_price
         self.star_returns.append(ret)
+        self.star_errors_window.append(self.star_returns.last - self.star_preds_window.last)
 
-        if len(self.star_returns) > 4:
-            self.star_returns.popleft()
-        
-        self.star_errors_window.append(self.star_returns[-1] - self.star_preds_window[-1])
-        if len(self.star_errors_window) > 1:
-            self.star_errors_window.popleft()
-
-        print(f"Pred Error: {self.star_errors_window[-1]}")
+        logger.debug("Pred Error: %s", self.star_errors_window.last)
 
-        next_return = self.predict_next_price() if len(self.star_returns) == 4 else ret
+        next_return = self.predict_next_price() if self.star_returns.full else ret
         self.star_preds_window.append(next_return)
-        if len(self.star_preds_window) > 4:
-            self.star_preds_window.popleft()
 
         next_price = round(star_mid + next_return)
-        print(f"Last Price: {self.star_last_price}")
-        print(f"Cur Price: {star_mid}")
-        print(f"Next Price: {next_price}")
+        logger.debug("Last Price: %s", self.star_last_price)
+        logger.debug("Cur Price: %s", star_mid)
+        logger.debug("Next Price: %s", next_price)
         self.star_last_price = star_mid
 
-        print(state.position)
+        logger.info(state.position)
 
         star_orders = []
         if best_star_bid > next_price:
@@ -107,10 +100,10 @@ class Trader:
         result = {AMETHYSTS: ameth_orders,
                   STARFRUIT: star_orders}
         
-        print(result)
+        logger.info(result)
 
         conversions = None
-        traderData = ""
+        traderData = self.trader_data = self.save_state() if self.encode_state else ""
 
         return result, conversions, traderData
     
@@ -118,13 +111,22 @@ class Trader:
     def predict_next_price(self):
         coef = [-0.015737, -0.021336, -0.022084, -0.030806]
         err_coef = [-0.677231]
-        next_return = 0.001694
-
-        for i in range(len(coef)):
-            next_return += coef[i] * self.star_returns[i]
-
-        for i in range(len(err_coef)):
-            next_return += err_coef[i] * self.star_errors_window[i]
-        
-        return next_return
-
+        next_return = self.star_returns.dot(coef, 0.001694)
+        return self.star_errors_window.dot(err_coef, next_return)
+
+    def save_state(self) -> str:
+        return statecodec.encode([
+            self.star_last_price,
+            self.star_returns.to_state(),
+            self.star_price_window.to_state(),
+            self.star_errors_window.to_state(),
+            self.star_preds_window.to_state(),
+        ])
+
+    def load_state(self, trader_data: str):
+        self.star_last_price, returns, price_window, errors_window, preds_window = statecodec.decode(trader_data)
+        self.star_returns = LagVector.from_state(returns)
+        self.star_price_window = RollingMean.from_state(price_window)
+        self.star_errors_window = LagVector.from_state(errors_window)
+        self.star_preds_window = LagVector.from_state(preds_window)
+        self.trader_data = trader_data
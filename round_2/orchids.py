@@ -1,16 +1,25 @@
 from datamodel import TradingState, Order
+from logger import logger
+import statecodec
+from models import LinearModel
 from collections import deque
-import numpy as np
 
 ORCHIDS = "ORCHIDS"
 
 position_limits = {ORCHIDS: 100}
+orchid_model = LinearModel([0.9996717565693496, 1.1443871506246691e-05, 0.0010130090910631384],
+                           0.24488328854047636)
 
 class Trader:
+    encode_state = True # See MatchingEngine.encode_state
+
     def __init__(self):
         self.last_price = None
+        self.trader_data = None
 
     def run(self, state: TradingState):
+        if state.traderData and state.traderData is not self.trader_data:
+            self.load_state(state.traderData)
         plain_observations = state.observations.plainValueObservations # Dict[Product, Int]
         conversion_observations = state.observations.conversionObservations # Dict[Product, ConversionObservation]
 
@@ -35,13 +44,13 @@ class Trader:
         orchid_mid = best_orchid_bid + (best_orchid_ask - best_orchid_bid) / 2
         orchid_spread = best_orchid_ask - best_orchid_bid
 
-        print(f"South Bid: {south_bid}")
-        print(f"South Ask: {south_ask}")
-        print(f"Local Bid: {best_orchid_bid}")
-        print(f"Local Ask: {best_orchid_ask}")
-        print(f"Import Tariff: {importTariff}")
-        print(f"Export Tariff: {exportTariff}")
-        print(f"Transport Fees: {transportFees}")
+        logger.debug("South Bid: %s", south_bid)
+        logger.debug("South Ask: %s", south_ask)
+        logger.debug("Local Bid: %s", best_orchid_bid)
+        logger.debug("Local Ask: %s", best_orchid_ask)
+        logger.debug("Import Tariff: %s", importTariff)
+        logger.debug("Export Tariff: %s", exportTariff)
+        logger.debug("Transport Fees: %s", transportFees)
 
 
         orchid_orders = []
@@ -71,17 +80,16 @@ class Trader:
                     orchid_orders.append(Order(ORCHIDS, best_orchid_bid, max_sell_vol)) 
 
         result = {ORCHIDS: orchid_orders}
-        traderData = ""
+        traderData = self.trader_data = self.save_state() if self.encode_state else ""
 
         return result, conversions, traderData
     
     def predict(self, last_price, sunlight, humidity):
-        coef = [0.9996717565693496, 1.1443871506246691e-05, 0.0010130090910631384]
-        next_price = 0.24488328854047636
+        return orchid_model.predict(last_price, sunlight, humidity)
 
-        X = np.column_stack([last_price, sunlight, humidity])
-        coef = np.reshape(coef, (1, 3))
-        next_price = next_price + coef @ X.T
+    def save_state(self) -> str:
+        return statecodec.encode([self.last_price])
 
-        return next_price
-    
\ No newline at end of file
+    def load_state(self, trader_data: str):
+        self.last_price, = statecodec.decode(trader_data)
+        self.trader_data = trader_data
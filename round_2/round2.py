@@ -1,6 +1,8 @@
 from datamodel import TradingState, Order
-from collections import deque
-import numpy as np
+from logger import logger
+import statecodec
+from models import LinearModel
+from rolling import LagVector, RollingMean
 
 AMETHYSTS = "AMETHYSTS"
 STARFRUIT = "STARFRUIT"
@@ -12,19 +14,26 @@ position_limits = {
     STARFRUIT: 20,
     ORCHIDS: 100
 }
+orchid_model = LinearModel([0.9996717565693496, 1.1443871506246691e-05, 0.0010130090910631384],
+                           0.24488328854047636)
 
 class Trader:
+    encode_state = True # See MatchingEngine.encode_state
+
     def __init__(self):
         self.star_last_price = None
-        self.star_returns = deque([])
-        self.star_price_window = deque([])
+        self.star_returns = LagVector(4)
+        self.star_price_window = RollingMean(4)
         self.star_last_error = 0
         self.star_last_prediction = None
 
         self.orchid_last_price = None
+        self.trader_data = None
 
     def run(self, state: TradingState):
-        print(state.position)
+        if state.traderData and state.traderData is not self.trader_data:
+            self.load_state(state.traderData)
+        logger.info(state.position)
 
         star_orders = self.starfruit_strategy(state)
         ameth_orders = self.amethysts_strategy(state)
@@ -35,10 +44,10 @@ class Trader:
                   ORCHIDS: orchid_orders
                 }
         
-        print(result)
+        logger.info(result)
 
         conversions = None
-        traderData = ""
+        traderData = self.trader_data = self.save_state() if self.encode_state else ""
 
         return result, conversions, traderData
     
@@ -46,23 +55,12 @@ class Trader:
     def predict_starfruit_return(self):
         coef = [-0.015737, -0.021336, -0.022084, -0.030806]
         err_coef = -0.677231
-        next_return = 0.001694
-
-        for i in range(len(coef)):
-            next_return += coef[i] * self.star_returns[i]
-
+        next_return = self.star_returns.dot(coef, 0.001694)
         next_return += self.star_last_error * err_coef
         return next_return
     
     def predict_orchid_price(self, last_price, sunlight, humidity):
-        coef = [0.9996717565693496, 1.1443871506246691e-05, 0.0010130090910631384]
-        next_price = 0.24488328854047636
-
-        X = np.column_stack([last_price, sunlight, humidity])
-        coef = np.reshape(coef, (1, 3))
-        next_price = next_price + coef @ X.T
-
-        return next_price
+        return orchid_model.predict(last_price, sunlight, humidity)
     
     def starfruit_strategy(self, state: TradingState):
         cur_star_pos = state.position.get(STARFRUIT, 0)
@@ -79,30 +77,22 @@ class Trader:
         star_spread = best_star_ask - best_star_bid
         star_mid = round((best_star_bid + best_star_ask) / 2)
 
-        self.star_price_window.append(star_mid)
-        if len(self.star_price_window) > 4:
-            self.star_price_window.popleft()
-
-        
-        star_ma = np.mean(list(self.star_price_window))
+        star_ma = self.star_price_window.update(star_mid)
         
         ret = star_mid - self.star_last_price if self.star_last_price else 0
         self.star_returns.append(ret)
 
-        self.star_last_error = self.star_returns[-1] - self.star_last_prediction if self.star_returns and self.star_last_prediction else 0
-        print(f"Pred Error: {self.star_last_error}")
+        self.star_last_error = self.star_returns.last - self.star_last_prediction if self.star_returns and self.star_last_prediction else 0
+        logger.debug("Pred Error: %s", self.star_last_error)
 
-        if len(self.star_returns) > 4:
-            self.star_returns.popleft()
-
-        next_return = self.predict_starfruit_return() if len(self.star_returns) == 4 else ret
+        next_return = self.predict_starfruit_return() if self.star_returns.full else ret
         self.star_last_prediction = next_return
-        print(f"Predicted Return: {next_return}")
+        logger.debug("Predicted Return: %s", next_return)
 
         next_price = round(star_mid + next_return)
-        print(f"Last Price: {self.star_last_price}")
-        print(f"Cur Price: {star_mid}")
-        print(f"Next Price: {next_price}")
+        logger.debug("Last Price: %s", self.star_last_price)
+        logger.debug("Cur Price: %s", star_mid)
+        logger.debug("Next Price: %s", next_price)
         self.star_last_price = star_mid
 
         star_orders = []
@@ -171,3 +161,20 @@ class Trader:
             orchid_orders.append(Order(ORCHIDS, best_orchid_bid, max_sell_vol)) 
 
         return orchid_orders
+
+    def save_state(self) -> str:
+        return statecodec.encode([
+            self.star_last_price,
+            self.star_last_error,
+            self.star_last_prediction,
+            self.orchid_last_price,
+            self.star_returns.to_state(),
+            self.star_price_window.to_state(),
+        ])
+
+    def load_state(self, trader_data: str):
+        (self.star_last_price, self.star_last_error, self.star_last_prediction, self.orchid_last_price,
+         returns, price_window) = statecodec.decode(trader_data)
+        self.star_returns = LagVector.from_state(returns)
+        self.star_price_window = RollingMean.from_state(price_window)
+        self.trader_data = trader_data
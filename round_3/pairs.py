@@ -23,8 +23,15 @@ MAX_ROSES = 58
 MAX_BASKET = 58
 
 class Trader:
-    def __init__(self):
-        pass
+    def __init__(self, upper_spread=455, lower_spread=305, max_chocolate=MAX_CHOCOLATE,
+                 max_strawberries=MAX_STRAWBERRIES, max_roses=MAX_ROSES, max_basket=MAX_BASKET):
+        self.upper_spread = upper_spread
+        self.lower_spread = lower_spread
+        self.max_chocolate = max_chocolate
+        self.max_strawberries = max_strawberries
+        self.max_roses = max_roses
+        self.max_basket = max_basket
+
     def run(self, state: TradingState):
 
         chocolate_bids = state.order_depths[CHOCOLATE].buy_orders
@@ -66,23 +73,23 @@ class Trader:
         rose_orders = []
         basket_orders = []
 
-        if spread >= 455:
+        if spread >= self.upper_spread:
             if items_position != position_limits[COMBO]:
-                chocolate_orders.append(Order(CHOCOLATE, best_choc_ask, MAX_CHOCOLATE - choc_position))
-                strawberry_orders.append(Order(STRAWBERRIES, best_straw_ask, MAX_STRAWBERRIES - straw_position))
-                rose_orders.append(Order(ROSES, best_rose_ask, MAX_ROSES - rose_position))
+                chocolate_orders.append(Order(CHOCOLATE, best_choc_ask, self.max_chocolate - choc_position))
+                strawberry_orders.append(Order(STRAWBERRIES, best_straw_ask, self.max_strawberries - straw_position))
+                rose_orders.append(Order(ROSES, best_rose_ask, self.max_roses - rose_position))
             
-            if basket_position != -MAX_BASKET:
-                basket_orders.append(Order(GIFT_BASKET, best_basket_bid, -MAX_BASKET - basket_position))
+            if basket_position != -self.max_basket:
+                basket_orders.append(Order(GIFT_BASKET, best_basket_bid, -self.max_basket - basket_position))
         
-        elif spread <= 305:
+        elif spread <= self.lower_spread:
             if items_position != -position_limits[COMBO]:
-                chocolate_orders.append(Order(CHOCOLATE, best_choc_bid, -MAX_CHOCOLATE - choc_position))
-                strawberry_orders.append(Order(STRAWBERRIES, best_straw_bid, -MAX_STRAWBERRIES - straw_position))
-                rose_orders.append(Order(ROSES, best_rose_bid, -MAX_ROSES - rose_position))
+                chocolate_orders.append(Order(CHOCOLATE, best_choc_bid, -self.max_chocolate - choc_position))
+                strawberry_orders.append(Order(STRAWBERRIES, best_straw_bid, -self.max_strawberries - straw_position))
+                rose_orders.append(Order(ROSES, best_rose_bid, -self.max_roses - rose_position))
             
-            if basket_position != MAX_BASKET:
-                basket_orders.append(Order(GIFT_BASKET, best_basket_ask, MAX_BASKET - basket_position))
+            if basket_position != self.max_basket:
+                basket_orders.append(Order(GIFT_BASKET, best_basket_ask, self.max_basket - basket_position))
 
         result = {
             CHOCOLATE: chocolate_orders,
@@ -1,6 +1,8 @@
 from datamodel import TradingState, Order
-from collections import deque
-import numpy as np
+from logger import logger
+import statecodec
+from models import LinearModel
+from rolling import LagVector, RollingMean
 
 AMETHYSTS = "AMETHYSTS"
 STARFRUIT = "STARFRUIT"
@@ -28,19 +30,35 @@ position_limits = {
     GIFT_BASKET: 60,
     COMBO: 58
 }
+orchid_model = LinearModel([0.9996717565693496, 1.1443871506246691e-05, 0.0010130090910631384],
+                           0.24488328854047636)
 
 class Trader:
-    def __init__(self):
+    encode_state = True # See MatchingEngine.encode_state
+
+    def __init__(self, star_spread=5, upper_spread=455, lower_spread=305, max_chocolate=MAX_CHOCOLATE,
+                 max_strawberries=MAX_STRAWBERRIES, max_roses=MAX_ROSES, max_basket=MAX_BASKET):
+        self.star_spread = star_spread
+        self.upper_spread = upper_spread
+        self.lower_spread = lower_spread
+        self.max_chocolate = max_chocolate
+        self.max_strawberries = max_strawberries
+        self.max_roses = max_roses
+        self.max_basket = max_basket
+
         self.star_last_price = None
-        self.star_returns = deque([])
-        self.star_price_window = deque([])
+        self.star_returns = LagVector(4)
+        self.star_price_window = RollingMean(4)
         self.star_last_error = 0
         self.star_last_prediction = None
 
         self.orchid_last_price = None
+        self.trader_data = None
 
     def run(self, state: TradingState):
-        print(state.position)
+        if state.traderData and state.traderData is not self.trader_data:
+            self.load_state(state.traderData)
+        logger.info(state.position)
 
         star_orders = self.starfruit_strategy(state)
         ameth_orders = self.amethysts_strategy(state)
@@ -61,9 +79,9 @@ class Trader:
             GIFT_BASKET: basket_orders
         }
         
-        print(result)
+        logger.info(result)
 
-        traderData = ""
+        traderData = self.trader_data = self.save_state() if self.encode_state else ""
 
         return result, conversions, traderData
     
@@ -71,23 +89,12 @@ class Trader:
     def predict_starfruit_return(self):
         coef = [-0.015737, -0.021336, -0.022084, -0.030806]
         err_coef = -0.677231
-        next_return = 0.001694
-
-        for i in range(len(coef)):
-            next_return += coef[i] * self.star_returns[i]
-
+        next_return = self.star_returns.dot(coef, 0.001694)
         next_return += self.star_last_error * err_coef
         return next_return
     
     def predict_orchid_price(self, last_price, sunlight, humidity):
-        coef = [0.9996717565693496, 1.1443871506246691e-05, 0.0010130090910631384]
-        next_price = 0.24488328854047636
-
-        X = np.column_stack([last_price, sunlight, humidity])
-        coef = np.reshape(coef, (1, 3))
-        next_price = next_price + coef @ X.T
-
-        return next_price
+        return orchid_model.predict(last_price, sunlight, humidity)
     
     def starfruit_strategy(self, state: TradingState):
         cur_star_pos = state.position.get(STARFRUIT, 0)
@@ -104,22 +111,14 @@ class Trader:
         star_spread = best_star_ask - best_star_bid
         star_mid = round((best_star_bid + best_star_ask) / 2)
 
-        self.star_price_window.append(star_mid)
-        if len(self.star_price_window) > 4:
-            self.star_price_window.popleft()
-
-        
-        star_ma = np.mean(list(self.star_price_window))
+        star_ma = self.star_price_window.update(star_mid)
         
         ret = star_mid - self.star_last_price if self.star_last_price else 0
         self.star_returns.append(ret)
 
-        self.star_last_error = self.star_returns[-1] - self.star_last_prediction if self.star_returns and self.star_last_prediction else 0
+        self.star_last_error = self.star_returns.last - self.star_last_prediction if self.star_returns and self.star_last_prediction else 0
 
-        if len(self.star_returns) > 4:
-            self.star_returns.popleft()
-
-        next_return = self.predict_starfruit_return() if len(self.star_returns) == 4 else ret
+        next_return = self.predict_starfruit_return() if self.star_returns.full else ret
         self.star_last_prediction = next_return
 
         next_price = round(star_mid + next_return)
@@ -134,7 +133,7 @@ class Trader:
             star_orders.append(Order(STARFRUIT, best_star_bid - 1, star_max_sell_vol))
         elif best_star_ask < star_ma:
             star_orders.append(Order(STARFRUIT, best_star_ask + 1, star_max_buy_vol))
-        elif star_spread >= 5:
+        elif star_spread >= self.star_spread:
             star_orders.append(Order(STARFRUIT, best_star_bid + 1, star_max_buy_vol))
             star_orders.append(Order(STARFRUIT, best_star_ask - 1, star_max_sell_vol))
         
@@ -186,13 +185,13 @@ class Trader:
 
         orchid_mid = best_orchid_bid + (best_orchid_ask - best_orchid_bid) / 2
 
-        print(f"South Bid: {south_bid}")
-        print(f"South Ask: {south_ask}")
-        print(f"Local Bid: {best_orchid_bid}")
-        print(f"Local Ask: {best_orchid_ask}")
-        print(f"Import Tariff: {importTariff}")
-        print(f"Export Tariff: {exportTariff}")
-        print(f"Transport Fees: {transportFees}")
+        logger.debug("South Bid: %s", south_bid)
+        logger.debug("South Ask: %s", south_ask)
+        logger.debug("Local Bid: %s", best_orchid_bid)
+        logger.debug("Local Ask: %s", best_orchid_ask)
+        logger.debug("Import Tariff: %s", importTariff)
+        logger.debug("Export Tariff: %s", exportTariff)
+        logger.debug("Transport Fees: %s", transportFees)
 
         orchid_orders = []
         conversions = 0
@@ -256,23 +255,23 @@ class Trader:
         rose_orders = []
         basket_orders = []
         
-        if spread >= 455:
+        if spread >= self.upper_spread:
             if items_position != position_limits[COMBO]:
-                chocolate_orders.append(Order(CHOCOLATE, best_choc_ask, MAX_CHOCOLATE - choc_position))
-                strawberry_orders.append(Order(STRAWBERRIES, best_straw_ask, MAX_STRAWBERRIES - straw_position))
-                rose_orders.append(Order(ROSES, best_rose_ask, MAX_ROSES - rose_position))
+                chocolate_orders.append(Order(CHOCOLATE, best_choc_ask, self.max_chocolate - choc_position))
+                strawberry_orders.append(Order(STRAWBERRIES, best_straw_ask, self.max_strawberries - straw_position))
+                rose_orders.append(Order(ROSES, best_rose_ask, self.max_roses - rose_position))
             
-            if basket_position != -MAX_BASKET:
-                basket_orders.append(Order(GIFT_BASKET, best_basket_bid, -MAX_BASKET - basket_position))
+            if basket_position != -self.max_basket:
+                basket_orders.append(Order(GIFT_BASKET, best_basket_bid, -self.max_basket - basket_position))
         
-        elif spread <= 305:
+        elif spread <= self.lower_spread:
             if items_position != -position_limits[COMBO]:
-                chocolate_orders.append(Order(CHOCOLATE, best_choc_bid, -MAX_CHOCOLATE - choc_position))
-                strawberry_orders.append(Order(STRAWBERRIES, best_straw_bid, -MAX_STRAWBERRIES - straw_position))
-                rose_orders.append(Order(ROSES, best_rose_bid, -MAX_ROSES - rose_position))
+                chocolate_orders.append(Order(CHOCOLATE, best_choc_bid, -self.max_chocolate - choc_position))
+                strawberry_orders.append(Order(STRAWBERRIES, best_straw_bid, -self.max_strawberries - straw_position))
+                rose_orders.append(Order(ROSES, best_rose_bid, -self.max_roses - rose_position))
             
-            if basket_position != MAX_BASKET:
-                basket_orders.append(Order(GIFT_BASKET, best_basket_ask, MAX_BASKET - basket_position))
+            if basket_position != self.max_basket:
+                basket_orders.append(Order(GIFT_BASKET, best_basket_ask, self.max_basket - basket_position))
 
         result = {
             CHOCOLATE: chocolate_orders,
@@ -282,4 +281,20 @@ class Trader:
         }
 
         return result
-    
\ No newline at end of file
+
+    def save_state(self) -> str:
+        return statecodec.encode([
+            self.star_last_price,
+            self.star_last_error,
+            self.star_last_prediction,
+            self.orchid_last_price,
+            self.star_returns.to_state(),
+            self.star_price_window.to_state(),
+        ])
+
+    def load_state(self, trader_data: str):
+        (self.star_last_price, self.star_last_error, self.star_last_prediction, self.orchid_last_price,
+         returns, price_window) = statecodec.decode(trader_data)
+        self.star_returns = LagVector.from_state(returns)
+        self.star_price_window = RollingMean.from_state(price_window)
+        self.trader_data = trader_data
@@ -0,0 +1,246 @@
+from array import array
+from collections import deque
+from time import perf_counter_ns
+from typing import Any, List, Tuple
+import base64
+import struct
+
+# Compact traderData encoding for strategy state: None, bools, ints, floats,
+# strings, lists, dicts with string keys and deques, nested freely. Values are
+# tagged binary, then base64 so the result is a plain str:
+#   - ints are zigzag varints, so small prices and positions take 1-3 bytes
+#   - floats take 4 bytes when float32 holds them exactly (prices, halves,
+#     returns like -1.5) and 8 otherwise, so decoding is always lossless
+#   - lists of only floats or only ints are packed in one go, ints in the
+#     narrowest fixed width that holds them
+# Tuples come back as lists. encode/decode times are recorded under
+# Trader.run into the profiler passed in, or else into active_profiler,
+# which a profiling MatchingEngine sets only while its Trader.run executes.
+
+active_profiler = None
+
+NONE, FALSE, TRUE, INT, FLOAT32, FLOAT64, STR, LIST, DICT, DEQUE, FLOAT32_ARRAY, FLOAT64_ARRAY, INT_ARRAY = range(13)
+
+# Packed int lists use the narrowest of these that holds every value
+INT_RANGES = [(typecode, -(1 << (8 * array(typecode).itemsize - 1)), (1 << (8 * array(typecode).itemsize - 1)) - 1)
+              for typecode in "bhiq"]
+_float32 = struct.Struct("<f")
+_float64 = struct.Struct("<d")
+
+
+def _varint(out: bytearray, n: int):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _int(out: bytearray, n: int):
+    _varint(out, (n << 1) if n >= 0 else ((-n << 1) - 1))
+
+
+def _floats(out: bytearray, values: List[float]):
+    packed = array("f", values)
+    if packed.tolist() == values:
+        out.append(FLOAT32_ARRAY)
+    else:
+        packed = array("d", values)
+        out.append(FLOAT64_ARRAY)
+    _varint(out, len(values))
+    out += packed.tobytes()
+
+
+def _ints(out: bytearray, values: List[int]):
+    low = min(values)
+    high = max(values)
+    for typecode, typecode_low, typecode_high in INT_RANGES:
+        if typecode_low <= low and high <= typecode_high:
+            out.append(INT_ARRAY)
+            out.append(ord(typecode))
+            _varint(out, len(values))
+            out += array(typecode, values).tobytes()
+            return
+    out.append(LIST)
+    _varint(out, len(values))
+    for value in values:
+        out.append(INT)
+        _int(out, value)
+
+
+def _list(out: bytearray, values):
+    n = len(values)
+    if n > 1:
+        first = type(values[0])
+        if first is float or first is int:
+            for value in values:
+                if type(value) is not first:
+                    break
+            else:
+                values = values if type(values) is list else list(values)
+                if first is float:
+                    _floats(out, values)
+                else:
+                    _ints(out, values)
+                return
+    out.append(LIST)
+    _varint(out, n)
+    for value in values:
+        kind = type(value)
+        if kind is int:
+            out.append(INT)
+            n = (value << 1) if value >= 0 else ((-value << 1) - 1)
+            while n > 0x7F:
+                out.append((n & 0x7F) | 0x80)
+                n >>= 7
+            out.append(n)
+        elif kind is float:
+            packed = _float32.pack(value) if -3.4e38 < value < 3.4e38 else None
+            if packed is not None and _float32.unpack(packed)[0] == value:
+                out.append(FLOAT32)
+                out += packed
+            else:
+                out.append(FLOAT64)
+                out += _float64.pack(value)
+        else:
+            _value(out, value)
+
+
+def _value(out: bytearray, value: Any):
+    kind = type(value)
+    if kind is int:
+        out.append(INT)
+        _int(out, value)
+    elif kind is float:
+        packed = _float32.pack(value) if -3.4e38 < value < 3.4e38 else None
+        if packed is not None and _float32.unpack(packed)[0] == value:
+            out.append(FLOAT32)
+            out += packed
+        else:
+            out.append(FLOAT64)
+            out += _float64.pack(value)
+    elif kind is list or kind is tuple:
+        _list(out, value)
+    elif value is None:
+        out.append(NONE)
+    elif kind is bool:
+        out.append(TRUE if value else FALSE)
+    elif kind is str:
+        data = value.encode()
+        out.append(STR)
+        _varint(out, len(data))
+        out += data
+    elif kind is dict:
+        out.append(DICT)
+        _varint(out, len(value))
+        for key, item in value.items():
+            data = key.encode()
+            _varint(out, len(data))
+            out += data
+            _value(out, item)
+    elif kind is deque:
+        out.append(DEQUE)
+        _varint(out, 0 if value.maxlen is None else value.maxlen + 1)
+        _list(out, value)
+    elif hasattr(value, "__index__"):
+        # NumPy integers
+        out.append(INT)
+        _int(out, value.__index__())
+    elif hasattr(value, "__float__"):
+        _value(out, float(value))
+    else:
+        raise TypeError(f"Cannot encode {kind.__name__} in traderData")
+
+
+def _read_varint(data: bytes, i: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+
+def _read(data: bytes, i: int) -> Tuple[Any, int]:
+    tag = data[i]
+    i += 1
+    if tag == INT:
+        n, i = _read_varint(data, i)
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1), i
+    if tag == FLOAT32:
+        return _float32.unpack_from(data, i)[0], i + 4
+    if tag == FLOAT64:
+        return _float64.unpack_from(data, i)[0], i + 8
+    if tag == FLOAT32_ARRAY or tag == FLOAT64_ARRAY:
+        n, i = _read_varint(data, i)
+        typecode, size = ("f", 4) if tag == FLOAT32_ARRAY else ("d", 8)
+        values = array(typecode)
+        values.frombytes(data[i:i + n * size])
+        return values.tolist(), i + n * size
+    if tag == INT_ARRAY:
+        typecode = chr(data[i])
+        n, i = _read_varint(data, i + 1)
+        values = array(typecode)
+        end = i + n * values.itemsize
+        values.frombytes(data[i:end])
+        return values.tolist(), end
+    if tag == LIST:
+        n, i = _read_varint(data, i)
+        values = []
+        for _ in range(n):
+            tag = data[i]
+            if tag == INT and data[i + 1] < 0x80:
+                code = data[i + 1]
+                values.append((code >> 1) if not code & 1 else -((code + 1) >> 1))
+                i += 2
+            elif tag == FLOAT32:
+                values.append(_float32.unpack_from(data, i + 1)[0])
+                i += 5
+            else:
+                value, i = _read(data, i)
+                values.append(value)
+        return values, i
+    if tag == NONE:
+        return None, i
+    if tag == FALSE or tag == TRUE:
+        return tag == TRUE, i
+    if tag == STR:
+        n, i = _read_varint(data, i)
+        return data[i:i + n].decode(), i + n
+    if tag == DICT:
+        n, i = _read_varint(data, i)
+        values = {}
+        for _ in range(n):
+            size, i = _read_varint(data, i)
+            key = data[i:i + size].decode()
+            values[key], i = _read(data, i + size)
+        return values, i
+    if tag == DEQUE:
+        maxlen, i = _read_varint(data, i)
+        values, i = _read(data, i)
+        return deque(values, maxlen - 1 if maxlen else None), i
+    raise ValueError(f"Unknown traderData tag {tag}")
+
+
+def encode(value: Any, profiler=None) -> str:
+    if profiler is None:
+        profiler = active_profiler
+    start = perf_counter_ns() if profiler is not None else 0
+    out = bytearray()
+    _value(out, value)
+    data = base64.b64encode(out).decode("ascii")
+    if profiler is not None:
+        profiler.record(("run_algo", "Trader.run", "encode"), perf_counter_ns() - start)
+    return data
+
+
+def decode(data: str, profiler=None) -> Any:
+    if profiler is None:
+        profiler = active_profiler
+    start = perf_counter_ns() if profiler is not None else 0
+    value = _read(base64.b64decode(data), 0)[0]
+    if profiler is not None:
+        profiler.record(("run_algo", "Trader.run", "decode"), perf_counter_ns() - start)
+    return value
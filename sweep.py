@@ -0,0 +1,74 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import os
+import sys
+from backtester import backtest_days, day_files
+from replay import MarketReplay, share_market, attach_market
+from report import format_table
+
+# Parameter sweeps over a Trader factory. Each day is parsed once in the
+# parent and placed in shared memory; workers map the same arrays instead of
+# re-reading or unpickling the market data.
+
+_markets: List[MarketReplay] = []
+_shared = []
+
+
+def _init_worker(specs: List[dict]):
+    sys.stdout = open(os.devnull, "w")
+    for spec in specs:
+        market, shm = attach_market(spec)
+        _markets.append(market)
+        _shared.append(shm)
+
+
+def _run_point(task) -> Dict:
+    trader_factory, params, iterations, engine_kwargs = task
+    trader = trader_factory(**params)
+    day_pnl = backtest_days(trader, _markets, iterations, load=lambda market: market, **engine_kwargs)
+    days = [sum(pnl.values()) for pnl in day_pnl]
+    return {"params": params, "days": days, "total": sum(days)}
+
+
+def grid_points(grid: Dict[str, Sequence]) -> List[Dict]:
+    names = list(grid)
+    return [dict(zip(names, values)) for values in product(*(grid[name] for name in names))]
+
+
+def sweep(trader_factory: Callable, grid: Dict[str, Sequence], days: Sequence[Tuple[str, str]],
+          iterations=None, max_workers: Optional[int] = None, **engine_kwargs) -> List[Dict]:
+    # trader_factory and every grid value must be picklable, e.g. a Trader class
+    points = grid_points(grid)
+    max_workers = max_workers or os.cpu_count()
+    shared = [share_market(MarketReplay.from_csv(*day)) for day in days]
+    try:
+        tasks = [(trader_factory, params, iterations, engine_kwargs) for params in points]
+        chunksize = max(1, len(tasks) // (max_workers * 4))
+        with ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=([spec for _, spec in shared],)) as pool:
+            results = list(pool.map(_run_point, tasks, chunksize=chunksize))
+    finally:
+        for shm, _ in shared:
+            shm.close()
+            shm.unlink()
+    results.sort(key=lambda result: result["total"], reverse=True)
+    return results
+
+
+def format_results(results: List[Dict], top: Optional[int] = None) -> str:
+    if not results:
+        return ""
+    names = list(results[0]["params"])
+    n_days = len(results[0]["days"])
+    header = ["rank"] + names + [f"day {i}" for i in range(n_days)] + ["total"]
+    rows = [[str(rank)] + [str(result["params"][name]) for name in names]
+            + [str(pnl) for pnl in result["days"]] + [str(result["total"])]
+            for rank, result in enumerate(results[:top], 1)]
+    return format_table(header, rows)
+
+
+if __name__ == "__main__":
+    from round_3.pairs import Trader
+    grid = {"upper_spread": range(355, 556, 25), "lower_spread": range(205, 406, 25)}
+    results = sweep(Trader, grid, day_files("round_3/round-3-island-data-bottle/prices_round_3_day_*.csv"))
+    print(format_results(results, top=20))
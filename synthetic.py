@@ -0,0 +1,300 @@
+from typing import Dict, List, Sequence, Tuple
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from backtester import POSITION_LIMITS, day_files
+from replay import PRICES_DTYPE, QUOTE_DEPTH, TRADES_DTYPE, read_records
+
+# Synthetic island data in the exact prices_round_*/trades_*_nn layout, for
+# stress and scaling tests beyond the size of the bundled days.
+#
+# Each product is fitted from the bundled days with simple models:
+#   - mid price: AR(1) around its mean, or a random walk when the fitted
+#     coefficient is indistinguishable from 1
+#   - level 1 spread, gaps between levels, volumes, trade quantities and
+#     trade prices relative to the mid: empirical distributions
+#   - presence of levels 2 and 3 and trades per tick: fitted rates
+# Baskets are cointegrated with their components: the basket mid is the
+# weighted component mids plus an AR(1) premium fitted to the day's spread.
+# A market-wide spread regime can widen every spread for stretches of ticks.
+#
+# Files are written chunk by chunk, so memory does not grow with the tick
+# count. Generated timestamps continue past the usual day length when a
+# day has more than 10000 ticks; backtest_days starts the next day after the
+# end of such a long one. Clones of a product (copies > 1) are named
+# PRODUCT_2, PRODUCT_3, ...; position_limits() gives limits for all of them.
+#
+#   python synthetic.py synthetic_data --ticks 1000000 --copies 4 --wide-spread 0.001
+
+BASKETS = {"GIFT_BASKET": {"CHOCOLATE": 4, "STRAWBERRIES": 6, "ROSES": 1}}
+FIT_DAYS = ("round_1/round-1-island-data-bottle/prices_round_1_day_*.csv",
+            "round_3/round-3-island-data-bottle/prices_round_3_day_*.csv")
+CHUNK_TICKS = 10000
+ROUND = 9
+RANDOM_WALK_PHI = 0.999
+DEFAULT_LIMIT = 100
+PRICES_COLUMNS = list(PRICES_DTYPE.names)
+TRADES_COLUMNS = list(TRADES_DTYPE.names)
+
+
+def pmf(values: np.ndarray) -> List[List[float]]:
+    values, counts = np.unique(values, return_counts=True)
+    return [values.tolist(), (counts / counts.sum()).tolist()]
+
+
+def ar1(segments: Sequence[np.ndarray]) -> Tuple[float, float, float]:
+    # (mean, phi, sigma) of values[t] - mean = phi * (values[t - 1] - mean) + noise,
+    # pooled over segments so the jump between two days is not a step
+    mean = float(np.concatenate(segments).mean())
+    x = np.concatenate([values[:-1] for values in segments]) - mean
+    y = np.concatenate([values[1:] for values in segments]) - mean
+    phi = float(x @ y / (x @ x)) if x @ x else 1.0
+    if phi > RANDOM_WALK_PHI:
+        phi = 1.0
+        noise = y - x
+    else:
+        noise = y - phi * x
+    return mean, phi, float(noise.std())
+
+
+def fit(days: Sequence[Tuple[str, str]]) -> Dict[str, Dict]:
+    # Product -> model, from (prices, trades) file pairs
+    quotes: Dict[str, List[np.ndarray]] = {}
+    mids: Dict[str, List[np.ndarray]] = {}
+    trades: Dict[str, List[np.ndarray]] = {}
+    offsets: Dict[str, List[np.ndarray]] = {}
+    for prices_file, trades_file in days:
+        prices = read_records(prices_file, PRICES_DTYPE)
+        day_trades = read_records(trades_file, TRADES_DTYPE)
+        for symbol in np.unique(prices["product"]):
+            product = symbol.decode()
+            rows = prices[(prices["product"] == symbol) & (prices["bid_price_1"] > 0) & (prices["ask_price_1"] > 0)]
+            rows = rows[np.argsort(rows["timestamp"], kind="stable")]
+            mid = (rows["bid_price_1"] + rows["ask_price_1"]) / 2
+            product_trades = day_trades[day_trades["symbol"] == symbol]
+            # Trade prices relative to the mid quoted at the same tick
+            at = np.searchsorted(rows["timestamp"], product_trades["timestamp"]).clip(0, len(rows) - 1)
+            quotes.setdefault(product, []).append(rows)
+            mids.setdefault(product, []).append(mid)
+            trades.setdefault(product, []).append(product_trades)
+            offsets.setdefault(product, []).append(np.round((product_trades["price"] - mid[at]) * 2) / 2)
+
+    models = {}
+    for product in quotes:
+        rows = np.concatenate(quotes[product])
+        product_trades = np.concatenate(trades[product])
+        product_offsets = np.concatenate(offsets[product])
+        mean, phi, sigma = ar1(mids[product])
+        gaps = [np.ones(1, dtype=np.int32)]
+        deep_volumes = [np.ones(1, dtype=np.int32)]
+        for side in ("bid", "ask"):
+            for level in range(2, QUOTE_DEPTH + 1):
+                present = rows[f"{side}_price_{level}"] > 0
+                gaps.append(np.abs(rows[f"{side}_price_{level}"] - rows[f"{side}_price_{level - 1}"])[present])
+                deep_volumes.append(rows[f"{side}_volume_{level}"][present])
+        if sum(map(len, gaps)) > 1:
+            gaps, deep_volumes = gaps[1:], deep_volumes[1:]
+        models[product] = {
+            "mean": mean, "phi": phi, "sigma": sigma,
+            "spread": pmf(rows["ask_price_1"] - rows["bid_price_1"]),
+            "level_rates": [float((rows[f"bid_price_{level}"] > 0).mean()) for level in range(2, QUOTE_DEPTH + 1)],
+            "gap": pmf(np.concatenate(gaps)),
+            "volume": pmf(np.concatenate([rows["bid_volume_1"], rows["ask_volume_1"]])),
+            "deep_volume": pmf(np.concatenate(deep_volumes)),
+            "trade_rate": len(product_trades) / len(rows),
+            "trade_offset": pmf(product_offsets) if len(product_offsets) else [[0.0], [1.0]],
+            "trade_quantity": pmf(product_trades["quantity"]) if len(product_trades) else [[1], [1.0]],
+            "limit": POSITION_LIMITS.get(product, DEFAULT_LIMIT),
+        }
+    for basket, weights in BASKETS.items():
+        if basket in models and all(component in models for component in weights):
+            premiums = []
+            for day, rows in enumerate(quotes[basket]):
+                premium = mids[basket][day].copy()
+                for component, weight in weights.items():
+                    component_rows = quotes[component][day]
+                    at = np.searchsorted(component_rows["timestamp"], rows["timestamp"]).clip(0, len(component_rows) - 1)
+                    premium -= weight * mids[component][day][at]
+                premiums.append(premium)
+            mean, phi, sigma = ar1(premiums)
+            models[basket]["basket"] = {"weights": weights, "mean": mean, "phi": phi, "sigma": sigma}
+    return models
+
+
+def clone_models(models: Dict[str, Dict], copies: int) -> Dict[str, Dict]:
+    # copies of every product; basket clones are built from the clones of
+    # their components with the same suffix
+    cloned = {}
+    for copy in range(1, copies + 1):
+        suffix = "" if copy == 1 else f"_{copy}"
+        for product, model in models.items():
+            model = dict(model)
+            if "basket" in model:
+                basket = dict(model["basket"])
+                basket["weights"] = {component + suffix: weight for component, weight in basket["weights"].items()}
+                model["basket"] = basket
+            cloned[product + suffix] = model
+    return cloned
+
+
+def position_limits(models: Dict[str, Dict]) -> Dict[str, int]:
+    return {product: model["limit"] for product, model in models.items()}
+
+
+def sample(rng: np.random.Generator, distribution: List[List[float]], n: int) -> np.ndarray:
+    values, probabilities = distribution
+    return np.asarray(values)[rng.choice(len(values), size=n, p=probabilities)]
+
+
+def ar1_path(rng: np.random.Generator, start: float, mean: float, phi: float, sigma: float, n: int) -> np.ndarray:
+    # n steps after start; ewm(adjust=False) runs the AR(1) recursion in C
+    noise = rng.normal(0.0, sigma, n)
+    if phi == 1.0:
+        return start + np.cumsum(noise)
+    inputs = np.concatenate([[start - mean], noise / (1 - phi)])
+    path = pd.Series(inputs).ewm(alpha=1 - phi, adjust=False).mean().to_numpy()[1:]
+    return mean + path
+
+
+class Generator:
+    def __init__(self, models: Dict[str, Dict], max_levels: int = QUOTE_DEPTH, wide_spread: float = 0.0,
+                 wide_scale: int = 3, wide_length: int = 200, seed: int = 0):
+        # wide_spread is the chance per tick of entering the wide regime,
+        # which lasts wide_length ticks on average and multiplies spreads
+        # by wide_scale
+        if not 1 <= max_levels <= QUOTE_DEPTH:
+            raise ValueError(f"max_levels must be between 1 and {QUOTE_DEPTH}")
+        self.models = models
+        self.products = list(models)
+        self.max_levels = max_levels
+        self.wide_spread = wide_spread
+        self.wide_scale = wide_scale
+        self.wide_length = wide_length
+        self.rng = np.random.default_rng(seed)
+        # Process state carried from chunk to chunk
+        self.mids = {product: model["mean"] for product, model in models.items()}
+        self.premiums = {product: model["basket"]["mean"] for product, model in models.items() if "basket" in model}
+        self.wide = False
+
+    def regimes(self, n: int) -> np.ndarray:
+        # Two-state Markov chain drawn as alternating geometric run lengths
+        wide = np.zeros(n, dtype=bool)
+        if not self.wide_spread:
+            return wide
+        filled = 0
+        while filled < n:
+            leave = 1 / self.wide_length if self.wide else self.wide_spread
+            run = int(self.rng.geometric(leave))
+            wide[filled:filled + run] = self.wide
+            filled += run
+            if filled <= n:
+                self.wide = not self.wide
+        return wide
+
+    def chunk(self, day: int, start_tick: int, n: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        rng = self.rng
+        timestamps = (start_tick + np.arange(n, dtype=np.int64)) * 100
+        scale = np.where(self.regimes(n), self.wide_scale, 1)
+        mids = {}
+        for product, model in self.models.items():
+            if "basket" not in model:
+                mids[product] = ar1_path(rng, self.mids[product], model["mean"], model["phi"], model["sigma"], n)
+                self.mids[product] = mids[product][-1]
+        for product, model in self.models.items():
+            if "basket" in model:
+                basket = model["basket"]
+                premium = ar1_path(rng, self.premiums[product], basket["mean"], basket["phi"], basket["sigma"], n)
+                self.premiums[product] = premium[-1]
+                mids[product] = premium + sum(weight * mids[component] for component, weight in basket["weights"].items())
+
+        prices = []
+        trades = []
+        for product in self.products:
+            model = self.models[product]
+            mid = mids[product]
+            spread = np.maximum(sample(rng, model["spread"], n).astype(np.int64) * scale, 1)
+            bid = np.floor(mid - spread / 2).astype(np.int64)
+            ask = bid + spread
+            columns = {"day": np.full(n, day), "timestamp": timestamps, "product": np.full(n, product)}
+            present = np.ones(n, dtype=bool)
+            bid_price, ask_price = bid, ask
+            for level in range(1, QUOTE_DEPTH + 1):
+                if level > 1:
+                    rate = model["level_rates"][level - 2]
+                    previous = model["level_rates"][level - 3] if level > 2 else 1.0
+                    present = present & (rng.random(n) < (rate / previous if previous else 0.0))
+                    if level > self.max_levels:
+                        present[:] = False
+                    bid_price = bid_price - sample(rng, model["gap"], n).astype(np.int64)
+                    ask_price = ask_price + sample(rng, model["gap"], n).astype(np.int64)
+                volume = model["volume"] if level == 1 else model["deep_volume"]
+                for side, side_price in (("bid", bid_price), ("ask", ask_price)):
+                    columns[f"{side}_price_{level}"] = pd.array(np.where(present, side_price, 0), dtype="Int64")
+                    columns[f"{side}_volume_{level}"] = pd.array(sample(rng, volume, n).astype(np.int64), dtype="Int64")
+                    columns[f"{side}_price_{level}"][~present] = pd.NA
+                    columns[f"{side}_volume_{level}"][~present] = pd.NA
+            columns["mid_price"] = (bid + ask) / 2
+            columns["profit_and_loss"] = np.zeros(n)
+            prices.append(pd.DataFrame(columns, columns=PRICES_COLUMNS))
+
+            counts = rng.poisson(model["trade_rate"], n)
+            ticks = np.repeat(np.arange(n), counts)
+            trades.append(pd.DataFrame({
+                "timestamp": timestamps[ticks],
+                "buyer": "", "seller": "", "symbol": product, "currency": "SEASHELLS",
+                "price": np.rint(mid[ticks] + sample(rng, model["trade_offset"], len(ticks))),
+                "quantity": sample(rng, model["trade_quantity"], len(ticks)).astype(np.int64),
+            }, columns=TRADES_COLUMNS))
+        # Rows in timestamp order, products in a fixed order within a tick
+        prices = pd.concat(prices).sort_values("timestamp", kind="stable")
+        trades = pd.concat(trades).sort_values("timestamp", kind="stable")
+        return prices, trades
+
+    def write_day(self, directory: str, day: int, ticks: int, round_number: int = ROUND,
+                  chunk_ticks: int = CHUNK_TICKS) -> Tuple[str, str]:
+        os.makedirs(directory, exist_ok=True)
+        prices_file = os.path.join(directory, f"prices_round_{round_number}_day_{day}.csv")
+        trades_file = os.path.join(directory, f"trades_round_{round_number}_day_{day}_nn.csv")
+        with open(prices_file, "w", newline="") as prices_out, open(trades_file, "w", newline="") as trades_out:
+            for start in range(0, ticks, chunk_ticks):
+                prices, trades = self.chunk(day, start, min(chunk_ticks, ticks - start))
+                prices.to_csv(prices_out, sep=";", index=False, header=start == 0)
+                trades.to_csv(trades_out, sep=";", index=False, header=start == 0)
+        return prices_file, trades_file
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Write synthetic prices/trades files fitted to the bundled days")
+    parser.add_argument("directory")
+    parser.add_argument("--ticks", type=int, default=10000, help="ticks per day")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--copies", type=int, default=1, help="clones of every fitted product")
+    parser.add_argument("--products", nargs="*", help="fitted products to keep (default all)")
+    parser.add_argument("--levels", type=int, default=QUOTE_DEPTH, help="deepest quote level")
+    parser.add_argument("--wide-spread", type=float, default=0.0, help="chance per tick of a wide spread regime")
+    parser.add_argument("--wide-scale", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fit", nargs="*", default=list(FIT_DAYS), help="prices files to fit, globs allowed")
+    args = parser.parse_args(argv)
+
+    models = fit(day_files(args.fit))
+    if args.products:
+        models = {product: model for product, model in models.items() if product in args.products}
+        for product, model in list(models.items()):
+            if "basket" in model and not all(component in models for component in model["basket"]["weights"]):
+                del model["basket"]
+    models = clone_models(models, args.copies)
+    generator = Generator(models, args.levels, args.wide_spread, args.wide_scale, seed=args.seed)
+    for day in range(args.days):
+        for path in generator.write_day(args.directory, day, args.ticks):
+            print(path)
+    with open(os.path.join(args.directory, "position_limits.json"), "w") as f:
+        json.dump(position_limits(models), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,138 @@
+import json
+import pytest
+from backtester import DAY_LENGTH, MatchingEngine, backtest_days, day_files, load_csv_day
+from logger import logger, OFF
+from replay import MarketReplay
+from round_1 import round1
+
+logger.configure(level=OFF)
+
+ROUND_1 = "round_1/round-1-island-data-bottle/"
+ROUND_3 = "round_3/round-3-island-data-bottle/"
+
+
+def round_1_day() -> MarketReplay:
+    return MarketReplay.from_csv(ROUND_1 + "prices_round_1_day_0.csv", ROUND_1 + "trades_round_1_day_0_nn.csv")
+
+
+class PositionTrader:
+    # Records the timestamp and positions each tick starts with
+    def __init__(self):
+        self.trader = round1.Trader()
+        self.ticks = []
+
+    def run(self, state):
+        self.ticks.append((state.timestamp, dict(state.position)))
+        return self.trader.run(state)
+
+
+class RecordingTrader:
+    # Keeps what each tick's state serializes to and sends the wrapped
+    # trader's orders, or none
+    def __init__(self, trader=None):
+        self.trader = trader
+        self.states = []
+
+    def run(self, state):
+        self.states.append(state.toJSON())
+        return self.trader.run(state) if self.trader is not None else ({}, None, "")
+
+
+def test_trading_state_serializes_to_json():
+    trader = RecordingTrader()
+    engine = MatchingEngine(trader, round_1_day(), 3)
+    for _ in range(3):
+        engine.run_iteration()
+    state = json.loads(trader.states[-1])
+    assert state["timestamp"] == 200
+    assert set(state["order_depths"]) == {"AMETHYSTS", "STARFRUIT"}
+
+
+def test_reused_books_match_fresh_books():
+    market = round_1_day()
+    runs = []
+    for reuse_books in (True, False):
+        trader = RecordingTrader(round1.Trader())
+        engine = MatchingEngine(trader, market, 1000, reuse_books=reuse_books)
+        for _ in range(1000):
+            engine.run_iteration()
+        runs.append((trader.states, engine.product_pnl(), engine.state.position))
+    assert runs[0] == runs[1]
+
+
+def test_reused_books_keep_their_objects():
+    engine = MatchingEngine(round1.Trader(), round_1_day(), 1000)
+    engine.run_iteration()
+    books, depths = list(engine.order_books), list(engine.order_depths)
+    pooled = []
+    for _ in range(999):
+        engine.run_iteration()
+        pooled.append(len(engine.order_pool))
+    assert all(a is b for a, b in zip(books + depths, engine.order_books + engine.order_depths))
+    assert engine.state.order_depths["STARFRUIT"] is depths[engine.product_ids["STARFRUIT"]]
+    # Cleared orders go back to the pool, which stays as small as one tick's books
+    assert 0 < max(pooled) < 20
+
+
+def test_day_files_are_paired_in_day_order():
+    days = day_files(ROUND_1 + "prices_round_1_day_*.csv")
+    assert days == [(ROUND_1 + f"prices_round_1_day_{day}.csv", ROUND_1 + f"trades_round_1_day_{day}_nn.csv")
+                    for day in (-2, -1, 0)]
+
+
+def test_days_run_back_to_back_with_positions_carried_over(capsys):
+    trader = PositionTrader()
+    loaded = []
+
+    def load(day):
+        # Each day is loaded only once the previous one has finished
+        loaded.append(len(trader.ticks))
+        return load_csv_day(day)
+
+    day_pnl = backtest_days(trader, day_files(ROUND_1 + "prices_round_1_day_*.csv"), 200, load=load)
+    lines = capsys.readouterr().out.splitlines()
+    assert loaded == [0, 200, 400]
+    assert [timestamp for timestamp, _ in trader.ticks] == [day * DAY_LENGTH + tick * 100
+                                                           for day in range(3) for tick in range(200)]
+    # The second day starts from the position the first day closed with
+    first_day = MatchingEngine(round1.Trader(), load_csv_day(day_files(ROUND_1 + "prices_round_1_day_-2.csv")[0]), 200)
+    for _ in range(200):
+        first_day.run_iteration()
+    assert any(first_day.state.position.values())
+    assert trader.ticks[200][1] == first_day.state.position
+    assert len(day_pnl) == 3
+    cumulative = sum(sum(pnl.values()) for pnl in day_pnl)
+    assert lines[-1] == f"prices_round_1_day_0.csv Profit/Loss: {sum(day_pnl[-1].values())} (cumulative {cumulative})"
+
+
+def test_products_come_from_the_market_data():
+    engine = MatchingEngine(round1.Trader(), round_1_day(), 100)
+    assert engine.products == ["AMETHYSTS", "STARFRUIT"]
+    assert engine.product_ids == {"AMETHYSTS": 0, "STARFRUIT": 1}
+    assert set(engine.state.position) == set(engine.state.listings) == {"AMETHYSTS", "STARFRUIT"}
+    for _ in range(100):
+        engine.run_iteration()
+    position = dict(engine.state.position)
+    # A later day with other products appends them after the known ones
+    round_3 = MarketReplay.from_csv(ROUND_3 + "prices_round_3_day_2.csv", ROUND_3 + "trades_round_3_day_2_nn.csv")
+    engine.load_day(round_3, 10, DAY_LENGTH)
+    assert engine.products[:2] == ["AMETHYSTS", "STARFRUIT"]
+    assert set(engine.products[2:]) == set(round_3.products) and len(engine.order_books) == 6
+    assert {product: engine.state.position[product] for product in position} == position
+
+
+def test_product_without_a_position_limit_is_rejected():
+    with pytest.raises(ValueError, match="No position limit configured for STARFRUIT"):
+        MatchingEngine(round1.Trader(), round_1_day(), 10, position_limits={"AMETHYSTS": 20})
+
+
+def test_configured_position_limits_cap_positions():
+    def largest_position(position_limits):
+        trader = PositionTrader()
+        engine = MatchingEngine(trader, round_1_day(), 500, position_limits=position_limits)
+        for _ in range(500):
+            engine.run_iteration()
+        return max(abs(position.get("AMETHYSTS", 0)) for _, position in trader.ticks)
+
+    assert largest_position(None) > 3
+    assert largest_position({"AMETHYSTS": 3, "STARFRUIT": 20}) <= 3
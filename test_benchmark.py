@@ -0,0 +1,20 @@
+from benchmark import compare
+
+
+def results(seconds):
+    return {"scenarios": {f"day{i}": {"seconds": value, "ticks_per_sec": 1000 / value, "peak_rss_mb": 80.0}
+                          for i, value in enumerate(seconds)}}
+
+
+def test_one_noisy_scenario_is_not_a_regression():
+    assert compare(results([1.3, 1.0, 1.0, 1.0]), results([1.0] * 4)) == []
+
+
+def test_suite_wide_slowdown_is_a_regression():
+    regressions = compare(results([1.15] * 4), results([1.0] * 4))
+    assert regressions == ["suite seconds geometric mean over 4 scenarios: +15.0%"]
+
+
+def test_large_change_in_one_scenario_is_a_regression():
+    regressions = compare(results([2.0, 1.0, 1.0, 1.0]), results([1.0] * 4))
+    assert "day0 seconds: 1 -> 2 (+100.0%)" in regressions
@@ -0,0 +1,60 @@
+import io
+import os
+import contextlib
+import pytest
+from backtester import MatchingEngine, SNAPSHOT_EXCLUDED
+from branch import branch, run_to_end, run_until
+from logger import logger, OFF
+from profiling import LatencyBudget, Profiler
+from recorder import Recorder
+from replay import MarketReplay
+from round_3.pairs import Trader
+
+logger.configure(level=OFF)
+
+ROUND_3 = "round_3/round-3-island-data-bottle/"
+TICKS = 3000
+POINTS = [{}, {"upper_spread": 355, "lower_spread": 205}]
+
+
+def round_3_day() -> MarketReplay:
+    return MarketReplay.from_csv(ROUND_3 + "prices_round_3_day_2.csv", ROUND_3 + "trades_round_3_day_2_nn.csv")
+
+
+def prefix_engine(market: MarketReplay, **engine_kwargs) -> MatchingEngine:
+    engine = MatchingEngine(Trader(), market, TICKS, **engine_kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_until(engine, TICKS * 50)
+    return engine
+
+
+def test_branch_matches_a_straight_run():
+    market = round_3_day()
+    straight = MatchingEngine(Trader(), market, TICKS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = run_to_end(straight)
+    results = branch(prefix_engine(market), Trader, [{}], fork=False)
+    assert results[0]["pnl"] == expected
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_and_checkpoint_branches_agree():
+    engine = prefix_engine(round_3_day())
+    assert branch(engine, Trader, POINTS, fork=True) == branch(engine, Trader, POINTS, fork=False)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_branches_drop_the_parents_latency_budget():
+    # Every call in the prefix times out. Branches run without the budget
+    # whether forked or restored from a checkpoint.
+    engine = prefix_engine(round_3_day(), latency=LatencyBudget(budget_ns=1), recorder=Recorder())
+    assert engine.latency.timeouts
+    assert branch(engine, Trader, POINTS, fork=True) == branch(engine, Trader, POINTS, fork=False)
+
+
+def test_detach_resets_every_snapshot_excluded_attribute():
+    market = round_3_day()
+    engine = prefix_engine(market, profiler=Profiler(), recorder=Recorder(), latency=LatencyBudget())
+    engine.detach(market)
+    assert engine.market is market
+    assert all(not getattr(engine, name) for name in SNAPSHOT_EXCLUDED if name != "market")
@@ -0,0 +1,97 @@
+import numpy as np
+from backtester import MatchingEngine, backtest_days
+from datamodel import Order
+from logger import logger, OFF
+from replay import MarketReplay, ObservationReplay, SyntheticBook, OBSERVATIONS_DTYPE, TRADES_DTYPE
+from round_3 import round3
+
+ROUND_1 = "round_1/round-1-island-data-bottle/"
+ROUND_3 = "round_3/round-3-island-data-bottle/"
+OBSERVATIONS = "round_2/round-2-island-data-bottle/prices_round_2_day_1.csv"
+
+# South bid and ask 1100, synthetic local book 1098 / 1102, 10 each side
+BOOK = SyntheticBook(spread=4, volume=10)
+TRANSPORT_FEES = 1.0
+EXPORT_TARIFF = 0.5
+IMPORT_TARIFF = -2.0
+
+
+class ScriptedTrader:
+    # Sends the orders and conversions scripted for each tick
+    def __init__(self, script):
+        self.script = script
+        self.tick = 0
+
+    def run(self, state):
+        orders, conversions = self.script[self.tick] if self.tick < len(self.script) else ([], 0)
+        self.tick += 1
+        return {"ORCHIDS": orders}, conversions, ""
+
+
+def orchids_market(ticks: int, synthetic_book: bool = True) -> MarketReplay:
+    records = np.zeros(ticks, OBSERVATIONS_DTYPE)
+    records["timestamp"] = np.arange(ticks) * 100
+    records["orchids"] = 1100.0
+    records["transport_fees"] = TRANSPORT_FEES
+    records["export_tariff"] = EXPORT_TARIFF
+    records["import_tariff"] = IMPORT_TARIFF
+    observations = ObservationReplay.from_records(records, synthetic_book=BOOK if synthetic_book else None)
+    return MarketReplay.from_records(observations.quote_records(BOOK), np.zeros(0, TRADES_DTYPE), "orchids", observations)
+
+
+def run(trader, market: MarketReplay):
+    logger.configure(level=OFF)
+    engine = MatchingEngine(trader, market, len(market))
+    positions = []
+    for _ in range(len(market)):
+        profit = engine.run_iteration()
+        positions.append(engine.state.position["ORCHIDS"])
+    return positions, profit["ORCHIDS"]
+
+
+def test_orders_fill_against_synthetic_book_up_to_quoted_volume():
+    positions, _ = run(ScriptedTrader([([Order("ORCHIDS", 1102, 15)], 0)]), orchids_market(2))
+    assert positions == [10, 10]
+
+
+def test_long_position_converts_and_pays_fees():
+    script = [
+        ([Order("ORCHIDS", 1102, 10)], 0),
+        ([], 0),
+        ([], -10),
+    ]
+    positions, pnl = run(ScriptedTrader(script), orchids_market(3))
+    assert positions == [10, 10, 0]
+    bought = -10 * 1102
+    storage = -0.1 * 10  # one tick held long
+    exported = 10 * (1100 - TRANSPORT_FEES - EXPORT_TARIFF)
+    assert pnl == bought + storage + exported
+
+
+def test_conversion_that_grows_the_position_is_ignored():
+    script = [
+        ([Order("ORCHIDS", 1102, 10)], 0),
+        ([], 5),
+    ]
+    positions, _ = run(ScriptedTrader(script), orchids_market(2))
+    assert positions == [10, 10]
+
+
+def test_quotes_of_recorded_books_do_not_fill():
+    positions, _ = run(ScriptedTrader([([Order("ORCHIDS", 1102, 10)], 0)]), orchids_market(2, synthetic_book=False))
+    assert positions == [0, 0]
+
+
+def test_observation_day_runs_its_default_length(capsys):
+    # The observation file has one more tick than the prices files
+    day = ([ROUND_1 + "prices_round_1_day_0.csv", ROUND_3 + "prices_round_3_day_2.csv"],
+           [ROUND_1 + "trades_round_1_day_0_nn.csv", ROUND_3 + "trades_round_3_day_2_nn.csv"])
+
+    def load(day):
+        return MarketReplay.from_csv(*day, observations_file=OBSERVATIONS, synthetic_book=BOOK)
+
+    assert len(load(day)) == 10000
+    logger.configure(level=OFF)
+    day_pnl = backtest_days(round3.Trader(), [day], load=load)
+    assert len(day_pnl) == 1 and "ORCHIDS" in day_pnl[0]
+    assert f"ORCHIDS Profit/Loss: {day_pnl[0]['ORCHIDS']} (simulated on {BOOK})" in capsys.readouterr().out
@@ -0,0 +1,45 @@
+from functools import partial
+from backtester import MatchingEngine
+from differential import REFERENCE, Case, lockstep, random_case, run
+from logger import logger, OFF
+
+logger.configure(level=OFF)
+
+
+class CrashingTrader:
+    def __init__(self):
+        self.ticks = 0
+
+    def run(self, state):
+        self.ticks += 1
+        if self.ticks == 5:
+            raise RuntimeError("crash")
+        return {}, None, "state"
+
+
+def crashing_case() -> Case:
+    case = random_case(0, ticks=20)
+    return Case("crashing", f"{__name__}:CrashingTrader", case.prices, case.trades)
+
+
+def test_identical_engines_do_not_diverge():
+    assert lockstep(random_case(0, ticks=50), {"same": MatchingEngine}) == {}
+
+
+def test_crashing_reference_is_a_failure():
+    divergences = lockstep(crashing_case(), {"same": MatchingEngine})
+    assert list(divergences) == [REFERENCE]
+    assert divergences[REFERENCE]["tick"] == 4
+    assert divergences[REFERENCE]["actual"] == "RuntimeError: crash"
+    assert run([crashing_case()], {"same": MatchingEngine}) == 1
+
+
+def test_candidate_error_differing_from_the_reference_diverges():
+    # The candidate rejects the traderData the reference accepts
+    case = random_case(0, ticks=20)
+    case = Case("limit", f"{__name__}:CrashingTrader", case.prices, case.trades)
+    divergences = lockstep(case, {"limited": partial(MatchingEngine, trader_data_limit=1)})
+    assert divergences["limited"]["field"] == "error"
+    assert divergences["limited"]["tick"] == 0
+    assert divergences["limited"]["expected"] is None
+    assert divergences["limited"]["actual"].startswith("ValueError")
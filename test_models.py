@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+from models import RecursiveAR
+
+PRICES = "round_1/round-1-island-data-bottle/prices_round_1_day_0.csv"
+ORDER = 4
+CHECKPOINTS = [ORDER + 1, 50, 500, 2000, 9998]
+
+
+def starfruit_returns() -> np.ndarray:
+    prices = pd.read_csv(PRICES, sep=";")
+    mid = prices[prices["product"] == "STARFRUIT"]["mid_price"].to_numpy(np.float64)
+    return np.diff(mid)
+
+
+def batch_coef(series: np.ndarray, end: int, forgetting: float = 1.0, window=None) -> np.ndarray:
+    # lstsq over the rows (series[t - ORDER:t], series[t]) for t < end,
+    # oldest rows discounted by forgetting and cut to the last window
+    X = np.array([series[t - ORDER:t] for t in range(ORDER, end)])
+    Y = series[ORDER:end]
+    if window is not None:
+        X, Y = X[-window:], Y[-window:]
+    weights = np.sqrt(forgetting ** np.arange(len(Y) - 1, -1, -1, dtype=np.float64))
+    return np.linalg.lstsq(X * weights[:, None], Y * weights, rcond=None)[0]
+
+
+@pytest.mark.parametrize("forgetting, window", [(1.0, None), (0.99, None), (1.0, 100), (0.995, 200)])
+def test_recursive_fit_matches_batch_lstsq(forgetting, window):
+    series = starfruit_returns()
+    model = RecursiveAR(ORDER, forgetting=forgetting, window=window)
+    end = 0
+    for checkpoint in CHECKPOINTS:
+        for value in series[end:checkpoint]:
+            model.update(value)
+        end = checkpoint
+        expected = batch_coef(series, end, forgetting, window)
+        np.testing.assert_allclose(model.coef, expected, rtol=1e-6, atol=1e-9)
+        assert model.predict() == pytest.approx(series[end - ORDER:end] @ expected, rel=1e-6, abs=1e-9)
+
+
+def test_restored_model_continues_the_fit():
+    series = starfruit_returns()
+    model = RecursiveAR(ORDER, window=100, history=series[:300])
+    restored = RecursiveAR.from_state(model.to_state())
+    for value in series[300:600]:
+        model.update(value)
+        restored.update(value)
+    assert restored.coef == model.coef
+    np.testing.assert_allclose(model.coef, batch_coef(series, 600, window=100), rtol=1e-6, atol=1e-9)
@@ -0,0 +1,148 @@
+import random
+import numpy as np
+from backtester import DetailedOrder, MatchingEngine, OrderBook
+from datamodel import Order
+from logger import logger, OFF
+from replay import MarketReplay, PRICES_DTYPE, TRADES_DTYPE
+
+logger.configure(level=OFF)
+
+PRODUCT = "AMETHYSTS"
+
+
+class ScriptedTrader:
+    # Sends the orders scripted for each tick
+    def __init__(self, script):
+        self.script = script
+        self.tick = 0
+
+    def run(self, state):
+        orders = self.script[self.tick] if self.tick < len(self.script) else []
+        self.tick += 1
+        return {PRODUCT: orders}, None, ""
+
+
+def quiet_market(ticks: int, trades=()) -> MarketReplay:
+    # One product quoted 95 / 105 every tick; trades are (tick, price, quantity)
+    prices = np.zeros(ticks, PRICES_DTYPE)
+    prices["timestamp"] = np.arange(ticks) * 100
+    prices["product"] = PRODUCT
+    prices["bid_price_1"] = 95
+    prices["bid_volume_1"] = 10
+    prices["ask_price_1"] = 105
+    prices["ask_volume_1"] = 10
+    records = np.array([(tick * 100, b"", b"", PRODUCT.encode(), b"SEASHELLS", price, quantity)
+                        for tick, price, quantity in trades], TRADES_DTYPE)
+    return MarketReplay.from_records(prices, records)
+
+
+def resting(engine: MatchingEngine, price: int):
+    book = engine.order_books[engine.product_ids[PRODUCT]]
+    level = book.bids.get(price) or book.asks.get(price)
+    return [(order.order_id, order.order.quantity) for order in level] if level else []
+
+
+def run_ticks(engine: MatchingEngine, ticks: int) -> list:
+    snapshots = []
+    for _ in range(ticks):
+        engine.run_iteration()
+        snapshots.append(resting(engine, 100))
+    return snapshots
+
+
+def book_with(*quantities) -> OrderBook:
+    book = OrderBook()
+    for order_id, quantity in enumerate(quantities, 1):
+        book.add_bid(100, DetailedOrder(Order(PRODUCT, 100, quantity), "SUBMISSION", order_id))
+    return book
+
+
+def queue(book: OrderBook):
+    return [(order.order_id, order.order.quantity) for order in book.bids[100]]
+
+
+def test_level_cancel_unlinks_any_order():
+    book = book_with(1, 2, 3)
+    book.cancel(2)
+    assert queue(book) == [(1, 1), (3, 3)]
+    book.cancel(1)
+    book.cancel(3)
+    assert 100 not in book.bids and not book.orders
+
+
+def test_amend_down_keeps_priority_and_up_loses_it():
+    book = book_with(5, 5)
+    book.amend(1, 2)
+    assert queue(book) == [(1, 2), (2, 5)]
+    book.amend(1, 6)
+    assert queue(book) == [(2, 5), (1, 6)]
+
+
+def test_best_prices_skip_emptied_and_readded_levels():
+    rng = random.Random(0)
+    book = OrderBook()
+    for order_id in range(1, 2001):
+        if book.orders and rng.random() < 0.45:
+            book.cancel(rng.choice(list(book.orders)))
+        else:
+            price = rng.randrange(90, 110)
+            order = DetailedOrder(Order(PRODUCT, price, rng.choice([-1, 1]) * rng.randrange(1, 5)), "", order_id)
+            (book.add_bid if order.order.quantity > 0 else book.add_ask)(price, order)
+        assert book.best_bid() == max(book.bids, default=None)
+        assert book.best_ask() == min(book.asks, default=None)
+
+
+def test_bot_trade_sweeps_bids_from_the_best_price_down():
+    script = [[Order(PRODUCT, 98, 5), Order(PRODUCT, 100, 5), Order(PRODUCT, 99, 5)]]
+    engine = MatchingEngine(ScriptedTrader(script), quiet_market(1, [(0, 98, 12)]), 1)
+    engine.run_iteration()
+    own_trades = engine.state.own_trades[PRODUCT]
+    assert [(trade.price, trade.quantity) for trade in own_trades] == [(100, 5), (99, 5), (98, 2)]
+    assert engine.state.position[PRODUCT] == 12
+
+
+def test_resubmitted_order_keeps_its_place():
+    script = [[Order(PRODUCT, 100, 5)], [Order(PRODUCT, 100, 5), Order(PRODUCT, 100, 2)], [Order(PRODUCT, 100, 7)]]
+    engine = MatchingEngine(ScriptedTrader(script), quiet_market(3), 3, persistent_books=True)
+    first, second, third = run_ticks(engine, 3)
+    assert len(first) == 1
+    assert second[0] == first[0] and second[1][1] == 2
+    assert third == second
+
+
+def test_smaller_resubmission_amends_oldest_first_and_cancels_the_rest():
+    script = [[Order(PRODUCT, 100, 5)], [Order(PRODUCT, 100, 5), Order(PRODUCT, 100, 2)], [Order(PRODUCT, 100, 4)]]
+    engine = MatchingEngine(ScriptedTrader(script), quiet_market(3), 3, persistent_books=True)
+    first, second, third = run_ticks(engine, 3)
+    assert third == [(first[0][0], 4)]
+
+
+def test_orders_not_resubmitted_are_cancelled():
+    script = [[Order(PRODUCT, 100, 5)], []]
+    engine = MatchingEngine(ScriptedTrader(script), quiet_market(2), 2, persistent_books=True)
+    first, second = run_ticks(engine, 2)
+    assert len(first) == 1 and second == []
+    assert not engine.order_books[engine.product_ids[PRODUCT]].orders
+
+
+def test_older_order_fills_first():
+    # A bot sells 3 at 100 on the third tick: the order kept since the first
+    # tick fills before the one added on the second
+    script = [[Order(PRODUCT, 100, 5)], [Order(PRODUCT, 100, 5), Order(PRODUCT, 100, 5)],
+              [Order(PRODUCT, 100, 5), Order(PRODUCT, 100, 5)]]
+    engine = MatchingEngine(ScriptedTrader(script), quiet_market(3, [(2, 100, 3)]), 3, persistent_books=True)
+    first, second, third = run_ticks(engine, 3)
+    assert third == [(first[0][0], 2), second[1]]
+    assert engine.state.position[PRODUCT] == 3
+
+
+def test_kept_order_trades_with_a_crossing_order_like_without_persistent_books():
+    script = [[Order(PRODUCT, 100, 5)], [Order(PRODUCT, 100, 5), Order(PRODUCT, 99, -5)]]
+    results = []
+    for persistent_books in (False, True):
+        engine = MatchingEngine(ScriptedTrader(script), quiet_market(2), 2, persistent_books=persistent_books)
+        engine.run_iteration()
+        engine.run_iteration()
+        own_trades = engine.state.own_trades[PRODUCT]
+        results.append([(trade.price, trade.quantity) for trade in own_trades])
+    assert results[0] == results[1] == [(100, 5)]
@@ -0,0 +1,76 @@
+import time
+import pytest
+from backtester import MatchingEngine
+from datamodel import Order
+from logger import logger, OFF
+from profiling import LatencyBudget, TraderTimeout
+from replay import MarketReplay
+
+logger.configure(level=OFF)
+
+ROUND_1 = "round_1/round-1-island-data-bottle/"
+BUDGET_NS = 5_000_000
+SLOW_TICKS = (3, 7)
+
+
+class SlowTrader:
+    # Bids above the market every tick and sends the tick number as
+    # traderData, sleeping past the budget on SLOW_TICKS
+    def __init__(self):
+        self.tick = 0
+        self.seen = []
+        self.positions = []
+
+    def run(self, state):
+        self.seen.append(state.traderData)
+        self.positions.append(state.position.get("AMETHYSTS", 0))
+        if self.tick in SLOW_TICKS:
+            time.sleep(4 * BUDGET_NS / 1e9)
+        self.tick += 1
+        return {"AMETHYSTS": [Order("AMETHYSTS", 10010, 5)]}, None, str(self.tick - 1)
+
+
+def run(on_timeout: str, ticks: int = 10):
+    market = MarketReplay.from_csv(ROUND_1 + "prices_round_1_day_0.csv", ROUND_1 + "trades_round_1_day_0_nn.csv")
+    trader = SlowTrader()
+    latency = LatencyBudget(budget_ns=BUDGET_NS, on_timeout=on_timeout)
+    engine = MatchingEngine(trader, market, ticks, latency=latency)
+    for _ in range(ticks):
+        engine.run_iteration()
+    return engine, trader
+
+
+def test_timed_out_ticks_are_discarded():
+    discarded, trader = run("discard")
+    kept, kept_trader = run("keep")
+    assert discarded.latency.timeouts == kept.latency.timeouts == [300, 700]
+    # The exchange keeps the traderData from before the timeout and drops
+    # the orders, so the bot trades at timestamp 300 only fill the kept bid
+    assert trader.seen[4] == "2" and trader.seen[5] == "4"
+    assert trader.positions[4] == trader.positions[3]
+    assert kept_trader.positions[4] > kept_trader.positions[3]
+
+
+def test_kept_ticks_use_the_late_result():
+    _, trader = run("keep")
+    assert trader.seen[1:] == [str(tick) for tick in range(9)]
+
+
+def test_raise_stops_at_the_first_timeout():
+    with pytest.raises(TraderTimeout, match="at timestamp 300"):
+        run("raise")
+
+
+def test_report_lists_the_slowest_ticks():
+    engine, _ = run("discard")
+    latency = engine.latency
+    assert [timestamp for timestamp, _ in latency.worst_ticks()[:2]] in ([300, 700], [700, 300])
+    assert latency.histogram.to_dict()["count"] == 10
+    summary = latency.summary()
+    assert "2 over the 5ms budget (discard)" in summary
+    assert latency.to_json()["timeouts"] == [300, 700]
+
+
+def test_unknown_timeout_action_is_rejected():
+    with pytest.raises(ValueError):
+        LatencyBudget(on_timeout="ignore")
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from replay import MarketReplay
+
+ROUND_3 = "round_3/round-3-island-data-bottle/"
+PRICES = ROUND_3 + "prices_round_3_day_2.csv"
+TRADES = ROUND_3 + "trades_round_3_day_2_nn.csv"
+
+
+def test_ticks_hold_the_rows_of_their_timestamp():
+    market = MarketReplay.from_csv(PRICES, TRADES)
+    prices = pd.read_csv(PRICES, sep=";").fillna(0)
+    trades = pd.read_csv(TRADES, sep=";")
+    assert len(market) == prices["timestamp"].nunique() == 10000
+    for timestamp in (0, 100, 500000, 999900):
+        expected = prices[prices["timestamp"] == timestamp]
+        quotes = [(market.products[product], bids[0], bid_volumes[0], asks[0], ask_volumes[0])
+                  for product, bids, bid_volumes, asks, ask_volumes in market.quotes(timestamp)]
+        assert quotes == [tuple(row) for row in expected[["product", "bid_price_1", "bid_volume_1",
+                                                           "ask_price_1", "ask_volume_1"]].itertuples(index=False)]
+        expected = trades[trades["timestamp"] == timestamp]
+        assert [(market.products[product], price, quantity) for product, price, quantity in market.trades(timestamp)] \
+            == [tuple(row) for row in expected[["symbol", "price", "quantity"]].itertuples(index=False)]
+
+
+def test_unknown_timestamp_is_an_empty_tick():
+    market = MarketReplay.from_csv(PRICES, TRADES)
+    assert list(market.quotes(50)) == [] and list(market.trades(50)) == []
+    assert list(market.quotes(10 ** 9)) == []
+
+
+def test_cached_and_parsed_replays_are_identical():
+    cached = MarketReplay.from_csv(PRICES, TRADES, cache=True)
+    parsed = MarketReplay.from_csv(PRICES, TRADES, cache=False)
+    assert cached.products == parsed.products
+    for field in ("timestamps", "quote_offsets", "bid_prices", "ask_volumes", "trade_offsets", "trade_prices"):
+        np.testing.assert_array_equal(getattr(cached, field), getattr(parsed, field))
@@ -0,0 +1,83 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+import pytest
+import statecodec
+from rolling import EWMA, LagVector, RollingMean, RollingVar, ZScore
+
+PRICES = "round_1/round-1-island-data-bottle/prices_round_1_day_0.csv"
+WINDOW = 20
+
+
+def starfruit_mid() -> pd.Series:
+    prices = pd.read_csv(PRICES, sep=";")
+    return prices[prices["product"] == "STARFRUIT"]["mid_price"].reset_index(drop=True)
+
+
+def run(statistic, series: pd.Series) -> np.ndarray:
+    return np.array([statistic.update(value) for value in series])
+
+
+def test_lag_vector_wraps_around_like_a_deque():
+    lags = LagVector(5)
+    expected = deque(maxlen=5)
+    for value in range(23):
+        dropped = lags.append(value)
+        assert dropped == (expected[0] if len(expected) == 5 else None)
+        expected.append(value)
+        assert list(lags) == list(expected) and lags.last == lags[-1] == expected[-1] and lags[0] == expected[0]
+    assert lags.dot([1, 10, 100, 1000, 10000], 0.5) == 0.5 + sum(value * 10 ** i for i, value in enumerate(expected))
+
+
+def test_rolling_mean_matches_pandas():
+    series = starfruit_mid()
+    expected = series.rolling(WINDOW, min_periods=1).mean()
+    np.testing.assert_allclose(run(RollingMean(WINDOW), series), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize("ddof", [0, 1])
+def test_rolling_var_matches_pandas(ddof):
+    series = starfruit_mid()
+    expected = series.rolling(WINDOW, min_periods=ddof + 1).var(ddof=ddof).fillna(0.0)
+    np.testing.assert_allclose(run(RollingVar(WINDOW, ddof=ddof), series), expected, rtol=1e-8, atol=1e-9)
+
+
+def test_constant_window_has_exactly_zero_variance():
+    # A varying day then a flat stretch longer than the window: the sliding
+    # sums must not leave a residue that reads as a tiny variance
+    series = pd.concat([starfruit_mid()[:3000], pd.Series([5043.5] * (WINDOW + 5))], ignore_index=True)
+    var = RollingVar(WINDOW)
+    zscore = ZScore(WINDOW)
+    variances = run(var, series)
+    run(zscore, series)
+    assert variances[-1] == 0.0 and var.mean == 5043.5
+    assert zscore.value == 0.0
+    assert series.rolling(WINDOW).var(ddof=0).iloc[-1] == 0.0
+    # The first values of a flat window still count as a constant series
+    assert run(RollingVar(WINDOW), pd.Series([0.1] * 50)).max() == 0.0
+
+
+def test_ewma_matches_pandas():
+    series = starfruit_mid()
+    expected = series.ewm(span=10, adjust=False).mean()
+    np.testing.assert_allclose(run(EWMA(span=10), series), expected, rtol=1e-12)
+    with pytest.raises(ValueError):
+        EWMA()
+
+
+def test_zscore_matches_pandas():
+    series = starfruit_mid()
+    rolling = series.rolling(WINDOW, min_periods=1)
+    std = rolling.std(ddof=0)
+    expected = ((series - rolling.mean()) / std).where(std > 1e-9, 0.0)
+    np.testing.assert_allclose(run(ZScore(WINDOW), series), expected, rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("make", [lambda: RollingMean(WINDOW), lambda: RollingVar(WINDOW, ddof=1),
+                                  lambda: ZScore(WINDOW), lambda: EWMA(alpha=0.3)])
+def test_restored_statistic_continues_bit_for_bit(make):
+    series = starfruit_mid()
+    statistic = make()
+    run(statistic, series[:WINDOW + 7])
+    restored = type(statistic).from_state(statecodec.decode(statecodec.encode(statistic.to_state())))
+    assert list(run(restored, series[WINDOW + 7:500])) == list(run(statistic, series[WINDOW + 7:500]))
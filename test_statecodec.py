@@ -0,0 +1,75 @@
+import io
+import contextlib
+from collections import deque
+import numpy as np
+import statecodec
+from backtester import MatchingEngine
+from logger import logger, OFF
+from replay import MarketReplay
+from round_1 import round1
+
+logger.configure(level=OFF)
+
+ROUND_1 = "round_1/round-1-island-data-bottle/"
+
+
+def round_trip(value):
+    return statecodec.decode(statecodec.encode(value))
+
+
+def test_nested_containers_round_trip():
+    value = {
+        "prices": {"AMETHYSTS": [10000, 9998, -3], "STARFRUIT": {"last": 5051.5, "window": []}},
+        "returns": [-1.5, 2.5, 0.1],
+        "position": -20,
+        "big": [-(1 << 40), 1 << 62],
+        "flags": [True, False, None],
+        "mixed": [1, 2.0, "three", [], {}],
+        "name": "",
+        "empty": {},
+    }
+    assert round_trip(value) == value
+
+
+def test_floats_round_trip_exactly():
+    for value in (0.0, -0.0, 1.5, -4.0, 0.1, 1e300, -1e-300, 5051.123456789, float("inf")):
+        decoded = round_trip(value)
+        assert decoded == value and type(decoded) is float
+    values = [0.1, 1 / 3, -2.0]
+    assert round_trip(values) == values
+
+
+def test_ints_of_every_width_round_trip():
+    for values in ([-128, 127], [-129, 32767], [-(1 << 31), 1], [-(1 << 63), (1 << 63) - 1], [1 << 70, 0]):
+        assert round_trip(values) == values
+    assert round_trip(-1) == -1 and round_trip(0) == 0
+
+
+def test_deques_keep_their_maxlen_and_tuples_become_lists():
+    window = round_trip(deque([1.5, 2.5], maxlen=4))
+    assert window == deque([1.5, 2.5]) and window.maxlen == 4
+    assert round_trip(deque()).maxlen is None
+    assert round_trip((1, 2)) == [1, 2]
+
+
+def test_numpy_scalars_decode_as_builtins():
+    decoded = round_trip([np.int64(-5), np.float64(2.5)])
+    assert decoded == [-5, 2.5] and [type(value) for value in decoded] == [int, float]
+
+
+def run_round1(stateless: bool):
+    market = MarketReplay.from_csv(ROUND_1 + "prices_round_1_day_0.csv", ROUND_1 + "trades_round_1_day_0_nn.csv")
+    trader = round1.Trader()
+    engine = MatchingEngine(trader, market, 500, stateless=stateless)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(500):
+            profit = engine.run_iteration()
+    return engine, profit
+
+
+def test_stateful_runs_skip_encoding_and_match_stateless_runs():
+    stateful, stateful_profit = run_round1(stateless=False)
+    stateless, stateless_profit = run_round1(stateless=True)
+    assert stateful_profit == stateless_profit
+    assert stateful.state.traderData == ""
+    assert stateless.state.traderData
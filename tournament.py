@@ -0,0 +1,120 @@
+from time import perf_counter_ns
+from typing import Dict, List, Optional, Tuple
+import contextlib
+import io
+import numpy as np
+from backtester import MatchingEngine, DAY_LENGTH
+from benchmark import TimedTrader
+from profiling import TIME_BUDGET_NS
+from replay import MarketReplay, SyntheticBook
+from report import format_table
+
+# Several traders on the same day in one pass. The day is parsed once and
+# every engine advances off the same MarketReplay; SharedTicks goes further
+# and turns a tick's quote and trade rows into Python lists once for all
+# engines instead of once per engine. Engines are independent otherwise, so
+# each trader gets exactly the PnL a separate backtest() would give it.
+
+
+class SharedTicks:
+    # Stands in for a MarketReplay in MatchingEngine. The rows of the
+    # current timestamp are built on first use and reused by every engine.
+    def __init__(self, market: MarketReplay):
+        self.market = market
+        self.name = market.name
+        self.products = market.products
+        self.observations = market.observations
+        self.timestamp = None
+        self.quote_rows: List[Tuple] = []
+        self.trade_rows: List[Tuple] = []
+
+    def __len__(self) -> int:
+        return len(self.market)
+
+    def advance(self, timestamp: int):
+        if timestamp != self.timestamp:
+            self.timestamp = timestamp
+            self.quote_rows = list(self.market.quotes(timestamp))
+            self.trade_rows = list(self.market.trades(timestamp))
+
+    def quotes(self, timestamp: int):
+        self.advance(timestamp)
+        return self.quote_rows
+
+    def trades(self, timestamp: int):
+        self.advance(timestamp)
+        return self.trade_rows
+
+
+def tournament(traders: Dict[str, object], market: MarketReplay, iterations: Optional[int] = None,
+               budget_ns: int = TIME_BUDGET_NS, **engine_kwargs) -> List[Dict]:
+    # traders maps a display name to a Trader instance. Every Trader.run is
+    # timed; calls over budget_ns are counted but their results kept, so
+    # PnL does not depend on machine speed.
+    iterations = iterations or min(len(market), DAY_LENGTH // 100)
+    ticks = SharedTicks(market)
+    entries = []
+    for name, trader in traders.items():
+        samples = []
+        engine = MatchingEngine(TimedTrader(trader, samples), ticks, iterations, **engine_kwargs)
+        entries.append({"name": name, "engine": engine, "samples": samples, "ns": 0, "pnl": None})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(iterations):
+            for entry in entries:
+                start = perf_counter_ns()
+                profit = entry["engine"].run_iteration()
+                entry["ns"] += perf_counter_ns() - start
+                if profit is not None:
+                    entry["pnl"] = profit
+
+    results = []
+    for entry in entries:
+        samples = np.array(entry["samples"], dtype=np.int64)
+        results.append({
+            "name": entry["name"],
+            "pnl": entry["pnl"],
+            "total": sum(entry["pnl"].values()),
+            "seconds": entry["ns"] / 1e9,
+            "run_p50_us": float(np.percentile(samples, 50)) / 1e3,
+            "run_p99_us": float(np.percentile(samples, 99)) / 1e3,
+            "run_max_us": int(samples.max()) / 1e3,
+            "timeouts": int((samples > budget_ns).sum()),
+        })
+    results.sort(key=lambda result: result["total"], reverse=True)
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    if not results:
+        return ""
+    products = sorted({product for result in results for product, pnl in result["pnl"].items() if pnl})
+    header = ["trader"] + products + ["total", "engine s", "run p50 us", "run p99 us", "run max us", "timeouts"]
+    rows = [[result["name"]] + [f"{result['pnl'].get(product, 0):g}" for product in products]
+            + [f"{result['total']:g}", f"{result['seconds']:.2f}", f"{result['run_p50_us']:.1f}",
+               f"{result['run_p99_us']:.1f}", f"{result['run_max_us']:.1f}", str(result["timeouts"])]
+            for result in results]
+    return format_table(header, rows)
+
+
+if __name__ == "__main__":
+    from logger import logger, OFF
+    from round_1 import round1, round1_arima, round1_dynamic
+    from round_3 import round3
+    logger.configure(level=OFF)
+    # round3 trades every product, so the day combines rounds 1 and 3 with
+    # the round 2 observations
+    market = MarketReplay.from_csv(
+        ["round_1/round-1-island-data-bottle/prices_round_1_day_0.csv",
+         "round_3/round-3-island-data-bottle/prices_round_3_day_2.csv"],
+        ["round_1/round-1-island-data-bottle/trades_round_1_day_0_nn.csv",
+         "round_3/round-3-island-data-bottle/trades_round_3_day_2_nn.csv"],
+        observations_file="round_2/round-2-island-data-bottle/prices_round_2_day_1.csv",
+        synthetic_book=SyntheticBook(spread=4, volume=10))
+    traders = {
+        "round1": round1.Trader(),
+        "round1_arima": round1_arima.Trader(),
+        "round1_dynamic": round1_dynamic.Trader(),
+        "round3": round3.Trader(),
+    }
+    print(format_results(tournament(traders, market)))